@@ -11,6 +11,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 import os
+import tempfile
 
 # Canales válidos
 VALID_CHANNELS = ['whatsapp']
@@ -23,13 +24,131 @@ COLLECTION_USERS = os.getenv('COLLECTION_USERS', 'users')
 COLLECTION_WHATSAPP_DEVICES = os.getenv('COLLECTION_WHATSAPP_DEVICES', 'whatsapp_devices')
 COLLECTION_WHATSAPP_MESSAGES = os.getenv('COLLECTION_WHATSAPP_MESSAGES', 'whatsapp_messages')
 COLLECTION_WHATSAPP_MEDIA = os.getenv("COLLECTION_WHATSAPP_MEDIA", "whatsapp_media")
+COLLECTION_WHATSAPP_RAW_MESSAGES = os.getenv('COLLECTION_WHATSAPP_RAW_MESSAGES', 'whatsapp_raw_messages')
+COLLECTION_SEARCH_INDEX = os.getenv('COLLECTION_SEARCH_INDEX', 'search_index')
+COLLECTION_TRANSACTIONS = os.getenv('COLLECTION_TRANSACTIONS', 'transactions')
+COLLECTION_PUBSUB_ATTEMPTS = os.getenv('COLLECTION_PUBSUB_ATTEMPTS', 'pubsub_attempts')
+COLLECTION_PUBSUB_DEAD_LETTERS = os.getenv('COLLECTION_PUBSUB_DEAD_LETTERS', 'pubsub_dead_letters')
+
+# Backend de persistencia de documentos: 'firestore' o 'sqlite' (un archivo en modo WAL para
+# despliegues de un solo nodo con mucho volumen o pruebas de rendimiento sin Firestore). Los
+# procesos de gunicorn de la misma máquina comparten el archivo; no sirve entre varias máquinas
+PERSISTENCE_BACKEND : str = os.getenv('PERSISTENCE_BACKEND', 'firestore')
+SQLITE_PATH : str = os.getenv('SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'fin_app.sqlite3'))
+# Escrituras por transacción en las escrituras masivas (bulk_writer)
+SQLITE_BATCH_SIZE : int = int(os.getenv('SQLITE_BATCH_SIZE', '500'))
+# PRAGMA synchronous: NORMAL (con WAL, durable ante caídas del proceso) o FULL (también ante cortes de energía)
+SQLITE_SYNCHRONOUS : str = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS : int = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+# Número de fragmentos del índice de búsqueda por usuario
+SEARCH_INDEX_SHARDS = int(os.getenv('SEARCH_INDEX_SHARDS', '16'))
 
 WHATSAPP_ACCESS_TOKEN = os.environ.get('WHATSAPP_ACCESS_TOKEN')
 VERIFY_TOKEN = os.environ.get('VERIFY_TOKEN')
+# Token Bearer para las rutas de consulta (historial, búsqueda); sin él quedan deshabilitadas
+API_ACCESS_TOKEN = os.environ.get('API_ACCESS_TOKEN')
 
 GOOGLE_CLOUD_PROJECT : str = os.getenv('GOOGLE_CLOUD_PROJECT', 'default_project_id')
 CLOUD_STORAGE_BUCKET : str = os.getenv('CLOUD_STORAGE_BUCKET', 'default_gcs_bucket')
 PUBSUB_TOPIC : str = os.getenv('PUBSUB_TOPIC', 'default_pubsub_topic')
+# Tema del carril de archivos; vacío usa PUBSUB_TOPIC (separar con suscripciones filtradas por el atributo "lane")
+PUBSUB_MEDIA_TOPIC : str = os.getenv('PUBSUB_MEDIA_TOPIC', '') or PUBSUB_TOPIC
+
+# Archivo en frío de los payloads crudos de WhatsApp
+RAW_ARCHIVE_PREFIX : str = os.getenv('RAW_ARCHIVE_PREFIX', 'raw_archive/whatsapp_messages')
+RAW_ARCHIVE_LINES_PER_BLOCK : int = int(os.getenv('RAW_ARCHIVE_LINES_PER_BLOCK', '64'))
+
+# Esquema de claves de los archivos multimedia en GCS: 'hashed' antepone a la ruta un
+# prefijo corto derivado del media_id para repartir las escrituras; 'dated' es el esquema
+# original whatsapp_media/{tipo}/{AAAA/MM/DD}/{archivo}
+MEDIA_KEY_LAYOUT : str = os.getenv('MEDIA_KEY_LAYOUT', 'hashed')
+MEDIA_KEY_HASH_CHARS : int = int(os.getenv('MEDIA_KEY_HASH_CHARS', '4'))
+
+# URLs firmadas (V4) para descargar medios directamente desde GCS. La firma es local si
+# hay una clave de cuenta de servicio; si no, se firma con la API de IAM
+MEDIA_SIGNING_KEY_FILE : str = os.getenv('MEDIA_SIGNING_KEY_FILE', '')
+SIGNED_URL_TTL_SECONDS : int = int(os.getenv('SIGNED_URL_TTL_SECONDS', '3600'))
+SIGNED_URL_CACHE_SIZE : int = int(os.getenv('SIGNED_URL_CACHE_SIZE', '4096'))
+
+# Hilos compartidos para ejecutar en paralelo las etapas del procesamiento de medios
+TASK_GRAPH_WORKERS : int = int(os.getenv('TASK_GRAPH_WORKERS', '16'))
+# Análisis de etiquetas de Vision sobre las imágenes (una llamada adicional por imagen)
+MEDIA_LABEL_ANALYSIS : bool = os.getenv('MEDIA_LABEL_ANALYSIS', 'false').lower() in ('1', 'true', 'yes')
+
+# Presupuesto de tiempo por solicitud, repartido como timeout entre las llamadas salientes.
+# Para Pub/Sub se usa el plazo de confirmación de la suscripción menos un margen
+WEBHOOK_DEADLINE_SECONDS : float = float(os.getenv('WEBHOOK_DEADLINE_SECONDS', '15'))
+PUBSUB_ACK_DEADLINE_SECONDS : float = float(os.getenv('PUBSUB_ACK_DEADLINE_SECONDS', '60'))
+DEADLINE_SAFETY_MARGIN_SECONDS : float = float(os.getenv('DEADLINE_SAFETY_MARGIN_SECONDS', '5'))
+
+# Descargas desde la CDN de WhatsApp: se lanza una segunda petición (hedge) si la primera
+# tarda más que este percentil de las latencias recientes, y una transferencia cortada se
+# reanuda con Range hasta MEDIA_DOWNLOAD_MAX_RESUMES veces
+MEDIA_HEDGE_PERCENTILE : float = float(os.getenv('MEDIA_HEDGE_PERCENTILE', '0.95'))
+MEDIA_HEDGE_DEFAULT_DELAY_SECONDS : float = float(os.getenv('MEDIA_HEDGE_DEFAULT_DELAY_SECONDS', '2'))
+MEDIA_DOWNLOAD_MAX_RESUMES : int = int(os.getenv('MEDIA_DOWNLOAD_MAX_RESUMES', '3'))
+
+# Servidor de producción (gunicorn, ver gunicorn.conf.py): procesos con hilos para manejadores
+# que pasan casi todo el tiempo esperando E/S. Los límites de los carriles y de las dependencias
+# son por proceso. El apagado ordenado espera las solicitudes en curso hasta SERVER_GRACEFUL_TIMEOUT
+SERVER_WORKERS : int = int(os.getenv('SERVER_WORKERS', str(os.cpu_count() or 1)))
+SERVER_THREADS : int = int(os.getenv('SERVER_THREADS', '16'))
+SERVER_WORKER_CLASS : str = os.getenv('SERVER_WORKER_CLASS', 'gthread')
+SERVER_TIMEOUT : int = int(os.getenv('SERVER_TIMEOUT', '120'))
+SERVER_GRACEFUL_TIMEOUT : int = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', str(int(PUBSUB_ACK_DEADLINE_SECONDS))))
+SERVER_KEEPALIVE : int = int(os.getenv('SERVER_KEEPALIVE', '5'))
+# Reciclar cada proceso tras este número de solicitudes (0 nunca)
+SERVER_MAX_REQUESTS : int = int(os.getenv('SERVER_MAX_REQUESTS', '0'))
+
+# Intentos de entrega de un mensaje de Pub/Sub antes de pasarlo a la colección de mensajes muertos
+PUBSUB_MAX_DELIVERY_ATTEMPTS : int = int(os.getenv('PUBSUB_MAX_DELIVERY_ATTEMPTS', '5'))
+# Vigencia de los contadores de intentos (campo expires_at, con política TTL de Firestore);
+# por defecto la retención máxima de mensajes de Pub/Sub
+PUBSUB_ATTEMPTS_TTL_HOURS : float = float(os.getenv('PUBSUB_ATTEMPTS_TTL_HOURS', '168'))
+
+# Carriles de procesamiento de Pub/Sub: concurrencia y presupuesto de tiempo de cada uno
+LANE_INTERACTIVE_CONCURRENCY : int = int(os.getenv('LANE_INTERACTIVE_CONCURRENCY', '32'))
+LANE_INTERACTIVE_DEADLINE_SECONDS : float = float(os.getenv('LANE_INTERACTIVE_DEADLINE_SECONDS', '10'))
+LANE_MEDIA_CONCURRENCY : int = int(os.getenv('LANE_MEDIA_CONCURRENCY', '4'))
+LANE_MEDIA_DEADLINE_SECONDS : float = float(os.getenv('LANE_MEDIA_DEADLINE_SECONDS', str(PUBSUB_ACK_DEADLINE_SECONDS - DEADLINE_SAFETY_MARGIN_SECONDS)))
+
+# Agrupación de ráfagas de archivos por conversación: los archivos que llegan con menos de
+# MEDIA_BATCH_WINDOW_SECONDS entre sí se analizan juntos y reciben una sola respuesta (0 la
+# desactiva). El grupo se cierra como mucho MEDIA_BATCH_MAX_WAIT_SECONDS después del primero
+COLLECTION_MEDIA_BATCHES : str = os.getenv('COLLECTION_MEDIA_BATCHES', 'media_batches')
+MEDIA_BATCH_WINDOW_SECONDS : float = float(os.getenv('MEDIA_BATCH_WINDOW_SECONDS', '4'))
+MEDIA_BATCH_MAX_WAIT_SECONDS : float = float(os.getenv('MEDIA_BATCH_MAX_WAIT_SECONDS', '12'))
+# Vision acepta hasta 16 imágenes por solicitud
+MEDIA_BATCH_MAX_ITEMS : int = int(os.getenv('MEDIA_BATCH_MAX_ITEMS', '10'))
+# Líderes que pueden esperar su grupo sin ocupar un hilo del carril de archivos (por proceso);
+# por encima de este número el líder espera con su hilo ocupado
+MEDIA_BATCH_MAX_WAITING : int = int(os.getenv('MEDIA_BATCH_MAX_WAITING', '8'))
+
+# Circuit breakers de las dependencias externas (WhatsApp, Vision, Storage, Pub/Sub)
+CIRCUIT_BREAKER_COOLDOWN_SECONDS : float = float(os.getenv('CIRCUIT_BREAKER_COOLDOWN_SECONDS', '30'))
+CIRCUIT_BREAKER_FAILURE_RATIO : float = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATIO', '0.5'))
+CIRCUIT_BREAKER_MIN_CALLS : int = int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', '10'))
+
+# Backend de almacenamiento de archivos: 'gcs' (Cloud Storage) o 'local' (sistema de archivos,
+# para despliegues on-prem y pruebas de rendimiento sin GCS). Con 'local' los buckets son
+# subdirectorios de LOCAL_STORAGE_DIR y las URLs firmadas se sirven desde /media de esta API
+STORAGE_BACKEND : str = os.getenv('STORAGE_BACKEND', 'gcs')
+LOCAL_STORAGE_DIR : str = os.getenv('LOCAL_STORAGE_DIR', os.path.join(tempfile.gettempdir(), 'fin_app_storage'))
+# Niveles de subdirectorios (2 caracteres hex del hash de la ruta cada uno) para repartir los archivos
+LOCAL_STORAGE_SHARD_DEPTH : int = int(os.getenv('LOCAL_STORAGE_SHARD_DEPTH', '2'))
+LOCAL_STORAGE_FSYNC : bool = os.getenv('LOCAL_STORAGE_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+LOCAL_STORAGE_BASE_URL : str = os.getenv('LOCAL_STORAGE_BASE_URL', f'http://localhost:{PORT}')
+# Clave HMAC de las URLs firmadas del backend local; sin ella no se generan URLs
+LOCAL_STORAGE_SIGNING_KEY : str = os.getenv('LOCAL_STORAGE_SIGNING_KEY', '')
+
+# Caché local en disco de los archivos multimedia, compartida por los workers (0 bytes la desactiva)
+MEDIA_CACHE_DIR : str = os.getenv('MEDIA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fin_app_media_cache'))
+MEDIA_CACHE_MAX_BYTES : int = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+MEDIA_CACHE_MAX_OBJECT_BYTES : int = int(os.getenv('MEDIA_CACHE_MAX_OBJECT_BYTES', str(32 * 1024 * 1024)))
+
+# Configuración regional por defecto para interpretar montos y fechas de recibos
+DEFAULT_LOCALE : str = os.getenv('DEFAULT_LOCALE', 'es_CO')
 
 # Configuración de paginación
 DEFAULT_PAGE_SIZE = 20
@@ -40,11 +159,30 @@ logger.info(f"Puerto: {PORT}")
 logger.info(f"Canales válidos: {VALID_CHANNELS}")
 logger.info(f"Token de acceso de WhatsApp: {WHATSAPP_ACCESS_TOKEN}")
 logger.info(f"Token de verificación: {VERIFY_TOKEN}")
+logger.info(f"Backend de persistencia: {PERSISTENCE_BACKEND}" + (f" ({SQLITE_PATH}, synchronous={SQLITE_SYNCHRONOUS})" if PERSISTENCE_BACKEND == 'sqlite' else ""))
 logger.info(f"Nombre de la colección de usuarios: {COLLECTION_USERS}")
 logger.info(f"Nombre de la colección de dispositivos de WhatsApp: {COLLECTION_WHATSAPP_DEVICES}")
 logger.info(f"Nombre de la colección de mensajes de WhatsApp: {COLLECTION_WHATSAPP_MESSAGES}")
+logger.info(f"Nombre de la colección de mensajes crudos pendientes de archivar: {COLLECTION_WHATSAPP_RAW_MESSAGES}")
+logger.info(f"Prefijo del archivo en frío: {RAW_ARCHIVE_PREFIX}")
+logger.info(f"Nombre de la colección de transacciones: {COLLECTION_TRANSACTIONS}")
+logger.info(f"Nombre de la colección de mensajes muertos de Pub/Sub: {COLLECTION_PUBSUB_DEAD_LETTERS} (tras {PUBSUB_MAX_DELIVERY_ATTEMPTS} intentos, contadores vigentes {PUBSUB_ATTEMPTS_TTL_HOURS} h)")
+logger.info(f"Nombre de la colección del índice de búsqueda: {COLLECTION_SEARCH_INDEX} ({SEARCH_INDEX_SHARDS} fragmentos)")
 logger.info(f"Tamaño de página por defecto: {DEFAULT_PAGE_SIZE}")
 logger.info(f"Tamaño máximo de página: {MAX_PAGE_SIZE}")
+logger.info(f"Configuración regional por defecto: {DEFAULT_LOCALE}")
+logger.info(f"Rutas de consulta habilitadas: {bool(API_ACCESS_TOKEN)}")
+logger.info(f"Esquema de claves de medios en GCS: {MEDIA_KEY_LAYOUT}")
+logger.info(f"Vigencia de las URLs firmadas: {SIGNED_URL_TTL_SECONDS} s (firma local: {bool(MEDIA_SIGNING_KEY_FILE)})")
+logger.info(f"Hilos para etapas de procesamiento: {TASK_GRAPH_WORKERS} (etiquetas de Vision: {MEDIA_LABEL_ANALYSIS})")
+logger.info(f"Presupuesto por solicitud: webhook {WEBHOOK_DEADLINE_SECONDS}s, Pub/Sub {PUBSUB_ACK_DEADLINE_SECONDS - DEADLINE_SAFETY_MARGIN_SECONDS}s")
+logger.info(f"Descargas de la CDN de WhatsApp: hedge en p{MEDIA_HEDGE_PERCENTILE * 100:.0f}, hasta {MEDIA_DOWNLOAD_MAX_RESUMES} reanudaciones")
+logger.info(f"Servidor: {SERVER_WORKERS} procesos {SERVER_WORKER_CLASS} x {SERVER_THREADS} hilos, apagado ordenado de {SERVER_GRACEFUL_TIMEOUT}s")
+logger.info(f"Carriles: interactivo {LANE_INTERACTIVE_CONCURRENCY} hilos/{LANE_INTERACTIVE_DEADLINE_SECONDS}s, archivos {LANE_MEDIA_CONCURRENCY} hilos/{LANE_MEDIA_DEADLINE_SECONDS}s")
+logger.info(f"Agrupación de archivos: ventana de {MEDIA_BATCH_WINDOW_SECONDS}s, máximo {MEDIA_BATCH_MAX_ITEMS} archivos o {MEDIA_BATCH_MAX_WAIT_SECONDS}s, {MEDIA_BATCH_MAX_WAITING} líderes en espera ({COLLECTION_MEDIA_BATCHES})")
+logger.info(f"Circuit breakers: {CIRCUIT_BREAKER_FAILURE_RATIO:.0%} de fallos en {CIRCUIT_BREAKER_MIN_CALLS}+ llamadas, enfriamiento de {CIRCUIT_BREAKER_COOLDOWN_SECONDS}s")
+logger.info(f"Backend de almacenamiento: {STORAGE_BACKEND}" + (f" ({LOCAL_STORAGE_DIR}, {LOCAL_STORAGE_SHARD_DEPTH} niveles, fsync: {LOCAL_STORAGE_FSYNC})" if STORAGE_BACKEND == 'local' else ""))
+logger.info(f"Caché local de medios: {MEDIA_CACHE_DIR} ({MEDIA_CACHE_MAX_BYTES} bytes)")
 logger.info(f"Proyecto de Google Cloud: {GOOGLE_CLOUD_PROJECT}")
-logger.info(f"Tema de Pub/Sub: {PUBSUB_TOPIC}")
+logger.info(f"Tema de Pub/Sub: {PUBSUB_TOPIC} (archivos: {PUBSUB_MEDIA_TOPIC})")
 logger.info("Configuración de paginación cargada correctamente.")
\ No newline at end of file
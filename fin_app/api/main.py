@@ -3,7 +3,11 @@
 from flask import Flask, jsonify
 
 from api.config import logger, HOST, PORT
-from api.routes import whatsapp_webhook, pubsub_chatbot
+from api.routes import whatsapp_webhook, pubsub_chatbot, history, search, media_files
+from api.services.dependency_guard import dependency_metrics
+from api.services.whatsapp_service import media_download_metrics
+from api.services.lanes import lane_metrics
+from api.services import task_graph, whatsapp_service, pubsub_service
 
 # Crear la aplicación Flask
 app = Flask(__name__)
@@ -11,6 +15,10 @@ app = Flask(__name__)
 # Registrar blueprints
 app.register_blueprint(whatsapp_webhook, url_prefix='/chatbot/whatsapp')
 app.register_blueprint(pubsub_chatbot, url_prefix='/chatbot/pubsub')
+app.register_blueprint(history, url_prefix='/history')
+app.register_blueprint(search, url_prefix='/search')
+# Descargas firmadas del backend de almacenamiento local (con GCS responde 404)
+app.register_blueprint(media_files, url_prefix='/media')
 
 # Ruta raíz
 @app.route('/', methods=['GET'])
@@ -23,6 +31,21 @@ def home():
         "version": "1.0.0"
     }), 200
 
+# Estado de las dependencias externas (límite de concurrencia, latencia, circuito)
+@app.route('/metrics/dependencies', methods=['GET'])
+def dependencies():
+    return jsonify({"status": "success", "data": dependency_metrics()}), 200
+
+# Descargas de medios de WhatsApp (hedges lanzados y ganados, reanudaciones)
+@app.route('/metrics/media-downloads', methods=['GET'])
+def media_downloads():
+    return jsonify({"status": "success", "data": media_download_metrics()}), 200
+
+# Carriles de Pub/Sub (hilos ocupados, mensajes aceptados y rechazados)
+@app.route('/metrics/lanes', methods=['GET'])
+def lanes():
+    return jsonify({"status": "success", "data": lane_metrics()}), 200
+
 # Manejador de errores 404
 @app.errorhandler(404)
 def not_found(error):
@@ -40,6 +63,17 @@ def server_error(error):
         "status_code": 500
     }), 500
 
+def shutdown() -> None:
+    """
+    Libera los recursos del proceso después de drenar las solicitudes en curso: espera a
+    las etapas de procesamiento que sigan corriendo y envía las publicaciones pendientes.
+    """
+    logger.info("Cerrando el proceso: esperando etapas y publicaciones pendientes")
+    task_graph.executor.shutdown(wait=True)
+    whatsapp_service.hedge_executor.shutdown(wait=False, cancel_futures=True)
+    pubsub_service.stop_publisher()
+
+# Desarrollo local; en producción: gunicorn -c gunicorn.conf.py api.main:app
 if __name__ == '__main__':
     logger.info(f"Iniciando servidor en {HOST}:{PORT}")
     app.run(host=HOST, port=PORT, debug=False)
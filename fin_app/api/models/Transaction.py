@@ -0,0 +1,125 @@
+# api.models.Transaction.py
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Any
+from google.cloud.firestore_v1.bulk_writer import BulkWriter
+from api.services.firestore_service import FirestoreService
+from api.config import COLLECTION_TRANSACTIONS
+
+class Transaction:
+    def __init__(self, media_id: str = None, user_id: Optional[str] = None,
+                 phone_number: Optional[str] = None, total: Optional[float] = None,
+                 subtotal: Optional[float] = None, tax: Optional[float] = None,
+                 currency: Optional[str] = None, date: Optional[str] = None,
+                 merchant: Optional[str] = None, tax_ids: Optional[List[Dict[str, str]]] = None,
+                 amounts: Optional[List[float]] = None, confidence: float = 0.0,
+                 created_at: datetime = None):
+        """
+        Inicializa un registro de transacción extraído de un recibo o extracto.
+
+        Args:
+            media_id: ID del WhatsAppMedia del que se extrajo (también es el ID del documento)
+            user_id: ID del usuario asociado
+            phone_number: Número de teléfono que envió el archivo
+            total: Monto total detectado
+            subtotal: Subtotal detectado
+            tax: Impuesto (IVA) detectado
+            currency: Código ISO de la moneda
+            date: Fecha de la transacción en formato ISO (YYYY-MM-DD)
+            merchant: Nombre del comercio
+            tax_ids: Identificaciones tributarias encontradas (``{'type': 'NIT', 'value': ...}``)
+            amounts: Montos encontrados en el documento, de mayor a menor
+            confidence: Confianza heurística de la extracción (0 a 1)
+            created_at: Fecha y hora de creación
+        """
+        self.media_id = media_id
+        self.user_id = user_id
+        self.phone_number = phone_number
+        self.total = total
+        self.subtotal = subtotal
+        self.tax = tax
+        self.currency = currency
+        self.date = date
+        self.merchant = merchant
+        self.tax_ids = tax_ids or []
+        self.amounts = amounts or []
+        self.confidence = confidence
+        self.created_at = created_at or datetime.now()
+
+    @classmethod
+    def from_extraction(cls, media_id: str, user_id: Optional[str], phone_number: Optional[str], fields: Dict[str, Any]) -> 'Transaction':
+        """Crear una transacción a partir del resultado de ``FinancialExtractionService.extract``."""
+        return cls(
+            media_id=media_id,
+            user_id=user_id,
+            phone_number=phone_number,
+            total=fields.get('total'),
+            subtotal=fields.get('subtotal'),
+            tax=fields.get('tax'),
+            currency=fields.get('currency'),
+            date=fields.get('date'),
+            merchant=fields.get('merchant'),
+            tax_ids=fields.get('tax_ids'),
+            amounts=fields.get('amounts'),
+            confidence=fields.get('confidence', 0.0)
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Transaction':
+        """Crear un objeto Transaction desde un diccionario."""
+        return cls(
+            media_id=data.get('media_id') or data.get('id'),
+            user_id=data.get('user_id'),
+            phone_number=data.get('phone_number'),
+            total=data.get('total'),
+            subtotal=data.get('subtotal'),
+            tax=data.get('tax'),
+            currency=data.get('currency'),
+            date=data.get('date'),
+            merchant=data.get('merchant'),
+            tax_ids=data.get('tax_ids'),
+            amounts=data.get('amounts'),
+            confidence=data.get('confidence', 0.0),
+            created_at=data.get('created_at')
+        )
+
+    def to_dict(self) -> Dict:
+        """Convertir el objeto a formato para guardar en Firestore."""
+        return {
+            'media_id': self.media_id,
+            'user_id': self.user_id,
+            'phone_number': self.phone_number,
+            'total': self.total,
+            'subtotal': self.subtotal,
+            'tax': self.tax,
+            'currency': self.currency,
+            'date': self.date,
+            'merchant': self.merchant,
+            'tax_ids': self.tax_ids,
+            'amounts': self.amounts,
+            'confidence': self.confidence,
+            'created_at': self.created_at
+        }
+
+    def has_data(self) -> bool:
+        """Indica si la extracción encontró algún dato financiero útil."""
+        return self.total is not None or bool(self.tax_ids) or self.date is not None
+
+    @classmethod
+    def get_by_media_id(cls, media_id: str) -> Optional['Transaction']:
+        """Obtener la transacción extraída de un archivo multimedia."""
+        data = FirestoreService.get_document(COLLECTION_TRANSACTIONS, media_id)
+        if data:
+            return cls.from_dict(data)
+        return None
+
+    @classmethod
+    def get_many(cls, media_ids: Iterable[str]) -> Dict[str, 'Transaction']:
+        """Obtener las transacciones de varios archivos en un solo RPC, indexadas por media_id."""
+        documents: Dict[str, Dict] = FirestoreService.get_many(COLLECTION_TRANSACTIONS, media_ids)
+        return {media_id: cls.from_dict(data) for media_id, data in documents.items()}
+
+    def save(self, writer: Optional[BulkWriter] = None) -> 'Transaction':
+        """Guardar o actualizar la transacción en Firestore (en lote si se indica un BulkWriter)."""
+        FirestoreService.set_document(COLLECTION_TRANSACTIONS, self.media_id, self.to_dict(), writer=writer)
+        return self
@@ -1,13 +1,16 @@
 # file: /api/models/User.py
 
 import datetime as dt
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional
+from google.cloud.firestore_v1.bulk_writer import BulkWriter
 from uuid import UUID, uuid4
 
 from api.services.firestore_service import FirestoreService
 from api.config import COLLECTION_USERS
 
 class User:
+    __slots__ = ('id', 'name', 'email', 'pin', 'created_at')
+
     def __init__(self, id: str = None, name: str = None, email: str = None, pin: str = None, created_at: dt.datetime = None):
         self.id = id
         self.name = name
@@ -17,14 +20,15 @@ class User:
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'User':
-        """Crear un objeto User desde un diccionario de Firestore."""
-        return cls(
-            id=data.get('id'),
-            name=data.get('name'),
-            email=data.get('email'),
-            pin=data.get('pin'),
-            created_at=data.get('createdAt')
-        )
+        """Crear un objeto User desde un diccionario de Firestore (sin pasar por ``__init__``)."""
+        get = data.get
+        user : User = cls.__new__(cls)
+        user.id = get('id')
+        user.name = get('name')
+        user.email = get('email')
+        user.pin = get('pin')
+        user.created_at = get('createdAt') or dt.datetime.now()
+        return user
     
     def to_dict(self) -> Dict:
         """Convertir el objeto a formato para guardar en Firestore."""
@@ -36,31 +40,37 @@ class User:
         }
     
     @classmethod
-    def get_by_id(cls, user_id: str) -> Optional['User']:
-        """Obtener un usuario por su ID."""
-        data : Dict = FirestoreService.get_document(COLLECTION_USERS, user_id)
+    def get_by_id(cls, user_id: str, fields: Optional[Iterable[str]] = None) -> Optional['User']:
+        """Obtener un usuario por su ID, opcionalmente solo con los campos indicados."""
+        data : Dict = FirestoreService.get_document(COLLECTION_USERS, user_id, fields=fields)
         if data:
             return cls.from_dict(data)
         return None
     
-    def save(self) -> 'User':
-        """Guardar o actualizar el usuario en Firestore."""
+    def save(self, writer: Optional[BulkWriter] = None) -> 'User':
+        """Guardar o actualizar el usuario en Firestore (en lote si se indica un BulkWriter)."""
         data = self.to_dict()
         
         if self.id:
-            # Actualizar usuario existente
-            updated_data = FirestoreService.update_document(COLLECTION_USERS, self.id, data)
+            # Actualizar usuario existente (sin releerlo: to_dict ya tiene el documento completo)
+            updated_data = FirestoreService.update_document(COLLECTION_USERS, self.id, data, read_back=False)
             if updated_data:
                 return self.from_dict(updated_data)
         else:
             # Crear nuevo usuario
             new_id : UUID = str(uuid4())
-            user_data : Dict = FirestoreService.create_document(COLLECTION_USERS, new_id, data)
+            FirestoreService.set_document(COLLECTION_USERS, new_id, data, writer=writer)
             self.id : UUID = new_id
             return self
         
         return self
     
+    def create(self) -> 'User':
+        """Crear el usuario con su ``id`` ya asignado (o uno nuevo) sin leerlo antes."""
+        self.id = self.id or str(uuid4())
+        FirestoreService.set_document(COLLECTION_USERS, self.id, self.to_dict())
+        return self
+
     def verify_pin(self, pin : str) -> bool:
         """Verificar si el PIN proporcionado coincide con el del usuario."""
         return self.pin == pin
\ No newline at end of file
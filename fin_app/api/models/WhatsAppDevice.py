@@ -1,7 +1,9 @@
 # file: /api/models/WhatsAppDevice.py
 
 from datetime import datetime
-from typing import Dict, Optional, Any
+from typing import Dict, Iterable, Optional, Any
+from google.cloud.firestore_v1.bulk_writer import BulkWriter
+from api.services.document_backends import DocumentConflictError
 from api.services.firestore_service import FirestoreService
 import json
 
@@ -17,6 +19,8 @@ class FlowState:
     GENERAL_INTERACTION = "GENERAL_INTERACTION"
 
 class WhatsAppDevice:
+    __slots__ = ('phone_number', 'user_id', 'last_active', 'flow_state', 'context', 'update_time')
+
     def __init__(self, phone_number: str = None, user_id: str = None, 
                  last_active: datetime = None, flow_state: str = None, 
                  context: Dict[str, Any] = None
@@ -26,11 +30,14 @@ class WhatsAppDevice:
         self.last_active = last_active or datetime.now()
         self.flow_state = flow_state or FlowState.INITIAL
         self.context = context or {}
+        # update_time del documento leído: precondición de las transiciones (None si se desconoce)
+        self.update_time: Optional[datetime] = None
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'WhatsAppDevice':
-        """Create a WhatsAppDevice object from a dictionary."""
-        context_data = data.get('context', {})
+        """Create a WhatsAppDevice object from a dictionary (without going through ``__init__``)."""
+        get = data.get
+        context_data = get('context', {})
         # Handle context conversion from string if stored that way
         if isinstance(context_data, str):
             try:
@@ -39,13 +46,14 @@ class WhatsAppDevice:
                 context_data = {}
                 logger.error(f"Failed to parse context data: {data.get('context')}")
         
-        return cls(
-            phone_number=data.get('phoneNumber'),
-            user_id=data.get('userId'),
-            last_active=data.get('lastActive'),
-            flow_state=data.get('flowState', FlowState.INITIAL),
-            context=context_data
-        )
+        device : WhatsAppDevice = cls.__new__(cls)
+        device.phone_number = get('phoneNumber')
+        device.user_id = get('userId')
+        device.last_active = get('lastActive') or datetime.now()
+        device.flow_state = get('flowState') or FlowState.INITIAL
+        device.context = context_data or {}
+        device.update_time = None
+        return device
     
     def to_dict(self) -> Dict:
         """Convert the object to a format for storing in Firestore."""
@@ -58,43 +66,67 @@ class WhatsAppDevice:
         }
     
     @classmethod
-    def get_by_phone_number(cls, phone_number: str) -> Optional['WhatsAppDevice']:
-        """Get a device by its phone number."""
-        data = FirestoreService.get_document(COLLECTION_WHATSAPP_DEVICES, phone_number)
+    def get_by_phone_number(cls, phone_number: str, fields: Optional[Iterable[str]] = None) -> Optional['WhatsAppDevice']:
+        """Get a device by its phone number, optionally projected to the given fields."""
+        data, update_time = FirestoreService.get_document_version(COLLECTION_WHATSAPP_DEVICES, phone_number, fields=fields)
         if data:
-            return cls.from_dict(data)
+            device = cls.from_dict(data)
+            device.update_time = update_time if fields is None else None
+            return device
         return None
+
+    def create(self) -> bool:
+        """Crear el dispositivo solo si no existe; devuelve False si otro mensaje lo creó antes."""
+        self.update_time = FirestoreService.create_if_absent(COLLECTION_WHATSAPP_DEVICES, self.phone_number, self.to_dict())
+        return self.update_time is not None
+
+    def transition(self, new_state: str, fields: Optional[Dict[str, Any]] = None) -> 'WhatsAppDevice':
+        """
+        Cambia el estado del flujo (y los campos indicados) en una sola escritura condicional.
+
+        La escritura solo se aplica si el documento no cambió desde que se leyó; si cambió
+        (o la versión se desconoce) lanza ``DocumentConflictError`` y hay que releer el
+        dispositivo y volver a evaluar la transición. La versión que deja la escritura se
+        conserva, así que una transición siguiente sobre el mismo objeto no necesita releer.
+        """
+        if self.update_time is None:
+            raise DocumentConflictError(f"Versión desconocida del dispositivo {self.phone_number}")
+        data: Dict[str, Any] = {'flowState': new_state, 'lastActive': datetime.now(), **(fields or {})}
+        update_time = FirestoreService.update_document_version(
+            COLLECTION_WHATSAPP_DEVICES, self.phone_number, data, last_update_time=self.update_time
+        )
+        if update_time is None:
+            raise DocumentConflictError(f"El dispositivo {self.phone_number} ya no existe")
+        self.flow_state = new_state
+        self.last_active = data['lastActive']
+        self.user_id = data.get('userId', self.user_id)
+        self.context = data.get('context', self.context)
+        self.update_time = update_time
+        return self
     
-    def save(self) -> 'WhatsAppDevice':
-        """Save or update the device in Firestore."""
+    def save(self, writer: Optional[BulkWriter] = None) -> 'WhatsAppDevice':
+        """Save or update the device in Firestore (batched when a BulkWriter is given)."""
         data = self.to_dict()
-        FirestoreService.create_document(COLLECTION_WHATSAPP_DEVICES, self.phone_number, data)
+        FirestoreService.set_document(COLLECTION_WHATSAPP_DEVICES, self.phone_number, data, writer=writer)
         return self
     
     def update_last_active(self) -> 'WhatsAppDevice':
-        """Update the last time the device was active."""
+        """Update the last time the device was active (only that field, without overwriting the flow state)."""
         self.last_active = datetime.now()
-        return self.save()
-    
-    def update_flow_state(self, new_state: str) -> 'WhatsAppDevice':
-        """Update the flow state of the conversation."""
-        self.flow_state = new_state
-        return self.save()
-    
-    def update_context(self, updates: Dict[str, Any]) -> 'WhatsAppDevice':
-        """Update the context with new key-value pairs."""
-        self.context.update(updates)
-        return self.save()
-    
-    def clear_context(self) -> 'WhatsAppDevice':
-        """Clear the context data."""
-        self.context = {}
-        return self.save()
-    
-    def set_user_id(self, user_id: str) -> 'WhatsAppDevice':
-        """Set the user ID after authentication."""
-        self.user_id = user_id
-        return self.save()
+        data: Dict[str, Any] = {'lastActive': self.last_active}
+        # Condicionada a la versión leída, la nueva versión sirve a la transición siguiente sin
+        # releer; si otro mensaje cambió el dispositivo, se escribe igual y la versión queda
+        # desconocida (el objeto ya no refleja el documento)
+        if self.update_time is not None:
+            try:
+                self.update_time = FirestoreService.update_document_version(
+                    COLLECTION_WHATSAPP_DEVICES, self.phone_number, data, last_update_time=self.update_time
+                )
+                return self
+            except DocumentConflictError:
+                self.update_time = None
+        FirestoreService.update_document_version(COLLECTION_WHATSAPP_DEVICES, self.phone_number, data)
+        return self
     
     def is_authenticated(self) -> bool:
         """Check if the device is associated with an authenticated user."""
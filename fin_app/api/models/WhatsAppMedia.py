@@ -1,14 +1,20 @@
 # api.models.WhatsAppMedia.py
 
 from datetime import datetime
-from typing import Dict, Optional, Any
+from typing import Dict, Iterable, Optional, Any
+from google.cloud.firestore_v1.bulk_writer import BulkWriter
 from api.services.firestore_service import FirestoreService
+from api.services.search_index_service import SearchIndexService
 from api.config import logger
 
 # Constante para la colección en Firestore
 COLLECTION_WHATSAPP_MEDIA = "whatsapp_media"
 
 class WhatsAppMedia:
+    __slots__ = ('media_id', 'user_id', 'phone_number', 'media_type', 'storage_path', 'content_type',
+                 'file_name', 'ocr_text', 'description', 'transcription', 'created_at', 'processed',
+                 'sha256', 'metadata')
+
     def __init__(self, media_id: str = None, user_id: Optional[str] = None, 
                  phone_number: Optional[str] = None, media_type: str = None, 
                  storage_path: Optional[str] = None, content_type: Optional[str] = None,
@@ -51,22 +57,28 @@ class WhatsAppMedia:
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'WhatsAppMedia':
-        """Crear un objeto WhatsAppMedia desde un diccionario."""
-        return cls(
-            media_id=data.get('id') or data.get('media_id'),
-            user_id=data.get('user_id'),
-            phone_number=data.get('phone_number'),
-            media_type=data.get('media_type'),
-            storage_path=data.get('storage_path'),
-            content_type=data.get('content_type'),
-            file_name=data.get('file_name'),
-            ocr_text=data.get('ocr_text'),
-            description=data.get('description'),
-            transcription=data.get('transcription'),
-            created_at=data.get('created_at'),
-            sha256=data.get('sha256'),
-            metadata=data.get('metadata')
-        )
+        """
+        Crear un objeto WhatsAppMedia desde un diccionario (sin pasar por ``__init__``).
+
+        Conserva ``processed`` del documento, así un ``save()`` posterior no lo reinicia.
+        """
+        get = data.get
+        media : WhatsAppMedia = cls.__new__(cls)
+        media.media_id = get('id') or get('media_id')
+        media.user_id = get('user_id')
+        media.phone_number = get('phone_number')
+        media.media_type = get('media_type')
+        media.storage_path = get('storage_path')
+        media.content_type = get('content_type')
+        media.file_name = get('file_name')
+        media.ocr_text = get('ocr_text')
+        media.description = get('description')
+        media.transcription = get('transcription')
+        media.created_at = get('created_at') or datetime.now()
+        media.processed = get('processed') or False
+        media.sha256 = get('sha256')
+        media.metadata = get('metadata') or {}
+        return media
     
     def to_dict(self) -> Dict:
         """Convertir el objeto a formato para guardar en Firestore."""
@@ -88,27 +100,54 @@ class WhatsAppMedia:
         }
     
     @classmethod
-    def get_by_id(cls, media_id: str) -> Optional['WhatsAppMedia']:
-        """Obtener un registro multimedia por su ID."""
-        data = FirestoreService.get_document(COLLECTION_WHATSAPP_MEDIA, media_id)
+    def get_by_id(cls, media_id: str, fields: Optional[Iterable[str]] = None) -> Optional['WhatsAppMedia']:
+        """
+        Obtener un registro multimedia por su ID.
+
+        Con ``fields`` solo se transfieren esos campos; el objeto resultante es parcial,
+        por lo que debe actualizarse con ``mark_as_processed`` y no con ``save()``.
+        """
+        data = FirestoreService.get_document(COLLECTION_WHATSAPP_MEDIA, media_id, fields=fields)
         if data:
             return cls.from_dict(data)
         return None
+
+    @classmethod
+    def get_many(cls, media_ids: Iterable[str], fields: Optional[Iterable[str]] = None) -> Dict[str, 'WhatsAppMedia']:
+        """Obtener varios registros multimedia en un solo RPC, indexados por ID."""
+        documents: Dict[str, Dict] = FirestoreService.get_many(COLLECTION_WHATSAPP_MEDIA, media_ids, fields=fields)
+        return {media_id: cls.from_dict(data) for media_id, data in documents.items()}
     
-    def save(self) -> 'WhatsAppMedia':
-        """Guardar o actualizar el registro multimedia en Firestore."""
+    def save(self, writer: Optional[BulkWriter] = None) -> 'WhatsAppMedia':
+        """Guardar o actualizar el registro multimedia en Firestore (en lote si se indica un BulkWriter)."""
         data = self.to_dict()
-        FirestoreService.create_document(COLLECTION_WHATSAPP_MEDIA, self.media_id, data)
+        FirestoreService.set_document(COLLECTION_WHATSAPP_MEDIA, self.media_id, data, writer=writer)
         return self
     
     def mark_as_processed(self, ocr_text=None, description=None, transcription=None) -> 'WhatsAppMedia':
-        """Marcar el medio como procesado y actualizar metadatos."""
+        """
+        Marcar el medio como procesado y actualizar metadatos.
+
+        Solo se escriben los campos modificados, de modo que funciona también sobre
+        objetos cargados con una proyección de campos (que debe incluir ``user_id``
+        para que el texto OCR se agregue al índice de búsqueda).
+        """
+        updates: Dict[str, Any] = {'processed': True}
         if ocr_text:
             self.ocr_text = ocr_text
+            updates['ocr_text'] = ocr_text
         if description:
             self.description = description
+            updates['description'] = description
         if transcription:
             self.transcription = transcription
+            updates['transcription'] = transcription
         
         self.processed = True
-        return self.save()
\ No newline at end of file
+        if FirestoreService.update_document(COLLECTION_WHATSAPP_MEDIA, self.media_id, updates, read_back=False) is None:
+            logger.warning(f"El registro multimedia {self.media_id} no existe; se guarda completo")
+            self.save()
+        
+        if ocr_text:
+            SearchIndexService.index_document(self.user_id, 'media', self.media_id, ocr_text)
+        return self
\ No newline at end of file
@@ -1,70 +1,197 @@
 # file: /api/models/WhatsAppMessage.py
 
-from typing import Dict, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+from google.cloud.firestore_v1.bulk_writer import BulkWriter
 from api.services.firestore_service import FirestoreService
+from api.services.message_archive_service import MessageArchiveService
+from api.services.search_index_service import SearchIndexService
 from uuid import UUID
-from api.config import COLLECTION_WHATSAPP_MESSAGES
+from api.services.payload_parser import MEDIA_TYPES, InboundMessage, parse_value, select_message
+from api.config import COLLECTION_WHATSAPP_MESSAGES, COLLECTION_WHATSAPP_RAW_MESSAGES
 
 class WhatsAppMessage:
-    def __init__(self, id : Optional[str] = None, user_id : Optional[str] = None, value : Optional[Dict] = None):
+    """
+    Proyección compacta e indexable de un mensaje de WhatsApp.
+
+    El payload crudo de Meta (``value``) no se guarda en el documento del mensaje:
+    se deja en una colección de espera hasta que el archivado en frío lo mueve a GCS
+    (ver ``MessageArchiveService``), desde donde puede recuperarse con ``load_raw_value``.
+    """
+
+    __slots__ = ('id', 'user_id', 'phone_number', 'message_type', 'timestamp', 'media_id',
+                 'context_id', 'text', 'raw_archive', 'status', 'value')
+
+    def __init__(self, id : Optional[str] = None, user_id : Optional[str] = None, value : Optional[Dict] = None,
+                 phone_number : Optional[str] = None, message_type : Optional[str] = None,
+                 timestamp : Optional[datetime] = None, media_id : Optional[str] = None,
+                 context_id : Optional[str] = None, text : Optional[str] = None,
+                 raw_archive : Optional[Dict[str, Any]] = None, status : Optional[str] = None):
         self.id : Optional[str] = id
         self.user_id : Optional[str] = user_id
+        self.phone_number : Optional[str] = phone_number
+        self.message_type : Optional[str] = message_type
+        self.timestamp : Optional[datetime] = timestamp
+        self.media_id : Optional[str] = media_id
+        self.context_id : Optional[str] = context_id
+        self.text : Optional[str] = text
+        self.raw_archive : Optional[Dict[str, Any]] = raw_archive
+        self.status : Optional[str] = status
+        # Payload crudo: solo en memoria, se persiste aparte para archivarse
         self.value : Optional[Dict] = value
-    
+
     @classmethod
-    def from_dict(cls, data: Dict) -> 'WhatsAppMessage':
-        """Crear un objeto WhatsAppMessage desde un diccionario."""
+    def from_webhook_value(cls, value : Dict, user_id : Optional[str] = None, message_id : Optional[str] = None) -> 'WhatsAppMessage':
+        """
+        Construir la proyección a partir del ``value`` de un webhook de Meta.
+
+        Args:
+            value: Objeto ``value`` del webhook (con ``messages``, ``contacts``, ``metadata``)
+            user_id: ID del usuario asociado
+            message_id: ID del mensaje a proyectar; por defecto el primero de ``messages``
+        """
+        message : Optional[InboundMessage] = select_message(parse_value(value), message_id)
+        if message is None:
+            return cls(id=message_id, user_id=user_id, value=value, message_type='')
+        whatsapp_message : WhatsAppMessage = cls.from_inbound(message, user_id=user_id)
+        whatsapp_message.id = message.id or message_id
+        return whatsapp_message
+
+    @classmethod
+    def from_inbound(cls, message : InboundMessage, user_id : Optional[str] = None) -> 'WhatsAppMessage':
+        """Construir la proyección a partir de un mensaje ya extraído por ``payload_parser``."""
         return cls(
-            id=data.get('id'),
-            user_id=data.get('user_id'),
-            value=data.get('value')
+            id=message.id,
+            user_id=user_id,
+            value=message.value,
+            phone_number=message.sender,
+            message_type=message.type,
+            timestamp=message.timestamp,
+            media_id=message.media_id,
+            context_id=message.context_id,
+            text=message.body or None
         )
-    
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'WhatsAppMessage':
+        """Crear un objeto WhatsAppMessage desde un diccionario (sin pasar por ``__init__``)."""
+        if data.get('value') and not data.get('message_type'):
+            # Documento antiguo que guardaba el payload crudo completo
+            legacy : WhatsAppMessage = cls.from_webhook_value(data['value'], user_id=data.get('user_id'), message_id=data.get('id'))
+            legacy.status = data.get('status')
+            return legacy
+
+        get = data.get
+        message : WhatsAppMessage = cls.__new__(cls)
+        message.id = get('id')
+        message.user_id = get('user_id')
+        message.phone_number = get('phone_number')
+        message.message_type = get('message_type')
+        message.timestamp = get('timestamp')
+        message.media_id = get('media_id')
+        message.context_id = get('context_id')
+        message.text = get('text')
+        message.raw_archive = get('raw_archive')
+        message.status = get('status')
+        message.value = None
+        return message
+
     def to_dict(self) -> Dict:
-        """Convertir el objeto a formato para guardar en Firestore."""
-        return {
+        """Convertir el objeto a formato para guardar en Firestore (sin el payload crudo)."""
+        data : Dict = {
             'id': self.id,
             'user_id': self.user_id,
-            'value': self.value
+            'phone_number': self.phone_number,
+            'message_type': self.message_type,
+            'timestamp': self.timestamp,
+            'media_id': self.media_id,
+            'context_id': self.context_id,
+            'text': self.text
         }
-    
+        if self.raw_archive:
+            data['raw_archive'] = self.raw_archive
+        if self.status:
+            data['status'] = self.status
+        return data
+
+    def raw_to_dict(self) -> Dict:
+        """Documento de espera con el payload crudo, pendiente de archivarse en GCS."""
+        received_at : datetime = self.timestamp or datetime.now(timezone.utc)
+        return {
+            'value': self.value,
+            'date': received_at.strftime('%Y-%m-%d'),
+            'timestamp': received_at
+        }
+
     @classmethod
-    def get_by_id(cls, message_id: str) -> Optional['WhatsAppMessage']:
-        """Obtener un mensaje por su ID."""
-        data = FirestoreService.get_document(COLLECTION_WHATSAPP_MESSAGES, message_id)
+    def get_by_id(cls, message_id: str, fields: Optional[Iterable[str]] = None) -> Optional['WhatsAppMessage']:
+        """
+        Obtener un mensaje por su ID.
+
+        Con ``fields`` (p. ej. ``['message_type', 'media_id']``) solo se transfieren esos
+        campos; el objeto resultante es parcial y no debe guardarse con ``save()``.
+        """
+        data = FirestoreService.get_document(COLLECTION_WHATSAPP_MESSAGES, message_id, fields=fields)
         if data:
             return cls.from_dict(data)
         return None
-    
-    def create(self) -> 'WhatsAppMessage':
+
+    @classmethod
+    def get_many(cls, message_ids: Iterable[str], fields: Optional[Iterable[str]] = None) -> Dict[str, 'WhatsAppMessage']:
+        """Obtener varios mensajes en un solo RPC, indexados por ID."""
+        documents : Dict[str, Dict] = FirestoreService.get_many(COLLECTION_WHATSAPP_MESSAGES, message_ids, fields=fields)
+        return {message_id: cls.from_dict(data) for message_id, data in documents.items()}
+
+    def load_raw_value(self) -> Optional[Dict]:
+        """Recuperar el payload crudo de Meta, desde memoria, la colección de espera o el archivo en GCS."""
+        if self.value is None and self.id:
+            self.value = MessageArchiveService.load_raw(self.id, self.raw_archive)
+        return self.value
+
+    def create(self, writer : Optional[BulkWriter] = None) -> 'WhatsAppMessage':
         """Guardar el mensaje en Firestore."""
-        data : Dict = self.to_dict()
+        return self.save(writer=writer)
 
-        new_data : Dict = FirestoreService.create_document(COLLECTION_WHATSAPP_MESSAGES, self.id, data)
+    def update(self) -> 'WhatsAppMessage':
+        """Actualizar el mensaje en Firestore."""
+        data : Dict = self.to_dict()
+        new_data : Optional[Dict] = FirestoreService.update_document(COLLECTION_WHATSAPP_MESSAGES, self.id, data, read_back=False)
         if new_data:
-            self.id : UUID = new_data.get('id')
             return self.from_dict(new_data)
-        
+
         return self
 
-    def update(self) -> 'WhatsAppMessage':
-        """Actualizar el mensaje en Firestore."""
-        data : Dict = self.to_dict()
-        new_data : Dict = FirestoreService.update_document(COLLECTION_WHATSAPP_MESSAGES, self.id, data)
-        return self.from_dict(new_data)
+    def save(self, writer : Optional[BulkWriter] = None) -> 'WhatsAppMessage':
+        """
+        Guardar o actualizar el mensaje en Firestore (en lote si se indica un BulkWriter).
 
-    def save(self) -> 'WhatsAppMessage':
-        """Guardar o actualizar el mensaje en Firestore."""
+        Si el objeto lleva el payload crudo, se guarda en la colección de espera en el
+        mismo commit que la proyección.
+        """
         data : Dict = self.to_dict()
 
-        new_data : Dict = FirestoreService.create_document(COLLECTION_WHATSAPP_MESSAGES, self.id, data)
+        if self.value is None:
+            new_data : Dict = FirestoreService.set_document(COLLECTION_WHATSAPP_MESSAGES, self.id, data, writer=writer)
+        elif writer is not None:
+            new_data = FirestoreService.set_document(COLLECTION_WHATSAPP_MESSAGES, self.id, data, writer=writer)
+            FirestoreService.set_document(COLLECTION_WHATSAPP_RAW_MESSAGES, self.id, self.raw_to_dict(), writer=writer)
+        else:
+            FirestoreService.set_many([
+                (COLLECTION_WHATSAPP_MESSAGES, self.id, data),
+                (COLLECTION_WHATSAPP_RAW_MESSAGES, self.id, self.raw_to_dict())
+            ])
+            new_data = {"id": self.id, **data}
+
         if new_data:
             self.id : UUID = new_data.get('id')
-            return self.from_dict(new_data)
-        
+
+        # Los captions de los archivos multimedia se agregan al índice de búsqueda
+        if self.text and self.message_type in MEDIA_TYPES:
+            SearchIndexService.index_document(self.user_id, 'msg', self.id, self.text)
+
         return self
-    
+
     def update_status(self, status: str) -> 'WhatsAppMessage':
         """Actualizar el estado del mensaje."""
         self.status = status
-        return self.save()
\ No newline at end of file
+        return self.save()
@@ -4,5 +4,6 @@ from api.models.User import User
 from api.models.WhatsAppMessage import WhatsAppMessage
 from api.models.WhatsAppDevice import WhatsAppDevice, FlowState
 from api.models.WhatsAppMedia import WhatsAppMedia
+from api.models.Transaction import Transaction
 
-__all__ = ['User', 'WhatsAppDevice', 'WhatsAppMessage', 'FlowState', 'WhatsAppMedia']
\ No newline at end of file
+__all__ = ['User', 'WhatsAppDevice', 'WhatsAppMessage', 'FlowState', 'WhatsAppMedia', 'Transaction']
\ No newline at end of file
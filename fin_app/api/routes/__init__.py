@@ -1,7 +1,13 @@
 from api.routes.whatsapp_webhook import whatsapp_webhook
 from api.routes.pubsub_chatbot import pubsub_chatbot
+from api.routes.history import history
+from api.routes.search import search
+from api.routes.media_files import media_files
 
 __all__ = [
-    "whatsapp_webhook"
-    'pubsub_chatbot'
-]
\ No newline at end of file
+    'whatsapp_webhook',
+    'pubsub_chatbot',
+    'history',
+    'search',
+    'media_files',
+]
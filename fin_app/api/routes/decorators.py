@@ -0,0 +1,62 @@
+# file: /api/routes/decorators.py
+
+import hmac
+
+from functools import wraps
+from typing import Any, Callable
+from flask import request, jsonify
+from api.config import logger, API_ACCESS_TOKEN
+from api.services.deadline import deadline_scope
+from api.services.lanes import Lane, lane_for_envelope, lane_scope
+
+def require_api_token(view: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Exige el encabezado ``Authorization: Bearer <API_ACCESS_TOKEN>``.
+
+    Si ``API_ACCESS_TOKEN`` no está configurado, la ruta responde 403 para no exponer
+    datos de usuarios por accidente.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not API_ACCESS_TOKEN:
+            logger.warning(f"Ruta de consulta deshabilitada (API_ACCESS_TOKEN no configurado): {request.path}")
+            return jsonify({"status": "error", "message": "API de consulta deshabilitada"}), 403
+
+        auth_header: str = request.headers.get('Authorization', '')
+        token: str = auth_header[7:] if auth_header.startswith('Bearer ') else ''
+        if not hmac.compare_digest(token.encode('utf-8'), API_ACCESS_TOKEN.encode('utf-8')):
+            return jsonify({"status": "error", "message": "No autorizado"}), 401
+
+        return view(*args, **kwargs)
+
+    return wrapper
+
+def with_deadline(seconds: float) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Ejecuta la vista con un presupuesto de ``seconds`` segundos: cada llamada saliente
+    usa como timeout lo que queda (ver ``api.services.deadline``).
+    """
+    def decorator(view: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with deadline_scope(seconds):
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def with_lane(view: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Atiende el mensaje push de Pub/Sub en su carril (ver ``api.services.lanes``): ocupa
+    uno de sus hilos y usa su presupuesto de tiempo. Si el carril está lleno responde 429
+    para que Pub/Sub lo reintente más tarde.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        lane: Lane = lane_for_envelope(request.get_json(silent=True) or {})
+        if not lane.try_acquire():
+            logger.warning(f"Carril {lane.name} lleno ({lane.concurrency}); el mensaje se reintentará")
+            return jsonify({"status": "error", "message": f"Carril {lane.name} saturado"}), 429
+        with lane_scope(lane), deadline_scope(lane.deadline_seconds):
+            return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,164 @@
+# file: /api/routes/history.py
+
+import json
+import base64
+import hashlib
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from flask import Blueprint, request, jsonify
+from api.config import logger, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, COLLECTION_WHATSAPP_MESSAGES, COLLECTION_WHATSAPP_MEDIA
+from api.services import FirestoreService, StorageService
+from api.routes.decorators import require_api_token
+
+history: Blueprint = Blueprint('history', __name__)
+
+MESSAGE_FIELDS: List[str] = ['user_id', 'phone_number', 'message_type', 'timestamp', 'media_id', 'context_id', 'text']
+MEDIA_FIELDS: List[str] = [
+    'media_id', 'user_id', 'phone_number', 'media_type', 'storage_path', 'content_type',
+    'file_name', 'ocr_text', 'description', 'transcription', 'created_at', 'processed'
+]
+
+class InvalidQueryError(ValueError):
+    """Parámetros de consulta inválidos; se responde con 400."""
+
+def parse_page_size() -> int:
+    """Leer ``page_size`` respetando DEFAULT_PAGE_SIZE y MAX_PAGE_SIZE."""
+    raw: Optional[str] = request.args.get('page_size')
+    if raw is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        page_size: int = int(raw)
+    except ValueError:
+        raise InvalidQueryError("page_size debe ser un entero")
+    if page_size < 1:
+        raise InvalidQueryError("page_size debe ser mayor que 0")
+    return min(page_size, MAX_PAGE_SIZE)
+
+def parse_datetime(name: str) -> Optional[datetime]:
+    """Leer un parámetro ISO 8601 (fecha o fecha y hora); sin zona horaria se asume UTC."""
+    raw: Optional[str] = request.args.get(name)
+    if not raw:
+        return None
+    try:
+        value: datetime = datetime.fromisoformat(raw.replace('Z', '+00:00'))
+    except ValueError:
+        raise InvalidQueryError(f"{name} debe tener formato ISO 8601")
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def query_fingerprint(*parts: Any) -> str:
+    """Huella corta de la consulta para rechazar cursores usados con otros filtros."""
+    return hashlib.sha1("|".join(str(part) for part in parts).encode('utf-8')).hexdigest()[:12]
+
+def encode_cursor(fingerprint: str, last_doc: Dict[str, Any], time_field: str) -> str:
+    """Token opaco con la clave (marca de tiempo, ID) del último documento de la página."""
+    timestamp: Any = last_doc.get(time_field)
+    payload: Dict[str, Any] = {
+        "q": fingerprint,
+        "t": timestamp.isoformat() if isinstance(timestamp, datetime) else None,
+        "id": last_doc["id"]
+    }
+    raw: bytes = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token: str, fingerprint: str) -> Tuple[Optional[datetime], str]:
+    try:
+        padded: str = token + '=' * (-len(token) % 4)
+        payload: Dict[str, Any] = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        timestamp: Optional[datetime] = datetime.fromisoformat(payload['t']) if payload.get('t') else None
+        doc_id: str = payload['id']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidQueryError("cursor inválido")
+    if payload.get('q') != fingerprint:
+        raise InvalidQueryError("El cursor no corresponde a esta consulta")
+    return timestamp, doc_id
+
+def serialize(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in doc.items()}
+
+def with_download_url(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Añade una URL firmada para descargar el archivo directamente desde GCS."""
+    if doc.get('storage_path'):
+        doc['download_url'] = StorageService.get_signed_url(doc['storage_path']) or None
+    return doc
+
+def list_page(collection: str, key_field: str, key_value: str, type_field: str, time_field: str, fields: List[str],
+              decorate: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None) -> Tuple[Any, int]:
+    """
+    Devuelve una página ordenada de la más reciente a la más antigua.
+
+    Se ordena por ``(time_field, __name__)`` descendente y se continúa desde el último
+    documento devuelto, así que cada página cuesta O(page_size) lecturas sin importar
+    cuánto historial exista. Requiere los índices compuestos de ``firestore.indexes.json``.
+    """
+    try:
+        page_size: int = parse_page_size()
+        type_filter: Optional[str] = request.args.get('type')
+        since: Optional[datetime] = parse_datetime('since')
+        until: Optional[datetime] = parse_datetime('until')
+        fingerprint: str = query_fingerprint(collection, key_field, key_value, type_filter, since, until)
+
+        filters: List[Tuple[str, str, Any]] = [(key_field, '==', key_value)]
+        if type_filter:
+            filters.append((type_field, '==', type_filter))
+        if since:
+            filters.append((time_field, '>=', since))
+        if until:
+            filters.append((time_field, '<', until))
+
+        start_after: Optional[Dict[str, Any]] = None
+        cursor: Optional[str] = request.args.get('cursor')
+        if cursor:
+            timestamp, doc_id = decode_cursor(cursor, fingerprint)
+            start_after = {time_field: timestamp, '__name__': doc_id}
+    except InvalidQueryError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    # Se pide un documento extra para saber si hay más páginas sin otra consulta
+    docs: List[Dict[str, Any]] = FirestoreService.query_page(
+        collection,
+        filters=filters,
+        order_by=[(time_field, 'DESCENDING'), ('__name__', 'DESCENDING')],
+        limit=page_size + 1,
+        start_after=start_after,
+        fields=fields
+    )
+    has_more: bool = len(docs) > page_size
+    docs = docs[:page_size]
+    if decorate:
+        docs = [decorate(doc) for doc in docs]
+
+    return jsonify({
+        "status": "success",
+        "data": [serialize(doc) for doc in docs],
+        "page_size": page_size,
+        "next_cursor": encode_cursor(fingerprint, docs[-1], time_field) if has_more else None
+    }), 200
+
+@history.route('/users/<user_id>/messages', methods=['GET'])
+@require_api_token
+def list_user_messages(user_id: str) -> Tuple[Any, int]:
+    """Historial de mensajes de un usuario (filtros: type, since, until; paginación: page_size, cursor)."""
+    logger.info(f"Listando mensajes del usuario {user_id}")
+    return list_page(COLLECTION_WHATSAPP_MESSAGES, 'user_id', user_id, 'message_type', 'timestamp', MESSAGE_FIELDS)
+
+@history.route('/phones/<phone_number>/messages', methods=['GET'])
+@require_api_token
+def list_phone_messages(phone_number: str) -> Tuple[Any, int]:
+    """Historial de mensajes de un número de teléfono."""
+    logger.info(f"Listando mensajes del teléfono {phone_number}")
+    return list_page(COLLECTION_WHATSAPP_MESSAGES, 'phone_number', phone_number, 'message_type', 'timestamp', MESSAGE_FIELDS)
+
+@history.route('/users/<user_id>/media', methods=['GET'])
+@require_api_token
+def list_user_media(user_id: str) -> Tuple[Any, int]:
+    """Archivos multimedia de un usuario."""
+    logger.info(f"Listando multimedia del usuario {user_id}")
+    return list_page(COLLECTION_WHATSAPP_MEDIA, 'user_id', user_id, 'media_type', 'created_at', MEDIA_FIELDS, with_download_url)
+
+@history.route('/phones/<phone_number>/media', methods=['GET'])
+@require_api_token
+def list_phone_media(phone_number: str) -> Tuple[Any, int]:
+    """Archivos multimedia de un número de teléfono."""
+    logger.info(f"Listando multimedia del teléfono {phone_number}")
+    return list_page(COLLECTION_WHATSAPP_MEDIA, 'phone_number', phone_number, 'media_type', 'created_at', MEDIA_FIELDS, with_download_url)
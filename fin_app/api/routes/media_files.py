@@ -0,0 +1,44 @@
+# file: /api/routes/media_files.py
+
+import os
+import mimetypes
+
+from typing import Any, Optional, Tuple
+from flask import Blueprint, request, jsonify, send_file
+from api.config import logger
+from api.services.cloud_storage_service import backend
+from api.services.storage_backends import LocalStorageBackend
+
+media_files: Blueprint = Blueprint('media_files', __name__)
+
+@media_files.route('/<bucket_name>/<path:object_path>', methods=['GET'])
+def download(bucket_name: str, object_path: str) -> Tuple[Any, int]:
+    """
+    Descarga de un archivo del backend local con una URL firmada por ``get_signed_url``.
+
+    El archivo se entrega con ``send_file``: con gunicorn la respuesta completa sale con
+    ``sendfile`` sin pasar por el proceso de Python, y las peticiones con ``Range`` o
+    ``If-None-Match`` se responden con 206/304.
+    """
+    if not isinstance(backend, LocalStorageBackend):
+        return jsonify({"error": "Recurso no encontrado", "status_code": 404}), 404
+
+    disposition: Optional[str] = request.args.get('disposition')
+    if not backend.verify_url(bucket_name, object_path, request.args.get('expires'), disposition, request.args.get('signature')):
+        logger.warning(f"URL firmada inválida o vencida para {bucket_name}/{object_path}")
+        return jsonify({"error": "URL inválida o vencida", "status_code": 403}), 403
+
+    path: str = backend.local_path(bucket_name, object_path)
+    if not os.path.isfile(path):
+        return jsonify({"error": "Recurso no encontrado", "status_code": 404}), 404
+
+    response = send_file(
+        path,
+        mimetype=mimetypes.guess_type(object_path)[0] or "application/octet-stream",
+        conditional=True,
+        etag=True,
+        max_age=0
+    )
+    if disposition:
+        response.headers['Content-Disposition'] = disposition
+    return response, response.status_code
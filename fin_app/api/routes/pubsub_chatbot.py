@@ -3,14 +3,58 @@
 import json
 import base64
 
-from typing import Dict, Optional, Tuple, Any, List, Union
+from typing import Dict, Iterable, Optional, Tuple, Any, List, Union
 from flask import Blueprint, request, jsonify
-from api.config import logger
-from api.services import WhatsAppService, StorageService, AIServices
-from api.models import WhatsAppMedia, WhatsAppMessage
+from api.config import logger, MEDIA_LABEL_ANALYSIS
+from api.services import WhatsAppService, StorageService, AIServices, SearchIndexService, FinancialExtractionService, DeadLetterService, MediaBatchService
+from api.services.task_graph import GraphResult, Stage, TaskGraph
+from api.services.dependency_guard import DependencyUnavailableError
+from api.services.deadline import DeadlineExceededError
+from api.services.lanes import INTERACTIVE, classify_message
+from api.services.payload_parser import SUPPORTED_TYPES, TEXT, parse_pubsub_data
+from api.routes.decorators import with_lane
+from api.models import WhatsAppMedia, WhatsAppMessage, WhatsAppDevice, Transaction
 
 pubsub_chatbot: Blueprint = Blueprint('pubsub_chatbot', __name__)
 
+# Respuesta cuando Vision o Storage no están disponibles (circuito abierto o saturados)
+FALLBACK_REPLY: str = (
+    "En este momento no podemos analizar tu archivo. Quedó guardado y lo procesaremos más tarde; "
+    "también puedes responderlo con \"ocr\" en unos minutos."
+)
+
+# Tiempo máximo (segundos) de cada etapa de process_media
+STAGE_TIMEOUTS: Dict[str, float] = {
+    'record': 10.0,
+    'download': 30.0,
+    'ocr': 30.0,
+    'labels': 15.0,
+    'persist': 10.0,
+    'transaction': 10.0,
+}
+
+def load_media_record(media_id: str) -> Optional[WhatsAppMedia]:
+    return WhatsAppMedia.get_by_id(media_id, fields=['media_type', 'user_id', 'phone_number'])
+
+def download_media(storage_path: str) -> bytes:
+    bucket_name: str
+    object_path: str
+    bucket_name, object_path = StorageService.parse_storage_path(storage_path)
+    if not (bucket_name and object_path):
+        raise ValueError(f"Formato de ruta de storage inválido: {storage_path}")
+    success, file_bytes = StorageService.download_file(bucket_name, object_path)
+    if not (success and file_bytes):
+        raise IOError(f"No se pudo descargar el archivo desde Cloud Storage: {storage_path}")
+    return file_bytes
+
+def unavailable_dependencies(errors: Iterable[BaseException]) -> List[str]:
+    """Dependencias que impidieron el análisis (circuito abierto, saturación o sin tiempo)."""
+    return sorted({
+        error.dependency if isinstance(error, DependencyUnavailableError) else "deadline"
+        for error in errors
+        if isinstance(error, (DependencyUnavailableError, DeadlineExceededError))
+    })
+
 def process_media(media_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Procesa archivos multimedia utilizando servicios de IA según el tipo de medio.
@@ -40,69 +84,61 @@ def process_media(media_data: Dict[str, Any]) -> Dict[str, Any]:
     media_type: str = media_data.get('media_type', '')
     storage_path: str = media_data.get('storage_path', '')
     
-    # Buscar el registro en Firestore
-    whatsapp_media: Optional[WhatsAppMedia] = WhatsAppMedia.get_by_id(media_id)
+    # Las etapas se ejecutan como un grafo: la lectura del registro y la descarga van en
+    # paralelo, el OCR y las etiquetas en paralelo sobre los bytes descargados, y la
+    # actualización del registro en paralelo con la extracción de la transacción
+    def load_record() -> Optional[WhatsAppMedia]:
+        return load_media_record(media_id)
+    
+    def download() -> bytes:
+        return download_media(storage_path)
+    
+    def ocr(download: bytes) -> str:
+        return AIServices.extract_image_ocr(download)
+    
+    def labels(download: bytes) -> str:
+        return AIServices.analyze_image(download)
+    
+    def persist(record: Optional[WhatsAppMedia], ocr: str = "", labels: str = "") -> None:
+        if record:
+            record.mark_as_processed(
+                ocr_text=ocr, description=describe(media_type, ocr, labels), transcription=placeholder_transcription(media_type)
+            )
     
-    if not whatsapp_media:
+    def transaction(record: Optional[WhatsAppMedia], ocr: str = "") -> Dict[str, Any]:
+        return extract_transaction(record, ocr) if record else {}
+    
+    # Audio y video aún no se analizan: no hace falta descargar el archivo completo
+    # (cuando se implementen, deben leerse por partes con StorageService.open_stream)
+    analyze_bytes: bool = media_type in ('image', 'document') and bool(storage_path)
+    stages: List[Stage] = [Stage('record', load_record, timeout=STAGE_TIMEOUTS['record'])]
+    if analyze_bytes:
+        stages += [
+            Stage('download', download, timeout=STAGE_TIMEOUTS['download']),
+            Stage('ocr', ocr, requires=['download'], timeout=STAGE_TIMEOUTS['ocr'], default=""),
+        ]
+        if media_type == 'image' and MEDIA_LABEL_ANALYSIS:
+            stages.append(Stage('labels', labels, requires=['download'], timeout=STAGE_TIMEOUTS['labels'], default=""))
+    analysis: List[str] = [name for name in ('ocr', 'labels') if any(stage.name == name for stage in stages)]
+    # Si el análisis falla (p. ej. Vision no disponible) el registro queda sin procesar
+    # para que tools.reprocess_media lo recoja más tarde
+    stages += [
+        Stage('persist', persist, requires=['record', *analysis[:1]], uses=analysis[1:], timeout=STAGE_TIMEOUTS['persist']),
+        Stage('transaction', transaction, requires=['record'], uses=analysis[:1], timeout=STAGE_TIMEOUTS['transaction'], default={}),
+    ]
+    
+    result: GraphResult = TaskGraph(stages).run()
+    logger.info(f"Etapas de procesamiento de {media_id}: {result.summary()}")
+    
+    if not result.values.get('record'):
         logger.warning(f"No se encontró registro para el media_id: {media_id}")
         return {
             "success": False,
             "message": "Registro de media no encontrado"
         }
     
-    # Valores predeterminados para el resultado
-    ocr_text: str = ""
-    description: str = ""
-    transcription: str = ""
-    
-    # Recuperar el archivo de Cloud Storage si existe un storage_path
-    if storage_path:
-        try:
-            # Extraer la ruta real del archivo sin el prefijo gs://
-            bucket_name: str = ""
-            object_path: str = ""
-            
-            if storage_path.startswith("gs://"):
-                # Quitar el prefijo gs:// y dividir por la primera barra después del nombre del bucket
-                parts: List[str] = storage_path[5:].split("/", 1)
-                if len(parts) == 2:
-                    bucket_name, object_path = parts
-            
-            if bucket_name and object_path:
-                # Obtener los bytes del archivo
-                success: bool
-                file_bytes: Optional[bytes]
-                success, file_bytes = StorageService.download_file(bucket_name, object_path)
-                
-                if success and file_bytes:
-                    # Procesar según el tipo de medio
-                    if media_type == 'image':
-                        # Procesar imagen con OCR
-                        ocr_text = AIServices.extract_image_ocr(file_bytes)
-                        description = f"Imagen procesada con OCR - {len(ocr_text)} caracteres extraídos"
-                    
-                    elif media_type == 'document':
-                        # Procesar documento (podría usar OCR o procesamiento de documentos)
-                        ocr_text = AIServices.extract_image_ocr(file_bytes)
-                        description = f"Documento procesado - {len(ocr_text)} caracteres extraídos"
-                    
-                    elif media_type == 'audio':
-                        # Implementar transcripción de audio cuando se active la funcionalidad
-                        transcription = "Funcionalidad de transcripción de audio en desarrollo"
-                    
-                    elif media_type == 'video':
-                        # Implementar procesamiento de video cuando se active la funcionalidad
-                        transcription = "Funcionalidad de transcripción de video en desarrollo"
-                        description = "Análisis de video en desarrollo"
-                else:
-                    logger.error(f"No se pudo descargar el archivo desde Cloud Storage: {storage_path}")
-            else:
-                logger.error(f"Formato de ruta de storage inválido: {storage_path}")
-        except Exception as e:
-            logger.error(f"Error al procesar el archivo multimedia: {str(e)}")
-    
-    # Actualizar el registro con los resultados del procesamiento
-    whatsapp_media.mark_as_processed(ocr_text=ocr_text, description=description, transcription=transcription)
+    ocr_text: str = result.values.get('ocr') or ""
+    unavailable: List[str] = unavailable_dependencies(result.errors.values())
     
     logger.info(f"Procesamiento de IA completado para media_id: {media_id}")
     
@@ -110,10 +146,233 @@ def process_media(media_data: Dict[str, Any]) -> Dict[str, Any]:
         "success": True,
         "media_id": media_id,
         "ocr_text": ocr_text,
-        "description": description,
-        "transcription": transcription
+        "description": describe(media_type, ocr_text, result.values.get('labels') or ""),
+        "transcription": placeholder_transcription(media_type),
+        "transaction": result.values.get('transaction') or {},
+        "partial": result.partial,
+        "unavailable": unavailable
     }
 
+def process_media_batch(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Procesa un grupo de archivos de la misma conversación (ver ``MediaBatchService``).
+
+    Los registros y las descargas de todos los archivos van en paralelo y las imágenes y
+    documentos se analizan juntos en una sola llamada a Vision (``AIServices.annotate_images``);
+    después se actualiza cada registro y se extrae su transacción como en ``process_media``.
+
+    Args:
+        items: Archivos del grupo (``media_id``, ``media_type``, ``storage_path``)
+
+    Returns:
+        List[Dict[str, Any]]: Resultado de cada archivo, con la forma del de ``process_media``
+    """
+    analyzed: List[int] = [
+        index for index, item in enumerate(items)
+        if item.get('media_type') in ('image', 'document') and item.get('storage_path')
+    ]
+
+    def annotate(**downloads: bytes) -> Dict[int, Tuple[str, str]]:
+        images: List[Optional[bytes]] = [downloads.get(f'download_{index}') for index in analyzed]
+        with_labels: List[bool] = [items[index]['media_type'] == 'image' and MEDIA_LABEL_ANALYSIS for index in analyzed]
+        return dict(zip(analyzed, AIServices.annotate_images(images, with_labels)))
+
+    def persist_stage(index: int) -> Any:
+        media_type: str = items[index].get('media_type', '')
+        def persist(annotate: Optional[Dict[int, Tuple[str, str]]] = None, **values: Any) -> None:
+            record: Optional[WhatsAppMedia] = values[f'record_{index}']
+            if record:
+                ocr_text, labels = (annotate or {}).get(index, ("", ""))
+                record.mark_as_processed(
+                    ocr_text=ocr_text, description=describe(media_type, ocr_text, labels), transcription=placeholder_transcription(media_type)
+                )
+        return persist
+
+    def transaction_stage(index: int) -> Any:
+        def transaction(annotate: Optional[Dict[int, Tuple[str, str]]] = None, **values: Any) -> Dict[str, Any]:
+            record: Optional[WhatsAppMedia] = values[f'record_{index}']
+            return extract_transaction(record, (annotate or {}).get(index, ("", ""))[0]) if record else {}
+        return transaction
+
+    stages: List[Stage] = []
+    for index, item in enumerate(items):
+        media_id: str = item.get('media_id', '')
+        stages.append(Stage(f'record_{index}', lambda media_id=media_id: load_media_record(media_id), timeout=STAGE_TIMEOUTS['record']))
+    for index in analyzed:
+        storage_path: str = items[index]['storage_path']
+        stages.append(Stage(f'download_{index}', lambda storage_path=storage_path: download_media(storage_path), timeout=STAGE_TIMEOUTS['download']))
+    if analyzed:
+        # Las descargas fallidas no impiden analizar las demás
+        stages.append(Stage('annotate', annotate, uses=[f'download_{index}' for index in analyzed], timeout=STAGE_TIMEOUTS['ocr'], default={}))
+    for index in range(len(items)):
+        # Sin descarga o sin análisis el registro queda sin procesar (tools.reprocess_media)
+        analysis: List[str] = [f'download_{index}', 'annotate'] if index in analyzed else []
+        stages += [
+            Stage(f'persist_{index}', persist_stage(index), requires=[f'record_{index}', *analysis], timeout=STAGE_TIMEOUTS['persist']),
+            Stage(f'transaction_{index}', transaction_stage(index), requires=[f'record_{index}'], uses=analysis[1:],
+                  timeout=STAGE_TIMEOUTS['transaction'], default={}),
+        ]
+
+    result: GraphResult = TaskGraph(stages).run()
+    logger.info(f"Etapas de procesamiento del grupo de {len(items)} archivos: {result.summary()}")
+
+    annotations: Dict[int, Tuple[str, str]] = result.values.get('annotate') or {}
+    results: List[Dict[str, Any]] = []
+    for index, item in enumerate(items):
+        media_id: str = item.get('media_id', '')
+        if not result.values.get(f'record_{index}'):
+            logger.warning(f"No se encontró registro para el media_id: {media_id}")
+            results.append({"success": False, "media_id": media_id, "message": "Registro de media no encontrado"})
+            continue
+        names: List[str] = [f'record_{index}', f'persist_{index}', f'transaction_{index}']
+        if index in analyzed:
+            names += [f'download_{index}', 'annotate']
+        ocr_text, labels = annotations.get(index, ("", ""))
+        media_type: str = item.get('media_type', '')
+        results.append({
+            "success": True,
+            "media_id": media_id,
+            "ocr_text": ocr_text,
+            "description": describe(media_type, ocr_text, labels),
+            "transcription": placeholder_transcription(media_type),
+            "transaction": result.values.get(f'transaction_{index}') or {},
+            "partial": any(not result.ok(name) for name in names),
+            "unavailable": unavailable_dependencies(result.errors[name] for name in names if name in result.errors),
+        })
+    return results
+
+def describe(media_type: str, ocr_text: str, labels: str) -> str:
+    """Descripción del resultado del análisis según el tipo de medio."""
+    if media_type == 'image':
+        description: str = f"Imagen procesada con OCR - {len(ocr_text)} caracteres extraídos"
+        return f"{description}. {labels}" if labels else description
+    if media_type == 'document':
+        return f"Documento procesado - {len(ocr_text)} caracteres extraídos"
+    if media_type == 'video':
+        return "Análisis de video en desarrollo"
+    return ""
+
+def placeholder_transcription(media_type: str) -> str:
+    if media_type == 'audio':
+        return "Funcionalidad de transcripción de audio en desarrollo"
+    if media_type == 'video':
+        return "Funcionalidad de transcripción de video en desarrollo"
+    return ""
+
+def extract_transaction(whatsapp_media: WhatsAppMedia, ocr_text: str) -> Dict[str, Any]:
+    """
+    Extrae montos, moneda, fechas, comercio e identificaciones tributarias del texto OCR
+    y los guarda como una transacción vinculada al medio.
+    
+    Returns:
+        Dict[str, Any]: Campos extraídos o diccionario vacío si no se encontró nada útil
+    """
+    if not ocr_text:
+        return {}
+    
+    try:
+        fields: Dict[str, Any] = FinancialExtractionService.extract(ocr_text)
+        transaction: Transaction = Transaction.from_extraction(
+            whatsapp_media.media_id, whatsapp_media.user_id, whatsapp_media.phone_number, fields
+        )
+        if not transaction.has_data():
+            return {}
+        
+        transaction.save()
+        logger.info(f"Transacción extraída para media_id {whatsapp_media.media_id}: total={transaction.total} {transaction.currency}")
+        return fields
+    except Exception as e:
+        logger.error(f"Error al extraer la transacción de {whatsapp_media.media_id}: {str(e)}")
+        return {}
+
+def format_amount(value: float, currency: Optional[str]) -> str:
+    """Formatea un monto al estilo local (``$12.480,50 COP``)."""
+    formatted: str = f"{value:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+    if formatted.endswith(',00'):
+        formatted = formatted[:-3]
+    return f"${formatted} {currency or ''}".strip()
+
+def format_transaction_summary(fields: Dict[str, Any]) -> str:
+    """Resumen de la transacción extraída para la respuesta de WhatsApp."""
+    lines: List[str] = []
+    if fields.get('merchant'):
+        lines.append(f"- Comercio: {fields['merchant']}")
+    for tax_id in fields.get('tax_ids', [])[:1]:
+        lines.append(f"- {tax_id['type']}: {tax_id['value']}")
+    if fields.get('date'):
+        lines.append(f"- Fecha: {fields['date']}")
+    if fields.get('subtotal') is not None:
+        lines.append(f"- Subtotal: {format_amount(fields['subtotal'], fields.get('currency'))}")
+    if fields.get('tax') is not None:
+        lines.append(f"- Impuestos: {format_amount(fields['tax'], fields.get('currency'))}")
+    if fields.get('total') is not None:
+        lines.append(f"- Total: {format_amount(fields['total'], fields.get('currency'))}")
+    return "\n".join(lines) + ("\n" if lines else "")
+
+def format_media_result(media_type: str, media_processing_result: Dict[str, Any]) -> str:
+    """Detalle de la respuesta de WhatsApp para el resultado de ``process_media`` de un archivo."""
+    media_id: str = media_processing_result.get('media_id', '')
+    if media_processing_result.get('unavailable'):
+        logger.warning(f"Dependencias no disponibles para {media_id}: {media_processing_result['unavailable']}")
+        return FALLBACK_REPLY
+    
+    if not media_processing_result.get('success', False):
+        # Error en el procesamiento del media
+        return f"No se pudo procesar el archivo multimedia. {media_processing_result.get('message', '')}"
+    
+    response_message: str = ""
+    transaction_fields: Dict[str, Any] = media_processing_result.get('transaction') or {}
+    
+    if media_type in ['image', 'document'] and transaction_fields:
+        response_message += "Datos de la transacción:\n"
+        response_message += format_transaction_summary(transaction_fields)
+    
+    elif media_type == 'image':
+        response_message += "Análisis de la imagen:\n"
+        if media_processing_result.get('ocr_text'):
+            # Truncar texto OCR si es muy largo
+            ocr_text: str = media_processing_result.get('ocr_text', '')
+            truncated_text: str = ocr_text[:100] + "..." if len(ocr_text) > 100 else ocr_text
+            response_message += f"- Texto detectado: {truncated_text}\n"
+        if media_processing_result.get('description'):
+            response_message += f"- Descripción: {media_processing_result.get('description')}\n"
+    
+    elif media_type == 'document':
+        response_message += "Análisis del documento:\n"
+        if media_processing_result.get('ocr_text'):
+            # Truncar texto OCR si es muy largo
+            ocr_text: str = media_processing_result.get('ocr_text', '')
+            truncated_text: str = ocr_text[:100] + "..." if len(ocr_text) > 100 else ocr_text
+            response_message += f"- Texto extraído: {truncated_text}\n"
+    
+    elif media_type in ['audio', 'video']:
+        response_message += f"Análisis del {media_type}:\n"
+        if media_processing_result.get('transcription'):
+            response_message += f"- Transcripción: {media_processing_result.get('transcription')}\n"
+        if media_processing_result.get('description') and media_type == 'video':
+            response_message += f"- Descripción: {media_processing_result.get('description')}\n"
+    
+    return response_message
+
+def format_batch_reply(items: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> str:
+    """
+    Respuesta única para un grupo de archivos: el detalle de cada uno y, si alguno no se
+    pudo analizar por falta de Vision o Storage, el mensaje de respaldo una sola vez.
+    """
+    lines: List[str] = [f"Se han recibido tus {len(items)} archivos:\n"]
+    pending: bool = False
+    for number, (item, result) in enumerate(zip(items, results), start=1):
+        lines.append(f"{number}. {item.get('caption') or item.get('media_type', '')}")
+        if result.get('unavailable'):
+            logger.warning(f"Dependencias no disponibles para {item.get('media_id')}: {result['unavailable']}")
+            pending = True
+            lines.append("Pendiente de análisis\n")
+        else:
+            lines.append(format_media_result(item.get('media_type', ''), result))
+    if pending:
+        lines.append(FALLBACK_REPLY)
+    return "\n".join(lines).strip()
+
 def process_ocr_request(context_id: str, client_phone: str, phone_business_id: str) -> Optional[str]:
     """
     Procesa una solicitud de OCR para un mensaje referenciado.
@@ -127,8 +386,11 @@ def process_ocr_request(context_id: str, client_phone: str, phone_business_id: s
         Optional[str]: Mensaje de respuesta o None si no se puede procesar
     """
     try:
-        # Obtener el mensaje referenciado
-        referenced_message: Optional[WhatsAppMessage] = WhatsAppMessage.get_by_id(context_id)
+        # Obtener el mensaje referenciado (solo los campos de la proyección; los
+        # documentos antiguos traen el payload crudo en value.messages)
+        referenced_message: Optional[WhatsAppMessage] = WhatsAppMessage.get_by_id(
+            context_id, fields=['message_type', 'media_id', 'value.messages']
+        )
         
         if not referenced_message:
             logger.warning(f"No se encontró el mensaje referenciado con ID: {context_id}")
@@ -136,48 +398,21 @@ def process_ocr_request(context_id: str, client_phone: str, phone_business_id: s
             WhatsAppService.send_message(client_phone, response_message, phone_business_id)
             return response_message
         
-        # Obtener el valor del mensaje
-        message_value: Dict[str, Any] = referenced_message.value
+        message_type: str = referenced_message.message_type or ""
         
-        if not message_value:
-            logger.warning(f"El mensaje referenciado no tiene valor: {context_id}")
+        if not message_type:
+            logger.warning(f"El mensaje referenciado no tiene tipo: {context_id}")
             response_message: str = "El mensaje referenciado no contiene datos válidos."
             WhatsAppService.send_message(client_phone, response_message, phone_business_id)
             return response_message
         
-        # Extraer los mensajes del valor (primero verificar si estamos en la estructura correcta)
-        referenced_message_data: Dict[str, Any] = {}
-        message_type: str = ""
-        
-        # Verificar si el valor ya es un mensaje individual o es una estructura completa
-        if 'type' in message_value:
-            # El valor ya es un mensaje individual
-            referenced_message_data = message_value
-            message_type = message_value.get('type', '')
-        else:
-            # Extraer los mensajes del valor en estructura completa
-            messages: List[Dict[str, Any]] = message_value.get('messages', [])
-            
-            if not messages:
-                logger.warning(f"No hay mensajes en el valor: {context_id}")
-                response_message: str = "El mensaje referenciado está vacío."
-                WhatsAppService.send_message(client_phone, response_message, phone_business_id)
-                return response_message
-            
-            # Obtener el primer mensaje
-            referenced_message_data = messages[0]
-            message_type = referenced_message_data.get('type', '')
-        
         # Verificar si el mensaje es una imagen o documento
         media_id: str = ""
         media_type: str = ""
         
-        if message_type == 'image':
-            media_id = referenced_message_data.get('image', {}).get('id', '')
-            media_type = 'image'
-        elif message_type == 'document':
-            media_id = referenced_message_data.get('document', {}).get('id', '')
-            media_type = 'document'
+        if message_type in ('image', 'document'):
+            media_id = referenced_message.media_id or ""
+            media_type = message_type
         else:
             logger.warning(f"El mensaje referenciado no es una imagen o documento: {message_type}")
             response_message: str = "Solo se puede extraer texto de imágenes o documentos."
@@ -191,7 +426,7 @@ def process_ocr_request(context_id: str, client_phone: str, phone_business_id: s
             return response_message
         
         # Buscar el registro de media
-        whatsapp_media: Optional[WhatsAppMedia] = WhatsAppMedia.get_by_id(media_id)
+        whatsapp_media: Optional[WhatsAppMedia] = WhatsAppMedia.get_by_id(media_id, fields=['ocr_text', 'storage_path', 'user_id'])
         
         if not whatsapp_media:
             logger.warning(f"No se encontró registro para el media_id: {media_id}")
@@ -227,15 +462,10 @@ def process_ocr_request(context_id: str, client_phone: str, phone_business_id: s
             WhatsAppService.send_message(client_phone, response_message, phone_business_id)
             return response_message
         
-        # Extraer la ruta real del archivo sin el prefijo gs://
-        bucket_name: str = ""
-        object_path: str = ""
-        
-        if storage_path.startswith("gs://"):
-            # Quitar el prefijo gs:// y dividir por la primera barra después del nombre del bucket
-            parts: List[str] = storage_path[5:].split("/", 1)
-            if len(parts) == 2:
-                bucket_name, object_path = parts
+        # Separar bucket y ruta del objeto (gs://bucket/objeto)
+        bucket_name: str
+        object_path: str
+        bucket_name, object_path = StorageService.parse_storage_path(storage_path)
         
         if not (bucket_name and object_path):
             logger.error(f"Formato de ruta de storage inválido: {storage_path}")
@@ -263,14 +493,94 @@ def process_ocr_request(context_id: str, client_phone: str, phone_business_id: s
         response_message: str = "Texto extraído del archivo:\n\n" + (ocr_text or "No se detectó texto en el archivo.")
         WhatsAppService.send_message(client_phone, response_message, phone_business_id)
         return response_message
-        
+    
+    except (DependencyUnavailableError, DeadlineExceededError) as e:
+        logger.warning(f"Solicitud OCR respondida con el mensaje de respaldo: {str(e)}")
+        WhatsAppService.send_message(client_phone, FALLBACK_REPLY, phone_business_id)
+        return FALLBACK_REPLY
     except Exception as e:
         logger.error(f"Error al procesar solicitud OCR: {str(e)}")
         response_message: str = "Ocurrió un error al procesar la solicitud de OCR."
         WhatsAppService.send_message(client_phone, response_message, phone_business_id)
         return response_message
 
+def process_search_request(query: str, client_phone: str, phone_business_id: str) -> str:
+    """
+    Procesa el comando "buscar ..." sobre el texto OCR y los captions del usuario.
+    
+    Args:
+        query: Palabras a buscar
+        client_phone: Número de teléfono del cliente
+        phone_business_id: ID del número de teléfono de WhatsApp Business
+        
+    Returns:
+        str: Mensaje de respuesta enviado al usuario
+    """
+    try:
+        if not query.strip():
+            response_message: str = "Escribe lo que quieres buscar, por ejemplo: buscar factura luz"
+            WhatsAppService.send_message(client_phone, response_message, phone_business_id)
+            return response_message
+        
+        device: Optional[WhatsAppDevice] = WhatsAppDevice.get_by_phone_number(client_phone, fields=['userId'])
+        if not device or not device.user_id:
+            response_message: str = "No se encontró tu usuario para realizar la búsqueda."
+            WhatsAppService.send_message(client_phone, response_message, phone_business_id)
+            return response_message
+        
+        results: List[Dict[str, Any]] = SearchIndexService.search(device.user_id, query, limit=5)
+        
+        if not results:
+            response_message: str = f"No se encontraron documentos que contengan: {query}"
+        else:
+            lines: List[str] = [f"Resultados para \"{query}\":"]
+            for result in results:
+                date: str = (result.get('date') or '')[:10]
+                lines.append(f"- [{result.get('type') or result.get('kind')} {date}] {result.get('snippet', '')}")
+            response_message = "\n".join(lines)
+        
+        WhatsAppService.send_message(client_phone, response_message, phone_business_id)
+        return response_message
+    
+    except Exception as e:
+        logger.error(f"Error al procesar búsqueda: {str(e)}")
+        response_message: str = "Ocurrió un error al realizar la búsqueda."
+        WhatsAppService.send_message(client_phone, response_message, phone_business_id)
+        return response_message
+
+def decode_payload(pubsub_message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    try:
+        payload: Any = json.loads(base64.b64decode(pubsub_message.get('data', '')).decode('utf-8'))
+    except Exception:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+def reject_message(envelope: Dict[str, Any], error: BaseException, permanent: bool = False) -> Tuple[Any, int]:
+    """
+    Respuesta para un mensaje que no se pudo procesar.
+
+    Mientras queden intentos responde 500 para que Pub/Sub lo reenvíe; al agotarlos (o si
+    el error es permanente, como un payload sin mensajes) lo guarda en la colección de
+    mensajes muertos y lo confirma con 200 para que no se reenvíe indefinidamente.
+    """
+    pubsub_message: Dict[str, Any] = envelope.get('message') or {}
+    message_id: Optional[str] = pubsub_message.get('messageId') or pubsub_message.get('message_id')
+    if not message_id:
+        return jsonify({"status": "error", "message": str(error)}), 400 if permanent else 500
+
+    attempts: int = 1 if permanent else DeadLetterService.register_failure(message_id, envelope.get('deliveryAttempt'))
+    if not permanent and not DeadLetterService.exhausted(attempts):
+        logger.warning(f"Intento {attempts} fallido del mensaje {message_id}; Pub/Sub lo reenviará")
+        return jsonify({"status": "error", "message": str(error)}), 500
+
+    payload: Optional[Dict[str, Any]] = decode_payload(pubsub_message)
+    lane: str = (pubsub_message.get('attributes') or {}).get('lane') or (classify_message(payload) if payload else INTERACTIVE)
+    if DeadLetterService.dead_letter(message_id, payload, lane, attempts, error):
+        return jsonify({"status": "dead_lettered", "message": str(error)}), 200
+    return jsonify({"status": "error", "message": str(error)}), 500
+
 @pubsub_chatbot.route('/', methods=['POST'])
+@with_lane
 def handle_pubsub_message() -> Tuple[Any, int]:
     """
     Maneja los mensajes recibidos desde Pub/Sub para procesar archivos multimedia.
@@ -288,12 +598,23 @@ def handle_pubsub_message() -> Tuple[Any, int]:
     pubsub_message: Dict[str, Any] = envelope['message']
     if 'data' not in pubsub_message:
         return jsonify({"status": "error", "message": "No data in message"}), 400
-        
+
+    # Un mensaje que ya agotó sus intentos se confirma sin volver a procesarlo
+    message_id: Optional[str] = pubsub_message.get('messageId') or pubsub_message.get('message_id')
+    if message_id and DeadLetterService.is_dead_lettered(message_id):
+        logger.warning(f"Mensaje {message_id} ya enviado a mensajes muertos; se confirma sin procesar")
+        return jsonify({"status": "dead_lettered"}), 200
+
+    try:
+        # Decodificar el payload y extraer el mensaje al que se refiere en una sola pasada
+        payload, inbound = parse_pubsub_data(pubsub_message['data'])
+    except ValueError as e:
+        # Un payload que no es base64 de un objeto JSON nunca se podrá procesar
+        logger.error(f"Payload de Pub/Sub inválido: {str(e)}")
+        return reject_message(envelope, e, permanent=True)
+
     try:
-        # Decodificar y cargar los datos
-        encoded_data: str = pubsub_message['data']
-        str_json: str = base64.b64decode(encoded_data).decode('utf-8')
-        logger.info(f"PUBSUB - Mensaje recibido: \n\n{str_json}\n\n")
+        logger.info(f"PUBSUB - Mensaje recibido: {inbound.id if inbound else None} ({inbound.type if inbound else 'sin mensajes'})")
 
         """Standart implementation:
         {
@@ -335,125 +656,82 @@ def handle_pubsub_message() -> Tuple[Any, int]:
             }
         }
         """
-        data: Dict[str, Any] = json.loads(str_json)
-
-        # Extraer datos siguiendo la estructura estándar
-        whatsapp_value: Dict[str, Any] = data.get('value', {})
-        whatsapp_messages: List[Dict[str, Any]] = whatsapp_value.get('messages', [])
-        
-        if not whatsapp_messages:
+        if inbound is None:
             logger.warning("No hay mensajes en la carga útil de PubSub")
-            return jsonify({"status": "error", "message": "No messages found in payload"}), 400
-            
-        # Obtener el primer mensaje
-        whatsapp_message : Dict[str, Any] = whatsapp_messages[0]
-        
-        # Extraer información básica del mensaje
-        message_id: str = whatsapp_message.get('id', '')
-        client_phone: str = whatsapp_message.get('from', '')
-        message_type: str = whatsapp_message.get('type', '')
-        
-        # Extraer texto o caption según el tipo de mensaje
-        message_text: Optional[str] = None
-        media_id: Optional[str] = None
-        caption: Optional[str] = None
-        
-        if message_type == 'text':
-            message_text = whatsapp_message.get('text', {}).get('body', '')
-        elif message_type == 'image':
-            media_id = whatsapp_message.get('image', {}).get('id', '')
-            caption = whatsapp_message.get('image', {}).get('caption', '')
-        elif message_type == 'document':
-            media_id = whatsapp_message.get('document', {}).get('id', '')
-            caption = whatsapp_message.get('document', {}).get('caption', '')
-        elif message_type == 'video':
-            media_id = whatsapp_message.get('video', {}).get('id', '')
-            caption = whatsapp_message.get('video', {}).get('caption', '')
-        elif message_type == 'audio':
-            media_id = whatsapp_message.get('audio', {}).get('id', '')
-            caption = whatsapp_message.get('audio', {}).get('caption', '')
-            
-        # Extraer datos de contexto si existe
-        context_data: Optional[Dict[str, Any]] = whatsapp_message.get('context')
-        
-        # Obtener ID del teléfono de negocios
-        metadata: Dict[str, Any] = whatsapp_value.get('metadata', {})
-        phone_business_id: str = metadata.get('phone_number_id', '') or data.get('phone_business_id', '')
-        
+            return reject_message(envelope, ValueError("No messages found in payload"), permanent=True)
+
+        # Información básica del mensaje (el texto o el caption ya viene en ``body``)
+        client_phone: str = inbound.sender or ''
+        message_type: str = inbound.type
+        message_text: Optional[str] = inbound.body if message_type == TEXT else None
+        media_id: Optional[str] = inbound.media_id if message_type in SUPPORTED_TYPES else None
+        caption: Optional[str] = inbound.body if message_type != TEXT else None
+        phone_business_id: str = inbound.phone_number_id or ''
+
         # Construir información de media si existe
         media_data: Dict[str, Any] = {}
         if media_id:
-            media_data = data.get('media', {})
-            if not media_data:
-                # Si no hay datos de media en el mensaje de PubSub, crear una estructura básica
-                media_data = {
-                    'media_id': media_id,
-                    'media_type': message_type
-                }
+            # Si no hay datos de media en el mensaje de PubSub, crear una estructura básica
+            media_data = payload.get('media') or {
+                'media_id': media_id,
+                'media_type': message_type
+            }
 
         # Verificar si es una solicitud de OCR con referencia a un mensaje anterior
-        if (message_type == 'text' and 
+        if (message_type == TEXT and 
             message_text and 
             message_text.lower() == 'ocr' and 
-            context_data and 
-            context_data.get('id')):
+            inbound.context_id):
             
-            context_id: str = context_data.get('id')
+            context_id: str = inbound.context_id
             logger.info(f"Procesando solicitud OCR para mensaje referenciado: {context_id}")
             
             # Procesar la solicitud OCR
             process_ocr_request(context_id, client_phone, phone_business_id)
             return jsonify({"status": "ok"}), 200
+        
+        # Verificar si es un comando de búsqueda ("buscar <palabras>")
+        if message_type == 'text' and message_text and message_text.strip().lower().split(' ', 1)[0] == 'buscar':
+            query: str = message_text.strip()[len('buscar'):].strip()
+            logger.info(f"Procesando búsqueda de {client_phone}: {query}")
+            process_search_request(query, client_phone, phone_business_id)
+            return jsonify({"status": "ok"}), 200
             
         # Verificar si hay media para procesar
-        media_processing_result: Dict[str, Any] = {}
+        batch: Optional[Tuple[str, bool]] = None
         if media_id:
             logger.info(f"Procesando archivo multimedia: {media_id}")
             
             # Si ya tenemos datos de media desde la estructura WhatsApp
-            if media_data and 'media_id' in media_data:
-                media_processing_result = process_media(media_data)
-            else:
-                # Crear estructura de datos básica para el procesamiento
-                basic_media_data: Dict[str, Any] = {
+            if not (media_data and 'media_id' in media_data):
+                media_data = {
                     'media_id': media_id,
                     'media_type': message_type
                 }
-                media_processing_result = process_media(basic_media_data)
             
-            # Construir mensaje de respuesta incluyendo detalles del procesamiento
-            response_message: str = f"Se ha recibido tu mensaje: {caption or ''}\n\n"
+            # Agrupar las ráfagas de archivos de la conversación: solo el primero (líder)
+            # procesa el grupo y responde; los demás se confirman aquí
+            item: Dict[str, Any] = {
+                'media_id': media_id,
+                'media_type': media_data.get('media_type') or message_type,
+                'storage_path': media_data.get('storage_path', ''),
+                'caption': caption or '',
+            }
+            if MediaBatchService.enabled() and client_phone:
+                batch = MediaBatchService.join(client_phone, item)
+            if batch and not batch[1]:
+                logger.info(f"Archivo {media_id} agregado al grupo {batch[0]} de {client_phone}")
+                return jsonify({"status": "batched", "batch_id": batch[0]}), 200
             
-            if media_processing_result.get('success', False):
-                media_type_for_response: str = message_type
-                
-                if media_type_for_response == 'image':
-                    response_message += "Análisis de la imagen:\n"
-                    if media_processing_result.get('ocr_text'):
-                        # Truncar texto OCR si es muy largo
-                        ocr_text: str = media_processing_result.get('ocr_text', '')
-                        truncated_text: str = ocr_text[:100] + "..." if len(ocr_text) > 100 else ocr_text
-                        response_message += f"- Texto detectado: {truncated_text}\n"
-                    if media_processing_result.get('description'):
-                        response_message += f"- Descripción: {media_processing_result.get('description')}\n"
-                
-                elif media_type_for_response == 'document':
-                    response_message += "Análisis del documento:\n"
-                    if media_processing_result.get('ocr_text'):
-                        # Truncar texto OCR si es muy largo
-                        ocr_text: str = media_processing_result.get('ocr_text', '')
-                        truncated_text: str = ocr_text[:100] + "..." if len(ocr_text) > 100 else ocr_text
-                        response_message += f"- Texto extraído: {truncated_text}\n"
-                
-                elif media_type_for_response in ['audio', 'video']:
-                    response_message += f"Análisis del {media_type_for_response}:\n"
-                    if media_processing_result.get('transcription'):
-                        response_message += f"- Transcripción: {media_processing_result.get('transcription')}\n"
-                    if media_processing_result.get('description') and media_type_for_response == 'video':
-                        response_message += f"- Descripción: {media_processing_result.get('description')}\n"
+            items: List[Dict[str, Any]] = MediaBatchService.collect(client_phone, batch[0], item) if batch else [item]
+            if len(items) > 1:
+                response_message: str = format_batch_reply(items, process_media_batch(items))
             else:
-                # Error en el procesamiento del media
-                response_message += f"No se pudo procesar el archivo multimedia. {media_processing_result.get('message', '')}"
+                media_processing_result: Dict[str, Any] = process_media(media_data)
+                
+                # Construir mensaje de respuesta incluyendo detalles del procesamiento
+                response_message: str = f"Se ha recibido tu mensaje: {caption or ''}\n\n"
+                response_message += format_media_result(message_type, media_processing_result)
         else:
             # Respuesta estándar si no hay multimedia
             response_message: str = f"Se ha recibido tu mensaje: {message_text or caption or ''}"
@@ -461,8 +739,10 @@ def handle_pubsub_message() -> Tuple[Any, int]:
         # Enviar respuesta al usuario
         if client_phone and phone_business_id:
             WhatsAppService.send_message(client_phone, response_message, phone_business_id)
+        if batch:
+            MediaBatchService.complete(client_phone, batch[0])
         
         return jsonify({"status": "ok"}), 200
     except Exception as e:
         logger.error(f"Error procesando mensaje: {str(e)}")
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        return reject_message(envelope, e)
\ No newline at end of file
@@ -0,0 +1,169 @@
+# file: /api/routes/registration_flow.py
+
+import random
+import string
+
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from api.config import logger
+from api.services import DocumentConflictError
+from api.models import WhatsAppDevice, User, FlowState
+
+# Reintentos de una transición cuando otro mensaje modificó el dispositivo a la vez
+MAX_TRANSITION_ATTEMPTS: int = 5
+
+def generate_pin(length=6) -> str:
+    """Generate a random PIN of the specified length."""
+    return ''.join(random.choices(string.digits, k=length))
+
+class Transition:
+    def __init__(self, target: str, accepts: Callable[[WhatsAppDevice, str], bool],
+                 reply: Callable[[WhatsAppDevice], str],
+                 fields: Optional[Callable[[WhatsAppDevice, str], Dict[str, Any]]] = None,
+                 after: Optional[Callable[[WhatsAppDevice], None]] = None):
+        """
+        Transición del flujo de registro.
+
+        Args:
+            target: Estado de destino
+            accepts: Si el texto recibido dispara la transición desde el estado actual
+            reply: Mensaje para el usuario, con el dispositivo ya en el estado de destino
+            fields: Campos del dispositivo a escribir junto con el estado (misma escritura)
+            after: Efecto a ejecutar solo si la escritura se confirmó
+        """
+        self.target = target
+        self.accepts = accepts
+        self.reply = reply
+        self.fields = fields
+        self.after = after
+
+def with_context(device: WhatsAppDevice, **updates: Any) -> Dict[str, Any]:
+    return {'context': {**device.context, **updates}}
+
+def is_email(device: WhatsAppDevice, text: str) -> bool:
+    return '@' in text and '.' in text
+
+def name_and_pin(device: WhatsAppDevice, text: str) -> Dict[str, Any]:
+    pin: str = generate_pin()
+    logger.info(f"PIN {pin} generated for {device.context.get('email', 'unknown_email')}")
+    return with_context(device, name=text.strip(), pin=pin)
+
+def new_user(device: WhatsAppDevice, text: str) -> Dict[str, Any]:
+    # El ID se asigna antes para escribirlo en el dispositivo en la misma transición;
+    # el usuario se crea después, solo si la transición se confirmó
+    return {'userId': str(uuid4())}
+
+def create_user(device: WhatsAppDevice) -> None:
+    User(id=device.user_id, name=device.context.get("name", ""), email=device.context.get("email", ""),
+         pin=device.context.get("pin")).create()
+
+# Transiciones posibles desde cada estado, en orden: se aplica la primera que acepta el texto
+TRANSITIONS: Dict[str, List[Transition]] = {
+    FlowState.INITIAL: [
+        Transition(
+            FlowState.AWAITING_EMAIL,
+            accepts=lambda device, text: text.lower() in ["si", "sí", "yes", "registrar", "registrarme"],
+            reply=lambda device: "Por favor, proporciona tu correo electrónico para registrarte."
+        ),
+    ],
+    FlowState.AWAITING_EMAIL: [
+        Transition(
+            FlowState.AWAITING_NAME,
+            accepts=is_email,
+            fields=lambda device, text: with_context(device, email=text.strip().lower()),
+            reply=lambda device: "Gracias. Ahora, por favor proporciónanos tu nombre completo."
+        ),
+    ],
+    FlowState.AWAITING_NAME: [
+        Transition(
+            FlowState.AWAITING_PIN,
+            accepts=lambda device, text: len(text.strip()) > 2,
+            fields=name_and_pin,
+            reply=lambda device: (
+                f"Gracias, {device.context.get('name')}. Hemos enviado un PIN de verificación a tu correo electrónico "
+                f"({device.context.get('email', 'unknown_email')}). Por favor, ingresa ese PIN para completar tu registro."
+            )
+        ),
+    ],
+    FlowState.AWAITING_PIN: [
+        Transition(
+            FlowState.AUTHENTICATED,
+            accepts=lambda device, text: text.strip() == device.context.get("pin"),
+            fields=new_user,
+            after=create_user,
+            reply=lambda device: f"¡Registro exitoso! Bienvenido, {device.context.get('name', '')}. Ahora puedes utilizar nuestra aplicación."
+        ),
+    ],
+}
+
+# Respuesta cuando ninguna transición acepta el texto (el estado no cambia)
+REJECTIONS: Dict[str, str] = {
+    FlowState.INITIAL: "Estimado usuario, no te tenemos registrado en nuestra aplicación.\n¿Deseas registrarte? Responde 'Si' para continuar.",
+    FlowState.AWAITING_EMAIL: "El correo electrónico proporcionado no parece válido. Por favor, ingresa un correo electrónico válido.",
+    FlowState.AWAITING_NAME: "Por favor, proporciona un nombre válido para continuar.",
+    FlowState.AWAITING_PIN: "El PIN ingresado no es correcto. Por favor, verifica e inténtalo de nuevo.",
+}
+
+# Reinicio del registro cuando el usuario del dispositivo ya no existe
+RESET: Transition = Transition(
+    FlowState.INITIAL,
+    accepts=lambda device, text: True,
+    fields=lambda device, text: {'userId': None, 'context': {}},
+    reply=lambda device: "Parece que tu cuenta ya no existe. ¿Deseas registrarte nuevamente?"
+)
+
+def advance(device: WhatsAppDevice, text: Optional[str], send: Callable[[str], Any],
+            transitions: Optional[Dict[str, List[Transition]]] = None) -> WhatsAppDevice:
+    """
+    Aplica al dispositivo la transición que corresponde al texto recibido.
+
+    Cada transición se confirma con una sola escritura condicionada al ``update_time`` del
+    documento leído. Si otro mensaje del mismo número lo cambió entretanto, se relee y se
+    vuelve a evaluar el texto sobre el estado nuevo, así dos mensajes simultáneos no se
+    saltan ni repiten pasos y no hace falta un bloqueo global: las conversaciones
+    distintas nunca compiten. La respuesta se envía solo tras confirmar la escritura.
+
+    Args:
+        device: Dispositivo leído con ``get_by_phone_number`` (o recién creado)
+        text: Texto o caption del mensaje
+        send: Envía un mensaje al usuario
+        transitions: Tabla a usar (por defecto ``TRANSITIONS``)
+
+    Returns:
+        WhatsAppDevice: El dispositivo con el estado resultante
+    """
+    table: Dict[str, List[Transition]] = TRANSITIONS if transitions is None else transitions
+    text = text or ""
+    for attempt in range(1, MAX_TRANSITION_ATTEMPTS + 1):
+        transition: Optional[Transition] = next(
+            (candidate for candidate in table.get(device.flow_state, []) if candidate.accepts(device, text)), None
+        )
+        if transition is None:
+            device.update_last_active()
+            rejection: Optional[str] = REJECTIONS.get(device.flow_state) if transitions is None else None
+            if rejection:
+                send(rejection)
+            return device
+
+        try:
+            device.transition(transition.target, transition.fields(device, text) if transition.fields else None)
+        except DocumentConflictError as e:
+            logger.info(f"Conflicto en la transición de {device.phone_number} (intento {attempt}): {str(e)}")
+            fresh: Optional[WhatsAppDevice] = WhatsAppDevice.get_by_phone_number(device.phone_number)
+            if fresh is None:
+                return device
+            device = fresh
+            continue
+
+        if transition.after:
+            transition.after(device)
+        send(transition.reply(device))
+        return device
+
+    logger.error(f"No se pudo aplicar la transición de {device.phone_number} tras {MAX_TRANSITION_ATTEMPTS} intentos")
+    return device
+
+def reset(device: WhatsAppDevice, send: Callable[[str], Any]) -> WhatsAppDevice:
+    """Vuelve el dispositivo al estado inicial (el usuario asociado ya no existe)."""
+    return advance(device, "", send, transitions={device.flow_state: [RESET]})
@@ -0,0 +1,30 @@
+# file: /api/routes/search.py
+
+from typing import Any, Dict, List, Tuple
+from flask import Blueprint, request, jsonify
+from api.config import logger, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from api.services import SearchIndexService
+from api.routes.decorators import require_api_token
+
+search: Blueprint = Blueprint('search', __name__)
+
+@search.route('/users/<user_id>', methods=['GET'])
+@require_api_token
+def search_user_documents(user_id: str) -> Tuple[Any, int]:
+    """
+    Busca en el texto OCR y los captions de un usuario.
+
+    Parámetros: ``q`` (palabras, todas deben aparecer) y ``limit`` (máximo MAX_PAGE_SIZE).
+    """
+    query: str = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"status": "error", "message": "El parámetro q es obligatorio"}), 400
+
+    try:
+        limit: int = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit debe ser un entero"}), 400
+
+    logger.info(f"Búsqueda del usuario {user_id}: {query}")
+    results: List[Dict[str, Any]] = SearchIndexService.search(user_id, query, limit=limit)
+    return jsonify({"status": "success", "query": query, "data": results}), 200
@@ -1,15 +1,16 @@
 # file: /api/routes/whatsapp_webhook.py
 
-import json
-import random
-import string
 import mimetypes
 
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from flask import Blueprint, request, jsonify
-from api.config import logger, VERIFY_TOKEN
+from api.config import logger, VERIFY_TOKEN, WEBHOOK_DEADLINE_SECONDS
 from api.services import WhatsAppService, PubSubService, StorageService
 from api.models import WhatsAppDevice, WhatsAppMessage, User, WhatsAppMedia, FlowState
+from api.services.payload_parser import InboundMessage, parse_webhook
+from api.services.lanes import classify
+from api.routes.decorators import with_deadline
+from api.routes import registration_flow
 
 whatsapp_webhook : Blueprint = Blueprint('whatsapp_webhook', __name__)
 
@@ -33,77 +34,16 @@ def verify():
     
     return jsonify({"success": False}), 400
 
-def generate_pin(length=6) -> str:
-    """Generate a random PIN of the specified length."""
-    return ''.join(random.choices(string.digits, k=length))
-
-def handle_initial_state(device : WhatsAppDevice, phone_number : str, phone_number_id : str, caption : Optional[str]) -> None:
-    """Handle the initial state for a new user."""
-    if caption.lower() in ["si", "sí", "yes", "registrar", "registrarme"]:
-        device.update_flow_state(FlowState.AWAITING_EMAIL)
-        WhatsAppService.send_message(phone_number, "Por favor, proporciona tu correo electrónico para registrarte.", phone_number_id)
-    else:
-        WhatsAppService.send_message(phone_number, "Estimado usuario, no te tenemos registrado en nuestra aplicación.\n¿Deseas registrarte? Responde 'Si' para continuar.", phone_number_id)
-
-def handle_awaiting_email(device : WhatsAppDevice, phone_number : str, phone_number_id : str, caption : Optional[str]) -> None:
-    """Handle the state where we're waiting for the user's email."""
-    # Simple email validation
-    if '@' in caption and '.' in caption:
-        email = caption.strip().lower()
-        device.update_context({"email": email})
-        device.update_flow_state(FlowState.AWAITING_NAME)
-        WhatsAppService.send_message(phone_number, f"Gracias. Ahora, por favor proporciónanos tu nombre completo.", phone_number_id)
-    else:
-        WhatsAppService.send_message(phone_number, "El correo electrónico proporcionado no parece válido. Por favor, ingresa un correo electrónico válido.", phone_number_id)
-
-def handle_awaiting_name(device : WhatsAppDevice, phone_number : str, phone_number_id : str, caption : Optional[str]) -> None:
-    """Handle the state where we're waiting for the user's name."""
-    if len(caption.strip()) > 2:
-        name : str = caption.strip()
-        device.update_context({"name": name})
-        
-        # Generate a PIN and "send" it to email (just log it for now)
-        pin : str = generate_pin()
-        email : str = device.context.get("email", "unknown_email")
-        logger.info(f"PIN {pin} generated for {email}")
-        
-        # Store the PIN in the device context
-        device.update_context({"pin": pin})
-        device.update_flow_state(FlowState.AWAITING_PIN)
-        
-        WhatsAppService.send_message(phone_number, f"Gracias, {name}. Hemos enviado un PIN de verificación a tu correo electrónico ({email}). Por favor, ingresa ese PIN para completar tu registro.",  phone_number_id)
-    else:
-        WhatsAppService.send_message(phone_number, "Por favor, proporciona un nombre válido para continuar.", phone_number_id)
-
-def handle_awaiting_pin(device : WhatsAppDevice, phone_number : str, phone_number_id : str, caption : Optional[str]) -> None:
-    """Handle the state where we're waiting for the user to enter the PIN."""
-    expected_pin = device.context.get("pin")
-    if caption.strip() == expected_pin:
-        # Create the user
-        user = User(name=device.context.get("name", ""), email=device.context.get("email", ""), pin=expected_pin)
-        user.save()
-        
-        # Update the device with the user ID
-        device.set_user_id(user.id)
-        device.update_flow_state(FlowState.AUTHENTICATED)
-        
-        WhatsAppService.send_message(phone_number, f"¡Registro exitoso! Bienvenido, {user.name}. Ahora puedes utilizar nuestra aplicación.", phone_number_id)
-    else:
-        WhatsAppService.send_message(phone_number, "El PIN ingresado no es correcto. Por favor, verifica e inténtalo de nuevo.", phone_number_id)
-
-def handle_authenticated(device : WhatsAppDevice, phone_number : str, phone_number_id : str, caption : Optional[str], message_data : Dict) -> None:
+def handle_authenticated(device : WhatsAppDevice, phone_number : str, phone_number_id : str, caption : Optional[str], message_data : Dict, lane : Optional[str] = None) -> None:
     """Handle interactions with an authenticated user."""
-    user = User.get_by_id(device.user_id)
+    user = User.get_by_id(device.user_id, fields=['name'])
     if not user:
         # User no longer exists, reset device state
-        device.update_flow_state(FlowState.INITIAL)
-        device.user_id = None
-        device.save()
-        WhatsAppService.send_message(phone_number, "Parece que tu cuenta ya no existe. ¿Deseas registrarte nuevamente?", phone_number_id)
+        registration_flow.reset(device, lambda msg: WhatsAppService.send_message(phone_number, msg, phone_number_id))
         return
     
     # Publish message to PubSub for further processing
-    PubSubService.publish_message(message_data)
+    PubSubService.publish_message(message_data, lane=lane)
 
 def upload_media(media_id : str, media_bytes : bytes, mime_type : str, message_type : str, user_id : str, phone_number : str, sha256 : str, media_metadata : Dict) -> Dict:
     logger.info(f"Archivo multimedia descargado exitosamente: {media_id}")
@@ -165,120 +105,83 @@ def upload_media(media_id : str, media_bytes : bytes, mime_type : str, message_t
     else:
         logger.error(f"Error al subir archivo multimedia a GCS: {media_id}")
 
+def handle_message(message : InboundMessage) -> None:
+    """Register the device and message, store its media and advance the conversation."""
+    phone_number : str = message.sender
+    phone_number_id : Optional[str] = message.phone_number_id
+    caption : str = message.body if message.supported else f"[{message.type} no soportado]"
+    media_id : str = (message.media_id or "") if message.supported else ""
+
+    logger.info(f"Message received from {phone_number}: {caption} - Type: {message.type} - ID: {message.id}")
+    
+    # Get or create device
+    device : WhatsAppDevice = WhatsAppDevice.get_by_phone_number(phone_number)
+    if not device:
+        device : WhatsAppDevice = WhatsAppDevice(phone_number=phone_number)
+        if not device.create():
+            # Otro mensaje del mismo número lo creó a la vez
+            device = WhatsAppDevice.get_by_phone_number(phone_number)
+    
+    # Update last active timestamp (during registration the flow transition writes it)
+    if device.flow_state == FlowState.AUTHENTICATED:
+        device.update_last_active()
+    
+    # Prepare message data for PubSub if needed
+    message_data : Dict = {
+        'message': {
+            'id': message.id,
+            'from': phone_number,
+            'type': message.type,
+            'caption': caption,
+            'media_id': media_id
+        },
+        'value': message.value,
+        'phone_business_id': phone_number_id
+    }
+    
+    # Process media if present
+    if media_id:
+        media_bytes = WhatsAppService.download_whatsapp_media(media_id)
+        
+        if media_bytes:
+            message_data['media'] = upload_media(media_id, media_bytes, message.mime_type, message.type, device.user_id, phone_number, message.sha256, message.media)
+    
+    # Save message to the database
+    whatsapp_message : WhatsAppMessage = WhatsAppMessage.from_inbound(message, user_id=device.user_id)
+    whatsapp_message.save()
+    
+    # Handle the message based on the current flow state (registration transitions in registration_flow.TRANSITIONS)
+    if device.flow_state == FlowState.AUTHENTICATED:
+        handle_authenticated(device, phone_number, phone_number_id, caption, message_data, lane=classify(message))
+    else:
+        registration_flow.advance(device, caption, lambda msg: WhatsAppService.send_message(phone_number, msg, phone_number_id))
+
 @whatsapp_webhook.route('/', methods=['POST'])
+@with_deadline(WEBHOOK_DEADLINE_SECONDS)
 def webhook():
     """
     Process incoming WhatsApp messages and handle login flow.
+
+    The body is decoded straight from the request bytes; every message of every entry
+    is handled in order.
     """
-    data : Dict = request.json
+    raw_body : bytes = request.get_data(cache=False)
     try:
-        # Parse WhatsApp Cloud API structure
-        entry = data.get('entry', [{}])[0]
-        changes = entry.get('changes', [{}])[0]
-        value = changes.get('value', {})
-        messages = value.get('messages', [])
-        
-        if not messages:
-            return jsonify({"success": True}), 200
-        
-        logger.info(f"Webhook received: {json.dumps(data)}")
-            
-        message = messages[0]
-        message_id = message.get('id')
-        phone_number = message.get('from')
-        message_type = message.get('type')
-        phone_number_id = value.get('metadata', {}).get('phone_number_id')
+        messages : List[InboundMessage] = parse_webhook(raw_body)
+    except ValueError as e:
+        logger.warning(f"Invalid webhook body: {str(e)}")
+        return jsonify({"success": False, "error": "Invalid JSON body"}), 400
 
-        # Extract message content
-        caption = ""
-        media_id = ""
-        mime_type = ""
-        sha256 = ""
-        media_metadata = {}
+    if not messages:
+        return jsonify({"success": True}), 200
 
-        if message_type == 'text':
-            caption = message.get('text', {}).get('body', '')
-        elif message_type == 'image':
-            caption = message.get('image', {}).get('caption', '')
-            media_id = message.get('image', {}).get('id', '')
-            mime_type = message.get('image', {}).get('mime_type', '')
-            sha256 = message.get('image', {}).get('sha256', '')
-            media_metadata = message.get('image', {})
-        elif message_type == 'video':
-            caption = message.get('video', {}).get('caption', '')
-            media_id = message.get('video', {}).get('id', '')
-            mime_type = message.get('video', {}).get('mime_type', '')
-            sha256 = message.get('video', {}).get('sha256', '')
-            media_metadata = message.get('video', {})
-        elif message_type == 'audio':
-            caption = message.get('audio', {}).get('caption', '')
-            media_id = message.get('audio', {}).get('id', '')
-            mime_type = message.get('audio', {}).get('mime_type', '')
-            sha256 = message.get('audio', {}).get('sha256', '')
-            media_metadata = message.get('audio', {})
-        elif message_type == 'document':
-            caption = message.get('document', {}).get('caption', '')
-            media_id = message.get('document', {}).get('id', '')
-            mime_type = message.get('document', {}).get('mime_type', '')
-            sha256 = message.get('document', {}).get('sha256', '')
-            media_metadata = message.get('document', {})
-        else:
-            caption = f"[{message_type} no soportado]"
-        
-        logger.info(f"Message received from {phone_number}: {caption} - Type: {message_type} - ID: {message_id}")
-        
-        # Get or create device
-        device : WhatsAppDevice = WhatsAppDevice.get_by_phone_number(phone_number)
-        if not device:
-            device : WhatsAppDevice = WhatsAppDevice(phone_number=phone_number)
-            device.save()
-        
-        # Update last active timestamp
-        device.update_last_active()
-        
-        # Prepare message data for PubSub if needed
-        message_data : Dict = {
-            'message': {
-                'id': message_id,
-                'from': phone_number,
-                'type': message_type,
-                'caption': caption,
-                'media_id': media_id
-            },
-            'value': value,
-            'phone_business_id': phone_number_id
-        }
-        
-        # Process media if present
-        if media_id:
-            # Add media processing here if needed
-            media_bytes = WhatsAppService.download_whatsapp_media(media_id)
-            
-            if media_bytes:
-                message_data['media'] = upload_media(media_id, media_bytes, mime_type, message_type, device.user_id, phone_number, sha256, media_metadata)
-        
-        # Save message to the database
-        whatsapp_message : WhatsAppMessage = WhatsAppMessage.from_dict({
-            "id": message_id,
-            "value": value,
-            "user_id": device.user_id
-        })
-        whatsapp_message.save()
-        
-        # Handle the message based on the current flow state
-        if device.flow_state == FlowState.INITIAL:
-            handle_initial_state(device, phone_number, phone_number_id, caption)
-        elif device.flow_state == FlowState.AWAITING_EMAIL:
-            handle_awaiting_email(device, phone_number, phone_number_id, caption)
-        elif device.flow_state == FlowState.AWAITING_NAME:
-            handle_awaiting_name(device, phone_number, phone_number_id, caption)
-        elif device.flow_state == FlowState.AWAITING_PIN:
-            handle_awaiting_pin(device, phone_number, phone_number_id, caption)
-        elif device.flow_state == FlowState.AUTHENTICATED:
-            handle_authenticated(device, phone_number, phone_number_id, caption, message_data)
+    try:
+        logger.info(f"Webhook received: {raw_body.decode('utf-8', errors='replace')}")
+        for message in messages:
+            handle_message(message)
         
         return jsonify({"success": True}), 200
     
     except Exception as e:
         logger.error(f"Error processing webhook: {str(e)}")
-        return jsonify({"success": False, "error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)}), 500
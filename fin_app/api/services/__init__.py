@@ -1,14 +1,26 @@
+from .document_backends import DocumentConflictError
 from .firestore_service import FirestoreService, get_firestore_client
 from .whatsapp_service import WhatsAppService
 from .pubsub_service import PubSubService
 from .cloud_storage_service import StorageService
 from .ai_services import AIServices
+from .message_archive_service import MessageArchiveService
+from .search_index_service import SearchIndexService
+from .financial_extraction_service import FinancialExtractionService
+from .dead_letter_service import DeadLetterService
+from .media_batch_service import MediaBatchService
 
 __all__ = [
     'FirestoreService',
+    'DocumentConflictError',
     'get_firestore_client',
     'WhatsAppService',
     'PubSubService',
     'StorageService',
     'AIServices',
+    'MessageArchiveService',
+    'SearchIndexService',
+    'FinancialExtractionService',
+    'DeadLetterService',
+    'MediaBatchService',
 ]
\ No newline at end of file
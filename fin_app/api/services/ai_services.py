@@ -1,9 +1,17 @@
 # file: /api/services/ai_services.py
 
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 from api.config import logger
+from api.services.dependency_guard import DependencyUnavailableError, guard
+from api.services.deadline import DeadlineExceededError, remaining_timeout
+
 from google.cloud import vision
 
+# Timeout máximo (segundos) de cada llamada a Vision
+VISION_TIMEOUT: float = 30.0
+# Imágenes por solicitud de batch_annotate_images (límite de la API síncrona)
+VISION_BATCH_SIZE: int = 16
+
 class AIServices:
     @staticmethod
     def extract_image_ocr(image_bytes: bytes) -> str:
@@ -21,7 +29,8 @@ class AIServices:
             image: vision.Image = vision.Image(content=image_bytes)
             
             # Realizar petición de detección de texto
-            response = client.text_detection(image=image)
+            with guard("vision").attempt():
+                response = client.text_detection(image=image, timeout=remaining_timeout(VISION_TIMEOUT))
             texts: List = response.text_annotations
             
             # Verificar si hay errores
@@ -39,6 +48,9 @@ class AIServices:
                 logger.info("OCR completado, pero no se encontró texto en la imagen.")
                 
             return full_text
+        except (DependencyUnavailableError, DeadlineExceededError):
+            # Se propaga para que quien llama responda con el mensaje de respaldo
+            raise
         except Exception as e:
             logger.error(f"Error en el procesamiento OCR: {str(e)}")
             return ""
@@ -74,7 +86,8 @@ class AIServices:
             image: vision.Image = vision.Image(content=image_bytes)
             
             # Realizar análisis de etiquetas
-            response = client.label_detection(image=image)
+            with guard("vision").attempt():
+                response = client.label_detection(image=image, timeout=remaining_timeout(VISION_TIMEOUT))
             labels = response.label_annotations
             
             if response.error.message:
@@ -82,14 +95,72 @@ class AIServices:
                 return ""
             
             # Generar descripción basada en las etiquetas encontradas
-            if labels:
-                top_labels: List[str] = [label.description for label in labels[:5]]
-                description: str = f"La imagen contiene: {', '.join(top_labels)}"
-                logger.info(f"Análisis de imagen completado exitosamente.")
-                return description
-            else:
-                logger.info("Análisis de imagen completado, pero no se encontraron etiquetas.")
-                return "No se pudieron identificar elementos en la imagen"
+            return AIServices.describe_labels(labels)
+        except (DependencyUnavailableError, DeadlineExceededError):
+            raise
         except Exception as e:
             logger.error(f"Error en el análisis de imagen: {str(e)}")
-            return ""
\ No newline at end of file
+            return ""
+
+    @staticmethod
+    def describe_labels(labels: Sequence) -> str:
+        """Descripción de una imagen a partir de sus etiquetas de Vision (las 5 primeras)."""
+        if labels:
+            top_labels: List[str] = [label.description for label in labels[:5]]
+            logger.info("Análisis de imagen completado exitosamente.")
+            return f"La imagen contiene: {', '.join(top_labels)}"
+        logger.info("Análisis de imagen completado, pero no se encontraron etiquetas.")
+        return "No se pudieron identificar elementos en la imagen"
+
+    @staticmethod
+    def annotate_images(images: Sequence[Optional[bytes]], with_labels: Sequence[bool] = ()) -> List[Tuple[str, str]]:
+        """
+        OCR (y opcionalmente etiquetas) de varias imágenes con ``batch_annotate_images``.
+
+        Una ráfaga de fotos se analiza en una solicitud por cada ``VISION_BATCH_SIZE``
+        imágenes en lugar de una o dos por imagen.
+
+        Args:
+            images: Bytes de cada imagen; las posiciones con None se omiten
+            with_labels: Por posición, si se piden también las etiquetas de la imagen
+
+        Returns:
+            List[Tuple[str, str]]: ``(texto OCR, descripción)`` de cada posición; vacíos si
+                no hubo imagen o Vision devolvió un error para ella
+        """
+        results: List[Tuple[str, str]] = [("", "")] * len(images)
+        positions: List[int] = [index for index, image in enumerate(images) if image]
+        if not positions:
+            return results
+
+        try:
+            client: vision.ImageAnnotatorClient = vision.ImageAnnotatorClient()
+            for start in range(0, len(positions), VISION_BATCH_SIZE):
+                chunk: List[int] = positions[start:start + VISION_BATCH_SIZE]
+                requests: List[vision.AnnotateImageRequest] = []
+                for index in chunk:
+                    features: List[vision.Feature] = [vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)]
+                    if index < len(with_labels) and with_labels[index]:
+                        features.append(vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION))
+                    requests.append(vision.AnnotateImageRequest(image=vision.Image(content=images[index]), features=features))
+
+                with guard("vision").attempt():
+                    batch = client.batch_annotate_images(requests=requests, timeout=remaining_timeout(VISION_TIMEOUT))
+
+                for index, response in zip(chunk, batch.responses):
+                    if response.error.message:
+                        logger.error(f"Error en el análisis de la imagen {index} del lote: {response.error.message}")
+                        continue
+                    ocr_text: str = response.text_annotations[0].description if response.text_annotations else ""
+                    description: str = ""
+                    if index < len(with_labels) and with_labels[index]:
+                        description = AIServices.describe_labels(response.label_annotations)
+                    results[index] = (ocr_text, description)
+
+            logger.info(f"Análisis en lote completado para {len(positions)} imágenes")
+            return results
+        except (DependencyUnavailableError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            logger.error(f"Error en el análisis en lote de imágenes: {str(e)}")
+            return results
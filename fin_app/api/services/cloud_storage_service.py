@@ -1,34 +1,102 @@
 # api.services.cloud_storage_service.py
 
+import hashlib
 import mimetypes
 from datetime import datetime
-from typing import Optional, Tuple
-from google.cloud import storage
-from google.cloud.storage.bucket import Bucket
-from google.cloud.storage.blob import Blob
-from api.config import logger, GOOGLE_CLOUD_PROJECT, CLOUD_STORAGE_BUCKET
-
-# Inicializar el cliente de Storage
-storage_client: storage.Client = storage.Client(project=GOOGLE_CLOUD_PROJECT)
+from typing import Iterable, List, Optional, Tuple
+from api.config import (
+    logger,
+    CLOUD_STORAGE_BUCKET,
+    MEDIA_KEY_LAYOUT,
+    MEDIA_KEY_HASH_CHARS,
+    SIGNED_URL_TTL_SECONDS,
+    SIGNED_URL_CACHE_SIZE,
+)
+from api.services.media_cache import media_cache
+from api.services.dependency_guard import DependencyUnavailableError
+from api.services.deadline import DeadlineExceededError
+from api.services.signed_url_cache import SignedUrlCache
+from api.services.storage_backends import (
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_TIMEOUT,
+    MediaStream,
+    StorageBackend,
+    create_backend,
+)
+
+# Backend de almacenamiento (GCS o sistema de archivos local, según STORAGE_BACKEND)
+backend: StorageBackend = create_backend()
 bucket_name: str = CLOUD_STORAGE_BUCKET
 
 # Asegurarse de que existe un bucket para el proyecto
 try:
-    bucket: Bucket = storage_client.bucket(bucket_name)
-    if not bucket.exists():
-        logger.warning(f"El bucket {bucket_name} no existe. Creando...")
-        bucket: Bucket = storage_client.create_bucket(bucket_name)
-        logger.info(f"Bucket {bucket_name} creado exitosamente.")
-    else:
-        logger.info(f"Usando bucket existente: {bucket_name}")
+    backend.ensure_bucket(bucket_name)
 except Exception as e:
     logger.error(f"Error al inicializar el bucket de storage: {str(e)}")
 
+signed_url_cache: SignedUrlCache = SignedUrlCache(SIGNED_URL_CACHE_SIZE, SIGNED_URL_TTL_SECONDS)
+
+MEDIA_PREFIX: str = "whatsapp_media"
+
+def media_key_hash(media_id: str) -> str:
+    """Prefijo corto y uniforme derivado del media_id (``MEDIA_KEY_HASH_CHARS`` caracteres hex)."""
+    return hashlib.md5(media_id.encode("utf-8")).hexdigest()[:MEDIA_KEY_HASH_CHARS]
+
+def build_media_path(media_type: str, file_name: str, when: Optional[datetime] = None, layout: Optional[str] = None) -> str:
+    """
+    Ruta del objeto de un archivo multimedia según el esquema de claves.
+
+    - ``dated``: ``whatsapp_media/{tipo}/{AAAA/MM/DD}/{archivo}``. Todas las escrituras
+      del día caen en el mismo rango de claves y GCS las limita en ráfagas.
+    - ``hashed``: ``whatsapp_media/{hash}/{tipo}/{AAAA/MM/DD}/{archivo}``, con el hash del
+      nombre del archivo sin extensión (el media_id), que reparte las escrituras entre
+      rangos de claves independientes.
+    """
+    current_date: str = (when or datetime.now()).strftime("%Y/%m/%d")
+    dated_path: str = f"{MEDIA_PREFIX}/{media_type}/{current_date}/{file_name}"
+    if (layout or MEDIA_KEY_LAYOUT) == "hashed":
+        return hashed_media_path(dated_path)
+    return dated_path
+
+def hashed_media_path(object_path: str) -> str:
+    """Convierte una ruta del esquema ``dated`` al esquema ``hashed`` (idempotente)."""
+    if not object_path.startswith(f"{MEDIA_PREFIX}/") or is_hashed_media_path(object_path):
+        return object_path
+    file_name: str = object_path.rsplit("/", 1)[-1]
+    media_id: str = file_name.rsplit(".", 1)[0]
+    return f"{MEDIA_PREFIX}/{media_key_hash(media_id)}/{object_path[len(MEDIA_PREFIX) + 1:]}"
+
+def is_hashed_media_path(object_path: str) -> bool:
+    parts: List[str] = object_path.split("/")
+    if len(parts) < 3 or parts[0] != MEDIA_PREFIX:
+        return False
+    media_id: str = parts[-1].rsplit(".", 1)[0]
+    return parts[1] == media_key_hash(media_id)
+
+def alternate_media_path(object_path: str) -> Optional[str]:
+    """
+    Ruta equivalente del mismo archivo en el otro esquema de claves.
+
+    Permite seguir leyendo rutas guardadas en ``WhatsAppMedia.storage_path`` mientras
+    la migración mueve los objetos: el esquema ``hashed`` se deriva del ``dated`` y viceversa.
+    """
+    if not object_path.startswith(f"{MEDIA_PREFIX}/"):
+        return None
+    if is_hashed_media_path(object_path):
+        head, _, rest = object_path[len(MEDIA_PREFIX) + 1:].partition("/")
+        return f"{MEDIA_PREFIX}/{rest}"
+    return hashed_media_path(object_path)
+
 class StorageService:
+    @staticmethod
+    def storage_uri(bucket_name: str, object_path: str) -> str:
+        """Ruta guardada de un objeto, con el esquema del backend (``gs://bucket/objeto``)."""
+        return f"{backend.scheme}://{bucket_name}/{object_path}"
+
     @staticmethod
     def upload_file(file_bytes: bytes, media_id: str, media_type: str, content_type: Optional[str] = None) -> Tuple[bool, str, str]:
         """
-        Sube un archivo al bucket de Google Cloud Storage.
+        Sube un archivo al bucket configurado.
         
         Args:
             file_bytes: Bytes del archivo a subir
@@ -72,34 +140,28 @@ class StorageService:
             elif not extension and media_type == "document":
                 extension = ".pdf"
             
-            # Generar fecha para organización de archivos
-            current_date: str = datetime.now().strftime("%Y/%m/%d")
-            
-            # Construir la ruta del archivo en GCS
-            storage_path: str = f"whatsapp_media/{media_type}/{current_date}/{media_id}{extension}"
-            
-            # Obtener el bucket
-            bucket: Bucket = storage_client.bucket(bucket_name)
-            
-            # Crear el objeto blob
-            blob: Blob = bucket.blob(storage_path)
-            
-            # Establecer el tipo de contenido
-            blob.content_type = content_type
+            # Construir la ruta del archivo según el esquema de claves configurado
+            storage_path: str = build_media_path(media_type, f"{media_id}{extension}")
             
             # Subir el archivo
-            blob.upload_from_string(file_bytes, content_type=content_type)
+            generation: Optional[int] = backend.put_stream(bucket_name, storage_path, file_bytes, content_type=content_type)
+            
+            # Dejar una copia local: el procesamiento suele llegar a esta misma instancia
+            if backend.remote:
+                media_cache.put(bucket_name, storage_path, file_bytes, generation)
             
-            logger.info(f"Archivo subido exitosamente a: gs://{bucket_name}/{storage_path}")
-            return True, f"gs://{bucket_name}/{storage_path}", content_type
+            uri: str = StorageService.storage_uri(bucket_name, storage_path)
+            logger.info(f"Archivo subido exitosamente a: {uri}")
+            return True, uri, content_type
         except Exception as e:
-            logger.error(f"Error al subir archivo a GCS: {str(e)}")
+            logger.error(f"Error al subir archivo al almacenamiento: {str(e)}")
             return False, "", ""
     
     @staticmethod
     def download_file(bucket_name: str, object_path: str) -> Tuple[bool, Optional[bytes]]:
         """
-        Descarga un archivo desde Google Cloud Storage.
+        Descarga un archivo del almacenamiento, sirviéndolo desde la caché local en disco
+        si ya se subió o descargó en esta instancia.
         
         Args:
             bucket_name: Nombre del bucket
@@ -109,26 +171,184 @@ class StorageService:
             Tuple[bool, Optional[bytes]]: Tupla de (éxito, contenido del archivo en bytes)
         """
         try:
-            # Obtener el bucket
-            bucket: Bucket = storage_client.bucket(bucket_name)
+            # Caché local o una sola lectura del backend (sin exists() previo); al leerse
+            # completo, el archivo queda en la caché
+            stream: Optional[MediaStream] = StorageService.open_stream(bucket_name, object_path)
             
-            # Obtener el blob
-            blob: Blob = bucket.blob(object_path)
+            # El registro puede apuntar a la ruta del otro esquema si el objeto se migró
+            alternate_path: Optional[str] = alternate_media_path(object_path)
+            if stream is None and alternate_path:
+                logger.info(f"Probando la ruta alternativa {StorageService.storage_uri(bucket_name, alternate_path)}")
+                object_path = alternate_path
+                stream = StorageService.open_stream(bucket_name, object_path)
             
-            # Verificar si el blob existe
-            if not blob.exists():
-                logger.error(f"El archivo no existe en GCS: gs://{bucket_name}/{object_path}")
+            if stream is None:
                 return False, None
             
-            # Descargar el archivo
-            file_bytes: bytes = blob.download_as_bytes()
+            with stream:
+                file_bytes: bytes = stream.read()
             
-            logger.info(f"Archivo descargado exitosamente desde: gs://{bucket_name}/{object_path}")
+            logger.info(f"Archivo descargado exitosamente desde: {StorageService.storage_uri(bucket_name, object_path)}")
             return True, file_bytes
+        except (DependencyUnavailableError, DeadlineExceededError):
+            # Se propaga para distinguir una caída de GCS de un archivo inexistente
+            raise
         except Exception as e:
-            logger.error(f"Error al descargar archivo desde GCS: {str(e)}")
+            logger.error(f"Error al descargar archivo del almacenamiento: {str(e)}")
             return False, None
     
+    @staticmethod
+    def open_stream(bucket_name: str, object_path: str, start: int = 0, end: Optional[int] = None,
+                    if_generation_match: Optional[int] = None, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                    timeout: float = DOWNLOAD_TIMEOUT) -> Optional[MediaStream]:
+        """
+        Abre un objeto para leerlo en streaming (en GCS, con una sola petición HTTP).
+
+        Args:
+            bucket_name: Nombre del bucket
+            object_path: Ruta del objeto dentro del bucket
+            start: Primer byte a leer; un valor negativo pide los últimos ``-start`` bytes
+                (p. ej. ``-2048`` para el trailer de un PDF)
+            end: Byte final exclusivo (None hasta el final del objeto)
+            if_generation_match: Solo leer si el objeto tiene esta generación
+            chunk_size: Tamaño de los bloques de ``iter_chunks()``
+            timeout: Tiempo máximo de conexión y entre bloques, en segundos (recortado al
+                presupuesto de la solicitud; el stream se corta si el presupuesto se agota)
+
+        Returns:
+            Optional[MediaStream]: Stream abierto (hay que cerrarlo o consumirlo) o None si
+            el objeto no existe, la generación no coincide o el rango no es válido
+        """
+        uri: str = StorageService.storage_uri(bucket_name, object_path)
+        try:
+            entry: Optional[Tuple[int, int]] = media_cache.lookup(bucket_name, object_path) if backend.remote else None
+            if entry and if_generation_match in (None, entry[0]):
+                cache_start: int = max(entry[1] + start, 0) if start < 0 else start
+                cached: Optional[bytes] = media_cache.read(bucket_name, object_path, cache_start, end, generation=entry[0])
+                if cached is not None:
+                    logger.info(f"Archivo servido desde la caché local: {uri}")
+                    return MediaStream(bucket_name, object_path, entry[0], None, None, entry[1],
+                                       cache_start, cache_start + len(cached), iter([cached]))
+
+            return backend.open_stream(bucket_name, object_path, start, end, if_generation_match, chunk_size, timeout)
+        except (DependencyUnavailableError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            logger.error(f"Error al abrir el archivo {uri}: {str(e)}")
+            return None
+
+    @staticmethod
+    def put_stream(bucket_name: str, object_path: str, chunks: Iterable[bytes], content_type: Optional[str] = None,
+                   if_absent: bool = False) -> Optional[int]:
+        """
+        Escribe un objeto a partir de bloques de bytes, sin reunirlos en memoria.
+
+        Returns:
+            Optional[int]: Generación del objeto escrito
+
+        Raises:
+            ObjectExistsError: Si ``if_absent`` y el objeto ya existe
+        """
+        return backend.put_stream(bucket_name, object_path, chunks, content_type=content_type, if_absent=if_absent)
+
+    @staticmethod
+    def exists(bucket_name: str, object_path: str) -> bool:
+        """Si el objeto existe; False también si no se pudo consultar."""
+        try:
+            return backend.exists(bucket_name, object_path)
+        except Exception as e:
+            logger.error(f"Error al consultar {StorageService.storage_uri(bucket_name, object_path)}: {str(e)}")
+            return False
+
+    @staticmethod
+    def copy_object(source_bucket_name: str, source_path: str, destination_path: str,
+                    destination_bucket_name: Optional[str] = None) -> bool:
+        """
+        Copia un objeto dentro del almacenamiento (en GCS, con ``rewrite``, sin pasar los
+        bytes por esta instancia). Solo crea el destino si no existe; si ya existe se
+        considera copiado.
+
+        Returns:
+            bool: True si el destino existe al terminar
+        """
+        destination_bucket_name = destination_bucket_name or source_bucket_name
+        source_uri: str = StorageService.storage_uri(source_bucket_name, source_path)
+        try:
+            if not backend.copy(source_bucket_name, source_path, destination_bucket_name, destination_path):
+                logger.error(f"No existe el objeto a copiar {source_uri}")
+                return False
+            logger.info(f"Objeto copiado de {source_uri} a {StorageService.storage_uri(destination_bucket_name, destination_path)}")
+            return True
+        except Exception as e:
+            logger.error(f"Error al copiar {source_uri}: {str(e)}")
+            return False
+
+    @staticmethod
+    def delete_object(bucket_name: str, object_path: str) -> bool:
+        """Elimina un objeto; devuelve False si no existía o no se pudo eliminar."""
+        try:
+            return backend.delete(bucket_name, object_path)
+        except Exception as e:
+            logger.error(f"Error al eliminar {StorageService.storage_uri(bucket_name, object_path)}: {str(e)}")
+            return False
+
+    @staticmethod
+    def parse_storage_path(storage_path: Optional[str]) -> Tuple[str, str]:
+        """
+        Separa una ruta ``gs://bucket/objeto`` (o ``local://bucket/objeto``) en (bucket, objeto).
+
+        Las rutas sin prefijo se interpretan dentro del bucket configurado. Devuelve
+        cadenas vacías si la ruta no es válida.
+        """
+        if not storage_path:
+            return "", ""
+        scheme, separator, rest = storage_path.partition("://")
+        if not separator:
+            return (bucket_name, storage_path.lstrip("/")) if bucket_name else ("", "")
+        parts: List[str] = rest.split("/", 1)
+        if len(parts) != 2 or not parts[0] or not parts[1]:
+            return "", ""
+        return parts[0], parts[1]
+
+    @staticmethod
+    def read_range(bucket_name: str, object_path: str, start: int, end: Optional[int] = None) -> Optional[bytes]:
+        """Lee solo un rango de bytes de un objeto (ver ``open_stream``); None si no se pudo leer."""
+        stream: Optional[MediaStream] = StorageService.open_stream(bucket_name, object_path, start, end)
+        if stream is None:
+            return None
+        with stream:
+            return stream.read()
+
+    @staticmethod
+    def get_signed_url(storage_path: str, response_disposition: Optional[str] = None) -> str:
+        """
+        URL firmada para descargar el archivo: en GCS (V4, GET) directamente desde el
+        bucket, sin que los bytes pasen por esta instancia; con el backend local, desde
+        ``/media`` de esta API.
+
+        La URL es válida durante ``SIGNED_URL_TTL_SECONDS`` y se reutiliza desde la caché
+        mientras le quede al menos la mitad de su vigencia.
+
+        Args:
+            storage_path: Ruta ``gs://bucket/objeto``
+            response_disposition: Valor opcional de Content-Disposition para la descarga
+
+        Returns:
+            str: URL firmada o cadena vacía si no se pudo generar
+        """
+        bucket_name, object_path = StorageService.parse_storage_path(storage_path)
+        if not (bucket_name and object_path):
+            return ""
+
+        def sign(ttl: int) -> str:
+            return backend.sign_url(bucket_name, object_path, ttl, response_disposition)
+
+        try:
+            return signed_url_cache.get((bucket_name, object_path, response_disposition), sign)
+        except Exception as e:
+            logger.error(f"Error al firmar la URL de {storage_path}: {str(e)}")
+            return ""
+
     @staticmethod
     def get_public_url(storage_path: str) -> str:
         """
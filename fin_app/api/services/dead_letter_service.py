@@ -0,0 +1,127 @@
+# file: /api/services/dead_letter_service.py
+
+import json
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from api.config import (
+    logger,
+    COLLECTION_PUBSUB_ATTEMPTS,
+    COLLECTION_PUBSUB_DEAD_LETTERS,
+    PUBSUB_ATTEMPTS_TTL_HOURS,
+    PUBSUB_MAX_DELIVERY_ATTEMPTS,
+)
+from api.services.firestore_service import FirestoreService
+
+PENDING = "pending"
+REPLAYED = "replayed"
+
+# Payloads más grandes no se copian al mensaje muerto: se reconstruyen desde el mensaje crudo
+MAX_STORED_PAYLOAD_BYTES: int = 256 * 1024
+
+class DeadLetterService:
+    """
+    Intentos de entrega de los mensajes de Pub/Sub y colección de mensajes muertos.
+
+    Un mensaje que falla ``PUBSUB_MAX_DELIVERY_ATTEMPTS`` veces se guarda con el motivo del
+    fallo y se confirma (2xx) para que Pub/Sub deje de reenviarlo; después se puede
+    reencolar con ``python -m tools.replay_dead_letters``.
+    """
+
+    @staticmethod
+    def register_failure(message_id: str, delivery_attempt: Optional[int] = None) -> int:
+        """
+        Registra un intento fallido y devuelve el número de intentos del mensaje.
+
+        Usa ``deliveryAttempt`` de Pub/Sub si la suscripción lo envía (tiene política de
+        mensajes muertos) y si no un contador propio en Firestore. Si el contador no se
+        puede actualizar devuelve 1, así un fallo de Firestore nunca descarta mensajes.
+
+        El contador de un mensaje que después se procesa bien no se borra (costaría una
+        escritura por cada mensaje): lleva ``expires_at`` y la política TTL de Firestore
+        sobre ese campo lo elimina cuando Pub/Sub ya no puede reenviar el mensaje.
+        """
+        if delivery_attempt:
+            return delivery_attempt
+        try:
+            now: datetime = datetime.now(timezone.utc)
+            return FirestoreService.increment(
+                COLLECTION_PUBSUB_ATTEMPTS, message_id, "attempts",
+                extra={"last_attempt_at": now, "expires_at": now + timedelta(hours=PUBSUB_ATTEMPTS_TTL_HOURS)}
+            )
+        except Exception as e:
+            logger.error(f"No se pudo registrar el intento del mensaje {message_id}: {str(e)}")
+            return 1
+
+    @staticmethod
+    def exhausted(attempts: int) -> bool:
+        return attempts >= PUBSUB_MAX_DELIVERY_ATTEMPTS
+
+    @staticmethod
+    def is_dead_lettered(message_id: str) -> bool:
+        """
+        Indica si el mensaje ya está en la colección de mensajes muertos (una reentrega o
+        un duplicado de un mensaje que agotó sus intentos). Si no se puede consultar
+        devuelve False para no descartar mensajes.
+        """
+        try:
+            return FirestoreService.exists(COLLECTION_PUBSUB_DEAD_LETTERS, message_id)
+        except Exception as e:
+            logger.error(f"No se pudo consultar el mensaje muerto {message_id}: {str(e)}")
+            return False
+
+    @staticmethod
+    def dead_letter(message_id: str, payload: Optional[Dict[str, Any]], lane: str, attempts: int, error: BaseException) -> bool:
+        """
+        Guarda el mensaje en la colección de mensajes muertos.
+
+        El documento se crea solo si no existe, así un duplicado del mensaje no reinicia el
+        estado (``replayed``) de uno ya reencolado. El contador de intentos no se borra: un
+        reenvío posterior ve los intentos agotados y su TTL (``expires_at``) lo elimina.
+
+        Args:
+            message_id: ID del mensaje de Pub/Sub (ID del documento)
+            payload: Payload decodificado; si es muy grande solo se guarda el ID del mensaje
+                de WhatsApp, que apunta al payload crudo (``MessageArchiveService.load_raw``)
+            lane: Carril del mensaje
+            attempts: Intentos realizados
+            error: Excepción del último intento
+
+        Returns:
+            bool: True si se guardó o ya estaba guardado
+        """
+        messages = ((payload or {}).get("value") or {}).get("messages") or [{}]
+        stored: Optional[Dict[str, Any]] = payload
+        if payload is not None and len(json.dumps(payload).encode("utf-8")) > MAX_STORED_PAYLOAD_BYTES:
+            stored = None
+
+        try:
+            created = FirestoreService.create_if_absent(COLLECTION_PUBSUB_DEAD_LETTERS, message_id, {
+                "message_id": message_id,
+                "whatsapp_message_id": messages[0].get("id"),
+                "lane": lane,
+                "attempts": attempts,
+                "error_type": type(error).__name__,
+                "reason": str(error)[:1000],
+                "payload": stored,
+                "status": PENDING,
+                "created_at": datetime.now(timezone.utc),
+            })
+            if created is None:
+                logger.warning(f"El mensaje {message_id} ya estaba en mensajes muertos")
+                return True
+            logger.error(f"Mensaje {message_id} enviado a mensajes muertos tras {attempts} intentos: {str(error)}")
+            return True
+        except Exception as e:
+            logger.error(f"No se pudo guardar el mensaje muerto {message_id}: {str(e)}")
+            return False
+
+    @staticmethod
+    def mark_replayed(message_id: str, replay_message_id: str) -> bool:
+        updated = FirestoreService.update_document(COLLECTION_PUBSUB_DEAD_LETTERS, message_id, {
+            "status": REPLAYED,
+            "replayed_at": datetime.now(timezone.utc),
+            "replay_message_id": replay_message_id,
+        }, read_back=False)
+        return updated is not None
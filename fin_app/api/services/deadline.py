@@ -0,0 +1,61 @@
+# file: /api/services/deadline.py
+
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# Menor timeout que vale la pena usar: con menos tiempo la llamada casi seguro vencería
+MIN_TIMEOUT: float = 0.5
+
+class DeadlineExceededError(Exception):
+    """Se agotó el presupuesto de tiempo de la solicitud antes de hacer una llamada."""
+
+# Instante (time.monotonic) en que vence la solicitud actual; None sin límite
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """
+    Establece el presupuesto de tiempo de la solicitud actual.
+
+    Si ya hay uno más estricto se conserva. Las tareas enviadas a otros hilos lo heredan
+    solo si se ejecutan con ``contextvars.copy_context()`` (como hace ``TaskGraph``).
+    """
+    current: Optional[float] = _deadline.get()
+    new: float = time.monotonic() + seconds
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Segundos que quedan del presupuesto (None si no hay límite)."""
+    deadline: Optional[float] = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def expired() -> bool:
+    left: Optional[float] = remaining()
+    return left is not None and left < MIN_TIMEOUT
+
+def remaining_timeout(cap: float, strict: bool = True) -> float:
+    """
+    Timeout para una llamada saliente: ``cap`` recortado a lo que queda del presupuesto.
+
+    Args:
+        cap: Timeout máximo propio de la llamada
+        strict: Si es True y el presupuesto se agotó, lanza ``DeadlineExceededError`` en
+            lugar de hacer una llamada que no alcanzaría a terminar. Con False se usa al
+            menos ``MIN_TIMEOUT`` (para llamadas baratas que conviene intentar igual,
+            como enviar la respuesta al usuario)
+    """
+    left: Optional[float] = remaining()
+    if left is None:
+        return cap
+    if left < MIN_TIMEOUT:
+        if strict:
+            raise DeadlineExceededError(f"Presupuesto de tiempo agotado ({left:.2f}s restantes)")
+        return MIN_TIMEOUT
+    return min(cap, left)
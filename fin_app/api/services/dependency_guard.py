@@ -0,0 +1,208 @@
+# file: /api/services/dependency_guard.py
+
+import time
+import threading
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from api.config import (
+    logger,
+    CIRCUIT_BREAKER_COOLDOWN_SECONDS,
+    CIRCUIT_BREAKER_FAILURE_RATIO,
+    CIRCUIT_BREAKER_MIN_CALLS,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class DependencyUnavailableError(Exception):
+    """La dependencia está saturada o su circuito está abierto: se falla rápido sin llamarla."""
+
+    def __init__(self, dependency: str, reason: str):
+        super().__init__(f"{dependency} no disponible ({reason})")
+        self.dependency = dependency
+        self.reason = reason
+
+class AdaptiveLimiter:
+    """
+    Límite de llamadas concurrentes que se ajusta con AIMD según la latencia observada.
+
+    Cada respuesta rápida suma ``1/limit`` (aprox. +1 por cada ronda completa de
+    llamadas); un error o una latencia mayor que ``tolerance`` veces la latencia base
+    multiplica el límite por ``backoff``, como mucho una vez por intervalo de latencia
+    para que una ráfaga de respuestas lentas cuente como una sola señal. La latencia
+    base es el mínimo de una ventana reciente de muestras, así que sigue los cambios
+    del servicio sin quedarse anclada en un valor histórico.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int,
+                 tolerance: float = 2.0, backoff: float = 0.8, window: int = 100):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.last_decrease = 0.0
+
+    @property
+    def baseline(self) -> Optional[float]:
+        return min(self.samples) if self.samples else None
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency: float, success: bool) -> None:
+        self.in_flight -= 1
+        baseline: Optional[float] = self.baseline
+        if success:
+            self.samples.append(latency)
+        congested: bool = not success or (baseline is not None and latency > baseline * self.tolerance)
+        now: float = time.monotonic()
+        if congested:
+            if now - self.last_decrease >= max(latency, baseline or 0.0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self.last_decrease = now
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+class CircuitBreaker:
+    """
+    Corta las llamadas a una dependencia que está fallando.
+
+    Se abre cuando en la ventana de las últimas llamadas hay al menos
+    ``CIRCUIT_BREAKER_MIN_CALLS`` resultados y la proporción de fallos supera
+    ``CIRCUIT_BREAKER_FAILURE_RATIO``. Abierto rechaza todo durante el tiempo de
+    enfriamiento; después deja pasar una sola llamada de prueba (semiabierto) y vuelve a
+    cerrarse si funciona o a abrirse si falla.
+    """
+
+    def __init__(self, failure_ratio: float, min_calls: int, cooldown: float, window: int = 50):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self.probing = False
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record(self, success: bool) -> Optional[str]:
+        """Registra un resultado; devuelve el nuevo estado si cambió."""
+        if self.state == HALF_OPEN:
+            self.probing = False
+            if success:
+                self.state = CLOSED
+                self.outcomes.clear()
+                return CLOSED
+            return self._open()
+
+        self.outcomes.append(success)
+        failures: int = self.outcomes.count(False)
+        if (self.state == CLOSED and len(self.outcomes) >= self.min_calls
+                and failures / len(self.outcomes) >= self.failure_ratio):
+            return self._open()
+        return None
+
+    def _open(self) -> str:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self.outcomes.clear()
+        return OPEN
+
+class DependencyGuard:
+    """Límite adaptativo de concurrencia y circuit breaker para una dependencia externa."""
+
+    def __init__(self, name: str, initial_limit: int, max_limit: int, min_limit: int = 1):
+        self.name = name
+        self.limiter = AdaptiveLimiter(initial_limit, min_limit, max_limit)
+        self.breaker = CircuitBreaker(CIRCUIT_BREAKER_FAILURE_RATIO, CIRCUIT_BREAKER_MIN_CALLS, CIRCUIT_BREAKER_COOLDOWN_SECONDS)
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {"calls": 0, "successes": 0, "failures": 0, "rejected_limit": 0, "rejected_open": 0}
+        self.latency_ewma: Optional[float] = None
+
+    @contextmanager
+    def attempt(self) -> Iterator[None]:
+        """
+        Envuelve una llamada a la dependencia.
+
+        Raises:
+            DependencyUnavailableError: Si el circuito está abierto o se alcanzó el límite
+            de concurrencia (sin llegar a hacer la llamada)
+
+        Cualquier excepción dentro del bloque cuenta como fallo y se vuelve a lanzar.
+        """
+        with self.lock:
+            if not self.breaker.allow():
+                self.counters["rejected_open"] += 1
+                raise DependencyUnavailableError(self.name, "circuito abierto")
+            if not self.limiter.try_acquire():
+                if self.breaker.state == HALF_OPEN:
+                    self.breaker.probing = False
+                self.counters["rejected_limit"] += 1
+                raise DependencyUnavailableError(self.name, f"límite de concurrencia {int(self.limiter.limit)}")
+            self.counters["calls"] += 1
+
+        started: float = time.monotonic()
+        success: bool = False
+        try:
+            yield
+            success = True
+        finally:
+            latency: float = time.monotonic() - started
+            with self.lock:
+                self.limiter.release(latency, success)
+                self.counters["successes" if success else "failures"] += 1
+                self.latency_ewma = latency if self.latency_ewma is None else 0.9 * self.latency_ewma + 0.1 * latency
+                transition: Optional[str] = self.breaker.record(success)
+            if transition == OPEN:
+                logger.error(f"Circuito de {self.name} abierto por fallos; se reintentará en {self.breaker.cooldown}s")
+            elif transition == CLOSED:
+                logger.info(f"Circuito de {self.name} cerrado de nuevo")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            baseline: Optional[float] = self.limiter.baseline
+            return {
+                "state": self.breaker.state,
+                "times_opened": self.breaker.times_opened,
+                "limit": round(self.limiter.limit, 2),
+                "in_flight": self.limiter.in_flight,
+                "latency_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+                "baseline_latency_ms": round(baseline * 1000, 1) if baseline is not None else None,
+                **self.counters
+            }
+
+# Una guarda por dependencia externa, compartida por todos los hilos del proceso
+guards: Dict[str, DependencyGuard] = {
+    "whatsapp": DependencyGuard("whatsapp", initial_limit=16, max_limit=64),
+    "vision": DependencyGuard("vision", initial_limit=8, max_limit=32),
+    "storage": DependencyGuard("storage", initial_limit=32, max_limit=128),
+    "pubsub": DependencyGuard("pubsub", initial_limit=32, max_limit=128),
+}
+
+def guard(name: str) -> DependencyGuard:
+    return guards[name]
+
+def dependency_metrics() -> Dict[str, Dict[str, Any]]:
+    """Estado de todas las guardas (para el endpoint de métricas)."""
+    return {name: dependency_guard.metrics() for name, dependency_guard in guards.items()}
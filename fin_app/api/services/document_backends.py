@@ -0,0 +1,734 @@
+# file: /api/services/document_backends.py
+
+import json
+import sqlite3
+import threading
+import datetime as dt
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from google.api_core.exceptions import AlreadyExists, Conflict, FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import ArrayRemove, ArrayUnion, Increment, DELETE_FIELD, SERVER_TIMESTAMP
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.bulk_writer import BulkWriter
+from google.cloud.firestore_v1.document import DocumentReference, DocumentSnapshot
+from google.cloud.firestore_v1.field_path import parse_field_path
+
+from api.config import (
+    logger,
+    PERSISTENCE_BACKEND,
+    SQLITE_PATH,
+    SQLITE_BATCH_SIZE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_BUSY_TIMEOUT_MS,
+    COLLECTION_WHATSAPP_MESSAGES,
+    COLLECTION_WHATSAPP_MEDIA,
+    COLLECTION_WHATSAPP_RAW_MESSAGES,
+    COLLECTION_PUBSUB_DEAD_LETTERS,
+)
+
+Filters = Optional[Iterable[Tuple[str, str, Any]]]
+
+class DocumentConflictError(Exception):
+    """La precondición de una escritura condicional no se cumplió (el documento cambió)."""
+
+class DocumentBackend(ABC):
+    """
+    Operaciones sobre documentos que usa ``FirestoreService`` (ver allí la semántica de
+    cada una). Los documentos se devuelven como ``{"id": ..., **campos}`` y la versión de
+    un documento es su ``update_time``, que las escrituras condicionales reciben de vuelta.
+    """
+
+    name: str = ""
+
+    @abstractmethod
+    def get_document_version(self, collection: str, doc_id: str, fields: Optional[Iterable[str]] = None) -> Tuple[Optional[Dict], Optional[dt.datetime]]:
+        ...
+
+    @abstractmethod
+    def get_many(self, collection: str, doc_ids: List[str], fields: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        ...
+
+    @abstractmethod
+    def exists(self, collection: str, doc_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def create_if_absent(self, collection: str, doc_id: str, data: Dict) -> Optional[dt.datetime]:
+        ...
+
+    @abstractmethod
+    def set_document(self, collection: str, doc_id: str, data: Dict, merge: bool = False, writer: Any = None) -> None:
+        ...
+
+    @abstractmethod
+    def set_many(self, writes: Iterable[Tuple[str, str, Dict]], merge: bool = False) -> None:
+        ...
+
+    @abstractmethod
+    def query_page(self, collection: str, filters: Filters = None, order_by: Iterable[Tuple[str, str]] = (), limit: int = 20,
+                   start_after: Optional[Dict[str, Any]] = None, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def stream_documents(self, collection: str, filters: Filters = None, order_by: Optional[str] = None,
+                         fields: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        ...
+
+    @abstractmethod
+    def count_documents(self, collection: str, filters: Filters = None) -> int:
+        ...
+
+    @abstractmethod
+    def update_document(self, collection: str, doc_id: str, data: Dict, last_update_time: Optional[dt.datetime] = None,
+                        read_back: bool = True) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def update_document_version(self, collection: str, doc_id: str, data: Dict,
+                                last_update_time: Optional[dt.datetime] = None) -> Optional[dt.datetime]:
+        ...
+
+    @abstractmethod
+    def increment(self, collection: str, doc_id: str, field: str, amount: int = 1, extra: Optional[Dict] = None) -> int:
+        ...
+
+    @abstractmethod
+    def delete_document(self, collection: str, doc_id: str, writer: Any = None) -> bool:
+        ...
+
+    @abstractmethod
+    def bulk_writer(self) -> ContextManager[Any]:
+        """Context manager con el escritor masivo que reciben ``set_document`` y ``delete_document``."""
+
+class FirestoreBackend(DocumentBackend):
+    """Cloud Firestore con el cliente de ``firebase_admin``."""
+
+    name = "firestore"
+
+    def __init__(self):
+        self.app: Any = None
+        self._client: Optional[Any] = None
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def client(self) -> Any:
+        """Cliente de Firestore, creado en el primer uso: importar los servicios no exige credenciales."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import firebase_admin
+                    from firebase_admin import firestore
+
+                    self.app = firebase_admin.initialize_app()
+                    self._client = firestore.client()
+        return self._client
+
+    def _snapshot(self, collection: str, doc_id: str, fields: Optional[Iterable[str]]) -> DocumentSnapshot:
+        doc_ref: DocumentReference = self.client.collection(collection).document(doc_id)
+        return doc_ref.get(field_paths=list(fields) if fields is not None else None)
+
+    def _query(self, collection: str, filters: Filters):
+        query = self.client.collection(collection)
+        for field, op, value in filters or []:
+            query = query.where(filter=FieldFilter(field, op, value))
+        return query
+
+    def get_document_version(self, collection: str, doc_id: str, fields: Optional[Iterable[str]] = None) -> Tuple[Optional[Dict], Optional[dt.datetime]]:
+        doc: DocumentSnapshot = self._snapshot(collection, doc_id, fields)
+        if not doc.exists:
+            return None, None
+        return {"id": doc.id, **(doc.to_dict() or {})}, doc.update_time
+
+    def get_many(self, collection: str, doc_ids: List[str], fields: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        col_ref = self.client.collection(collection)
+        refs: List[DocumentReference] = [col_ref.document(doc_id) for doc_id in doc_ids]
+        snapshots = self.client.get_all(refs, field_paths=list(fields) if fields is not None else None)
+        return {
+            doc.id: {"id": doc.id, **(doc.to_dict() or {})}
+            for doc in snapshots if doc.exists
+        }
+
+    def exists(self, collection: str, doc_id: str) -> bool:
+        # Máscara vacía: solo se transfieren los metadatos del documento
+        return self._snapshot(collection, doc_id, []).exists
+
+    def create_if_absent(self, collection: str, doc_id: str, data: Dict) -> Optional[dt.datetime]:
+        doc_ref: DocumentReference = self.client.collection(collection).document(doc_id)
+        try:
+            return doc_ref.create(data).update_time
+        except (AlreadyExists, Conflict):
+            return None
+
+    def set_document(self, collection: str, doc_id: str, data: Dict, merge: bool = False, writer: Optional[BulkWriter] = None) -> None:
+        doc_ref: DocumentReference = self.client.collection(collection).document(doc_id)
+        if writer is not None:
+            writer.set(doc_ref, data, merge=merge)
+        else:
+            doc_ref.set(data, merge=merge)
+
+    def set_many(self, writes: Iterable[Tuple[str, str, Dict]], merge: bool = False) -> None:
+        batch = self.client.batch()
+        for collection, doc_id, data in writes:
+            batch.set(self.client.collection(collection).document(doc_id), data, merge=merge)
+        batch.commit()
+
+    def query_page(self, collection: str, filters: Filters = None, order_by: Iterable[Tuple[str, str]] = (), limit: int = 20,
+                   start_after: Optional[Dict[str, Any]] = None, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        query = self._query(collection, filters)
+        for field, direction in order_by:
+            query = query.order_by(field, direction=direction)
+        if fields is not None:
+            query = query.select(list(fields))
+        if start_after:
+            query = query.start_after(start_after)
+        return [{"id": doc.id, **(doc.to_dict() or {})} for doc in query.limit(limit).stream()]
+
+    def stream_documents(self, collection: str, filters: Filters = None, order_by: Optional[str] = None,
+                         fields: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        query = self._query(collection, filters)
+        if order_by:
+            query = query.order_by(order_by)
+        if fields is not None:
+            query = query.select(list(fields))
+        for doc in query.stream():
+            yield {"id": doc.id, **(doc.to_dict() or {})}
+
+    def count_documents(self, collection: str, filters: Filters = None) -> int:
+        results = self._query(collection, filters).count(alias="total").get()
+        return int(results[0][0].value) if results else 0
+
+    def update_document(self, collection: str, doc_id: str, data: Dict, last_update_time: Optional[dt.datetime] = None,
+                        read_back: bool = True) -> Optional[Dict]:
+        if self.update_document_version(collection, doc_id, data, last_update_time) is None:
+            return None
+
+        if not read_back:
+            return {"id": doc_id, **data}
+
+        updated_doc: DocumentSnapshot = self._snapshot(collection, doc_id, None)
+        return {"id": doc_id, **updated_doc.to_dict()}
+
+    def update_document_version(self, collection: str, doc_id: str, data: Dict,
+                                last_update_time: Optional[dt.datetime] = None) -> Optional[dt.datetime]:
+        doc_ref: DocumentReference = self.client.collection(collection).document(doc_id)
+        option = self.client.write_option(last_update_time=last_update_time) if last_update_time else None
+
+        try:
+            return doc_ref.update(data, option=option).update_time
+        except NotFound:
+            return None
+        except FailedPrecondition as e:
+            raise DocumentConflictError(f"{collection}/{doc_id} cambió desde {last_update_time}") from e
+
+    def increment(self, collection: str, doc_id: str, field: str, amount: int = 1, extra: Optional[Dict] = None) -> int:
+        doc_ref: DocumentReference = self.client.collection(collection).document(doc_id)
+        doc_ref.set({field: Increment(amount), **(extra or {})}, merge=True)
+        return int(doc_ref.get(field_paths=[field]).get(field) or 0)
+
+    def delete_document(self, collection: str, doc_id: str, writer: Optional[BulkWriter] = None) -> bool:
+        doc_ref: DocumentReference = self.client.collection(collection).document(doc_id)
+        if writer is not None:
+            writer.delete(doc_ref)
+            return True
+        try:
+            doc_ref.delete(option=self.client.write_option(exists=True))
+        except NotFound:
+            return False
+        return True
+
+    @contextmanager
+    def bulk_writer(self) -> Iterator[BulkWriter]:
+        writer: BulkWriter = self.client.bulk_writer()
+        failures: list = []
+
+        def on_error(error, bulk_writer: BulkWriter) -> bool:
+            if error.attempts < 5:
+                return True
+            failures.append(error)
+            logger.error(f"Error en escritura masiva de {error.operation.reference.path}: {error.message}")
+            return False
+
+        writer.on_write_error(on_error)
+        try:
+            yield writer
+        finally:
+            writer.close()
+            if failures:
+                logger.error(f"Escritura masiva finalizada con {len(failures)} errores")
+
+# Prefijo de las fechas guardadas en SQLite: texto ISO 8601 en UTC de ancho fijo, que se
+# ordena igual que las fechas y permite compararlas en las consultas
+DATETIME_TAG: str = "\ue000"
+DATETIME_FORMAT: str = "%Y-%m-%dT%H:%M:%S.%fZ"
+EPOCH: dt.datetime = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+
+# Índices de expresión de SQLite: equivalen a los índices compuestos de firestore.indexes.json
+# y a los filtros de las herramientas (cada uno termina implícitamente en el ID)
+SQLITE_INDEXES: List[Tuple[str, Tuple[str, ...]]] = [
+    (COLLECTION_WHATSAPP_MESSAGES, ("user_id", "timestamp")),
+    (COLLECTION_WHATSAPP_MESSAGES, ("user_id", "message_type", "timestamp")),
+    (COLLECTION_WHATSAPP_MESSAGES, ("phone_number", "timestamp")),
+    (COLLECTION_WHATSAPP_MESSAGES, ("phone_number", "message_type", "timestamp")),
+    (COLLECTION_WHATSAPP_MEDIA, ("user_id", "created_at")),
+    (COLLECTION_WHATSAPP_MEDIA, ("user_id", "media_type", "created_at")),
+    (COLLECTION_WHATSAPP_MEDIA, ("phone_number", "created_at")),
+    (COLLECTION_WHATSAPP_MEDIA, ("phone_number", "media_type", "created_at")),
+    (COLLECTION_WHATSAPP_MEDIA, ("processed",)),
+    (COLLECTION_WHATSAPP_RAW_MESSAGES, ("date",)),
+    (COLLECTION_PUBSUB_DEAD_LETTERS, ("status", "lane")),
+]
+
+COMPARISONS: Dict[str, str] = {"==": "=", "!=": "<>", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+def encode_value(value: Any) -> Any:
+    if isinstance(value, dt.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt.timezone.utc)
+        return DATETIME_TAG + value.astimezone(dt.timezone.utc).strftime(DATETIME_FORMAT)
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    return value
+
+def _decode_item(value: Any) -> Any:
+    if isinstance(value, str) and value.startswith(DATETIME_TAG):
+        return dt.datetime.strptime(value[len(DATETIME_TAG):], DATETIME_FORMAT).replace(tzinfo=dt.timezone.utc)
+    if isinstance(value, list):
+        return [_decode_item(item) for item in value]
+    return value
+
+def _decode_object(document: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: _decode_item(value) for key, value in document.items()}
+
+def dumps(document: Dict[str, Any]) -> str:
+    return json.dumps(encode_value(document), separators=(",", ":"), ensure_ascii=False, default=str)
+
+def loads(text: str) -> Dict[str, Any]:
+    # Los documentos sin fechas (la mayoría de lecturas del índice) se decodifican sin gancho
+    if DATETIME_TAG not in text:
+        return json.loads(text)
+    return json.loads(text, object_hook=_decode_object)
+
+def transform(current: Any, value: Any, now: dt.datetime) -> Any:
+    """Valor resultante de escribir ``value`` sobre ``current`` (resolviendo los sentinels de Firestore)."""
+    if value is SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, Increment):
+        return (current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0) + value.value
+    if isinstance(value, ArrayUnion):
+        items: List[Any] = list(current) if isinstance(current, list) else []
+        items.extend(item for item in value.values if item not in items)
+        return items
+    if isinstance(value, ArrayRemove):
+        return [item for item in current if item not in value.values] if isinstance(current, list) else []
+    return value
+
+def merge_fields(document: Dict[str, Any], data: Dict[str, Any], now: dt.datetime) -> Dict[str, Any]:
+    """Fusiona ``data`` en ``document`` como ``set(merge=True)``: los mapas anidados se fusionan campo a campo."""
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            document.pop(key, None)
+        elif isinstance(value, dict):
+            current: Any = document.get(key)
+            document[key] = merge_fields(dict(current) if isinstance(current, dict) else {}, value, now)
+        else:
+            document[key] = transform(document.get(key), value, now)
+    return document
+
+def update_fields(document: Dict[str, Any], data: Dict[str, Any], now: dt.datetime) -> Dict[str, Any]:
+    """Aplica ``data`` como ``update()``: cada clave es una ruta de campo y los mapas se reemplazan."""
+    for key, value in data.items():
+        parts: List[str] = parse_field_path(key)
+        parent: Dict[str, Any] = document
+        for part in parts[:-1]:
+            child: Any = parent.get(part)
+            if not isinstance(child, dict):
+                child = parent[part] = {}
+            parent = child
+        if value is DELETE_FIELD:
+            parent.pop(parts[-1], None)
+        else:
+            parent[parts[-1]] = transform(parent.get(parts[-1]), value, now)
+    return document
+
+def project(document: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    """Solo los campos pedidos (rutas con ``.``), como una proyección de Firestore."""
+    result: Dict[str, Any] = {}
+    for field in fields:
+        parts: List[str] = parse_field_path(field)
+        value: Any = document
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target: Dict[str, Any] = result
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return result
+
+def field_expression(field: str) -> str:
+    """Expresión SQL de un campo; la ruta va literal para que coincida con los índices de expresión."""
+    if field == "__name__":
+        return "id"
+    path: str = "$" + "".join('."' + part.replace('"', '') + '"' for part in parse_field_path(field))
+    return "json_extract(data, '" + path.replace("'", "''") + "')"
+
+def field_type_expression(field: str) -> str:
+    return field_expression(field).replace("json_extract(", "json_type(", 1)
+
+def to_version(microseconds: int) -> dt.datetime:
+    return EPOCH + dt.timedelta(microseconds=microseconds)
+
+def from_version(version: dt.datetime) -> int:
+    if version.tzinfo is None:
+        version = version.replace(tzinfo=dt.timezone.utc)
+    return (version - EPOCH) // dt.timedelta(microseconds=1)
+
+UPSERT_SQL: str = (
+    "INSERT INTO documents (collection, id, data, update_time) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (collection, id) DO UPDATE SET data = excluded.data, "
+    "update_time = MAX(excluded.update_time, documents.update_time + 1)"
+)
+DELETE_SQL: str = "DELETE FROM documents WHERE collection = ? AND id = ?"
+SELECT_SQL: str = "SELECT data, update_time FROM documents WHERE collection = ? AND id = ?"
+
+class SQLiteBatch:
+    """
+    Escrituras encoladas con ``bulk_writer()`` del backend SQLite.
+
+    Se aplican en transacciones de ``batch_size`` operaciones; las escrituras completas y
+    los borrados consecutivos se envían con ``executemany`` sobre la misma sentencia preparada.
+    """
+
+    def __init__(self, backend: 'SQLiteBackend', batch_size: int):
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.operations: List[Union[Tuple[str, tuple], Callable[[sqlite3.Connection], None]]] = []
+        self.failures = 0
+
+    def add(self, operation: Union[Tuple[str, tuple], Callable[[sqlite3.Connection], None]]) -> None:
+        self.operations.append(operation)
+        if len(self.operations) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.operations:
+            return
+        operations, self.operations = self.operations, []
+        try:
+            with self.backend._transaction() as connection:
+                index: int = 0
+                while index < len(operations):
+                    operation = operations[index]
+                    if callable(operation):
+                        operation(connection)
+                        index += 1
+                        continue
+                    sql: str = operation[0]
+                    params: List[tuple] = []
+                    while index < len(operations) and not callable(operations[index]) and operations[index][0] == sql:
+                        params.append(operations[index][1])
+                        index += 1
+                    connection.executemany(sql, params)
+        except sqlite3.Error as e:
+            self.failures += len(operations)
+            logger.error(f"Error en escritura masiva de {len(operations)} documentos en SQLite: {str(e)}")
+
+class SQLiteBackend(DocumentBackend):
+    """
+    Documentos en un archivo SQLite en modo WAL, para un solo nodo.
+
+    Cada documento es una fila ``(collection, id, data JSON, update_time)``; los filtros y
+    el orden se evalúan con ``json_extract`` sobre índices de expresión (``SQLITE_INDEXES``).
+    Con WAL los lectores no bloquean al escritor y los procesos de gunicorn comparten el
+    archivo. Cada hilo usa su propia conexión, que conserva las sentencias preparadas; las
+    escrituras que dependen del documento actual (merge, incrementos, actualizaciones
+    condicionales) se hacen en una transacción ``BEGIN IMMEDIATE``.
+
+    ``update_time`` es un entero en microsegundos que aumenta con cada escritura del
+    documento, así que sirve de precondición igual que el ``update_time`` de Firestore.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, batch_size: int = 500, synchronous: str = "NORMAL", busy_timeout_ms: int = 5000):
+        self.path = path
+        self.batch_size = batch_size
+        self.synchronous = synchronous if synchronous.upper() in ("OFF", "NORMAL", "FULL", "EXTRA") else "NORMAL"
+        self.busy_timeout_ms = busy_timeout_ms
+        self.local = threading.local()
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "collection TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, update_time INTEGER NOT NULL, "
+                "PRIMARY KEY (collection, id)) WITHOUT ROWID"
+            )
+            for number, (collection, fields) in enumerate(SQLITE_INDEXES):
+                expressions: str = ", ".join(field_expression(field) for field in fields)
+                connection.execute(f"CREATE INDEX IF NOT EXISTS documents_{collection}_{number} ON documents (collection, {expressions}, id)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection: Optional[sqlite3.Connection] = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=self.busy_timeout_ms / 1000, cached_statements=256)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(f"PRAGMA synchronous={self.synchronous}")
+            connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            connection.execute("PRAGMA temp_store=MEMORY")
+            self.local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection: sqlite3.Connection = self._connection()
+        if connection.in_transaction:
+            yield connection
+            return
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _now(self) -> Tuple[dt.datetime, int]:
+        now: dt.datetime = dt.datetime.now(dt.timezone.utc)
+        return now, from_version(now)
+
+    def _read(self, connection: sqlite3.Connection, collection: str, doc_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        row: Optional[tuple] = connection.execute(SELECT_SQL, (collection, doc_id)).fetchone()
+        if row is None:
+            return None, None
+        return loads(row[0]), row[1]
+
+    def _write(self, connection: sqlite3.Connection, collection: str, doc_id: str, document: Dict[str, Any],
+               current_version: Optional[int], micros: int) -> int:
+        version: int = max(micros, (current_version or 0) + 1)
+        connection.execute(UPSERT_SQL, (collection, doc_id, dumps(document), version))
+        return version
+
+    def _merge(self, collection: str, doc_id: str, data: Dict) -> Callable[[sqlite3.Connection], None]:
+        def apply(connection: sqlite3.Connection) -> None:
+            now, micros = self._now()
+            document, version = self._read(connection, collection, doc_id)
+            self._write(connection, collection, doc_id, merge_fields(document or {}, data, now), version, micros)
+        return apply
+
+    def _set_operation(self, collection: str, doc_id: str, data: Dict, merge: bool) -> Union[Tuple[str, tuple], Callable[[sqlite3.Connection], None]]:
+        if merge:
+            return self._merge(collection, doc_id, data)
+        now, micros = self._now()
+        return UPSERT_SQL, (collection, doc_id, dumps(merge_fields({}, data, now)), micros)
+
+    def get_document_version(self, collection: str, doc_id: str, fields: Optional[Iterable[str]] = None) -> Tuple[Optional[Dict], Optional[dt.datetime]]:
+        document, version = self._read(self._connection(), collection, doc_id)
+        if document is None:
+            return None, None
+        if fields is not None:
+            document = project(document, fields)
+        return {"id": doc_id, **document}, to_version(version)
+
+    def get_many(self, collection: str, doc_ids: List[str], fields: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        connection: sqlite3.Connection = self._connection()
+        field_list: Optional[List[str]] = list(fields) if fields is not None else None
+        result: Dict[str, Dict] = {}
+        for start in range(0, len(doc_ids), 500):
+            chunk: List[str] = doc_ids[start:start + 500]
+            rows = connection.execute(
+                f"SELECT id, data FROM documents WHERE collection = ? AND id IN ({', '.join('?' * len(chunk))})",
+                (collection, *chunk)
+            )
+            for doc_id, data in rows:
+                document: Dict[str, Any] = loads(data)
+                result[doc_id] = {"id": doc_id, **(project(document, field_list) if field_list is not None else document)}
+        return result
+
+    def exists(self, collection: str, doc_id: str) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM documents WHERE collection = ? AND id = ?", (collection, doc_id)
+        ).fetchone() is not None
+
+    def create_if_absent(self, collection: str, doc_id: str, data: Dict) -> Optional[dt.datetime]:
+        now, micros = self._now()
+        cursor = self._connection().execute(
+            "INSERT INTO documents (collection, id, data, update_time) VALUES (?, ?, ?, ?) ON CONFLICT (collection, id) DO NOTHING",
+            (collection, doc_id, dumps(merge_fields({}, data, now)), micros)
+        )
+        return to_version(micros) if cursor.rowcount == 1 else None
+
+    def set_document(self, collection: str, doc_id: str, data: Dict, merge: bool = False, writer: Optional[SQLiteBatch] = None) -> None:
+        operation = self._set_operation(collection, doc_id, data, merge)
+        if writer is not None:
+            writer.add(operation)
+            return
+        with self._transaction() as connection:
+            if callable(operation):
+                operation(connection)
+            else:
+                connection.execute(*operation)
+
+    def set_many(self, writes: Iterable[Tuple[str, str, Dict]], merge: bool = False) -> None:
+        batch: SQLiteBatch = SQLiteBatch(self, batch_size=1 << 30)
+        for collection, doc_id, data in writes:
+            batch.add(self._set_operation(collection, doc_id, data, merge))
+        operations = batch.operations
+        # A diferencia de bulk_writer, set_many es atómico y propaga el error
+        with self._transaction() as connection:
+            for operation in operations:
+                if callable(operation):
+                    operation(connection)
+                else:
+                    connection.execute(*operation)
+
+    def _where(self, collection: str, filters: Filters) -> Tuple[List[str], List[Any]]:
+        clauses: List[str] = ["collection = ?"]
+        params: List[Any] = [collection]
+        for field, op, value in filters or []:
+            expression: str = field_expression(field)
+            if op == "==" and value is None:
+                clauses.append(f"{field_type_expression(field)} = 'null'")
+            elif op in COMPARISONS:
+                clauses.append(f"{expression} {COMPARISONS[op]} ?")
+                params.append(encode_value(value))
+            elif op in ("in", "not-in"):
+                values: List[Any] = [encode_value(item) for item in value]
+                negation: str = "NOT " if op == "not-in" else ""
+                clauses.append(f"{expression} {negation}IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+            elif op in ("array_contains", "array-contains"):
+                path: str = expression[len("json_extract(data, "):-1]
+                clauses.append(f"EXISTS (SELECT 1 FROM json_each(data, {path}) WHERE json_each.value = ?)")
+                params.append(encode_value(value))
+            else:
+                raise ValueError(f"Operador de filtro no soportado en SQLite: {op}")
+        return clauses, params
+
+    def query_page(self, collection: str, filters: Filters = None, order_by: Iterable[Tuple[str, str]] = (), limit: int = 20,
+                   start_after: Optional[Dict[str, Any]] = None, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        clauses, params = self._where(collection, filters)
+        ordering: List[Tuple[str, str]] = [(field, direction.upper()) for field, direction in order_by]
+        if not any(field == "__name__" for field, _ in ordering):
+            # Firestore desempata siempre por el ID, en la dirección del último campo
+            ordering.append(("__name__", ordering[-1][1] if ordering else "ASCENDING"))
+        for field, _ in ordering:
+            if field != "__name__":
+                # Como en Firestore, los documentos sin el campo de orden quedan fuera
+                clauses.append(f"{field_type_expression(field)} IS NOT NULL")
+
+        if start_after:
+            # Paginación por cursor: (f1, f2, ...) estrictamente después de los valores dados
+            keys: List[Tuple[str, str, Any]] = [
+                (field_expression(field), direction, encode_value(start_after[field]))
+                for field, direction in ordering if field in start_after
+            ]
+            alternatives: List[str] = []
+            for position, (expression, direction, value) in enumerate(keys):
+                equalities: List[str] = [f"{previous} = ?" for previous, _, _ in keys[:position]]
+                comparison: str = "<" if direction == "DESCENDING" else ">"
+                alternatives.append("(" + " AND ".join(equalities + [f"{expression} {comparison} ?"]) + ")")
+                params.extend([previous_value for _, _, previous_value in keys[:position]] + [value])
+            if alternatives:
+                clauses.append("(" + " OR ".join(alternatives) + ")")
+
+        order_sql: str = ", ".join(
+            f"{field_expression(field)} {'DESC' if direction == 'DESCENDING' else 'ASC'}" for field, direction in ordering
+        )
+        rows = self._connection().execute(
+            f"SELECT id, data FROM documents WHERE {' AND '.join(clauses)} ORDER BY {order_sql} LIMIT ?",
+            (*params, int(limit))
+        )
+        field_list: Optional[List[str]] = list(fields) if fields is not None else None
+        result: List[Dict] = []
+        for doc_id, data in rows:
+            document: Dict[str, Any] = loads(data)
+            result.append({"id": doc_id, **(project(document, field_list) if field_list is not None else document)})
+        return result
+
+    def stream_documents(self, collection: str, filters: Filters = None, order_by: Optional[str] = None,
+                         fields: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        # Por páginas: no se mantiene abierta una lectura mientras el llamador escribe
+        ordering: List[Tuple[str, str]] = ([(order_by, "ASCENDING")] if order_by else []) + [("__name__", "ASCENDING")]
+        page_fields: Optional[List[str]] = None
+        if fields is not None:
+            page_fields = list(dict.fromkeys([*fields, *(field for field, _ in ordering if field != "__name__")]))
+        start_after: Optional[Dict[str, Any]] = None
+        while True:
+            page: List[Dict] = self.query_page(collection, filters, ordering, self.batch_size, start_after, page_fields)
+            for document in page:
+                yield document
+            if len(page) < self.batch_size:
+                return
+            last: Dict[str, Any] = page[-1]
+            start_after = {"__name__": last["id"], **({order_by: last.get(order_by)} if order_by else {})}
+
+    def count_documents(self, collection: str, filters: Filters = None) -> int:
+        clauses, params = self._where(collection, filters)
+        return int(self._connection().execute(f"SELECT COUNT(*) FROM documents WHERE {' AND '.join(clauses)}", params).fetchone()[0])
+
+    def _update(self, collection: str, doc_id: str, data: Dict,
+                last_update_time: Optional[dt.datetime]) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        with self._transaction() as connection:
+            now, micros = self._now()
+            document, version = self._read(connection, collection, doc_id)
+            if document is None:
+                return None, None
+            if last_update_time is not None and version != from_version(last_update_time):
+                raise DocumentConflictError(f"{collection}/{doc_id} cambió desde {last_update_time}")
+            document = update_fields(document, data, now)
+            return document, self._write(connection, collection, doc_id, document, version, micros)
+
+    def update_document(self, collection: str, doc_id: str, data: Dict, last_update_time: Optional[dt.datetime] = None,
+                        read_back: bool = True) -> Optional[Dict]:
+        document, _ = self._update(collection, doc_id, data, last_update_time)
+        if document is None:
+            return None
+        return {"id": doc_id, **(document if read_back else data)}
+
+    def update_document_version(self, collection: str, doc_id: str, data: Dict,
+                                last_update_time: Optional[dt.datetime] = None) -> Optional[dt.datetime]:
+        _, version = self._update(collection, doc_id, data, last_update_time)
+        return to_version(version) if version is not None else None
+
+    def increment(self, collection: str, doc_id: str, field: str, amount: int = 1, extra: Optional[Dict] = None) -> int:
+        with self._transaction() as connection:
+            now, micros = self._now()
+            document, version = self._read(connection, collection, doc_id)
+            document = merge_fields(document or {}, {field: Increment(amount), **(extra or {})}, now)
+            self._write(connection, collection, doc_id, document, version, micros)
+        return int(document.get(field) or 0)
+
+    def delete_document(self, collection: str, doc_id: str, writer: Optional[SQLiteBatch] = None) -> bool:
+        if writer is not None:
+            writer.add((DELETE_SQL, (collection, doc_id)))
+            return True
+        return self._connection().execute(DELETE_SQL, (collection, doc_id)).rowcount > 0
+
+    @contextmanager
+    def bulk_writer(self) -> Iterator[SQLiteBatch]:
+        writer: SQLiteBatch = SQLiteBatch(self, self.batch_size)
+        try:
+            yield writer
+        finally:
+            writer.flush()
+            if writer.failures:
+                logger.error(f"Escritura masiva finalizada con {writer.failures} errores")
+
+def create_backend(name: str = PERSISTENCE_BACKEND) -> DocumentBackend:
+    """
+    Backend configurado en ``PERSISTENCE_BACKEND`` (``firestore`` o ``sqlite``).
+
+    Raises:
+        ValueError: Si el nombre no corresponde a ningún backend
+    """
+    if name == "sqlite":
+        return SQLiteBackend(SQLITE_PATH, SQLITE_BATCH_SIZE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS)
+    if name == "firestore":
+        return FirestoreBackend()
+    raise ValueError(f"Backend de persistencia desconocido '{name}' (opciones: firestore, sqlite)")
@@ -0,0 +1,329 @@
+# file: /api/services/financial_extraction_service.py
+
+import re
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Pattern, Tuple
+
+from api.config import DEFAULT_LOCALE
+
+# Convenciones numéricas por configuración regional: (separador decimal, moneda por defecto)
+LOCALES: Dict[str, Tuple[str, str]] = {
+    'es_CO': (',', 'COP'),
+    'es_CL': (',', 'CLP'),
+    'es_AR': (',', 'ARS'),
+    'es_ES': (',', 'EUR'),
+    'es_PE': ('.', 'PEN'),
+    'es_MX': ('.', 'MXN'),
+    'en_US': ('.', 'USD'),
+}
+
+CURRENCY_ALIASES: Dict[str, str] = {
+    'cop': 'COP', 'pesos': 'COP', 'col$': 'COP',
+    'usd': 'USD', 'us$': 'USD', 'u$s': 'USD', 'dolares': 'USD', 'dólares': 'USD',
+    'eur': 'EUR', '€': 'EUR', 'euros': 'EUR',
+    'mxn': 'MXN', 'clp': 'CLP', 'ars': 'ARS', 'pen': 'PEN', 's/': 'PEN',
+}
+
+MONTHS: Dict[str, int] = {
+    'ene': 1, 'enero': 1, 'jan': 1, 'january': 1,
+    'feb': 2, 'febrero': 2, 'february': 2,
+    'mar': 3, 'marzo': 3, 'march': 3,
+    'abr': 4, 'abril': 4, 'apr': 4, 'april': 4,
+    'may': 5, 'mayo': 5,
+    'jun': 6, 'junio': 6, 'june': 6,
+    'jul': 7, 'julio': 7, 'july': 7,
+    'ago': 8, 'agosto': 8, 'aug': 8, 'august': 8,
+    'sep': 9, 'sept': 9, 'septiembre': 9, 'setiembre': 9, 'september': 9,
+    'oct': 10, 'octubre': 10, 'october': 10,
+    'nov': 11, 'noviembre': 11, 'november': 11,
+    'dic': 12, 'diciembre': 12, 'dec': 12, 'december': 12,
+}
+
+# Patrones independientes de la configuración regional (compilados una sola vez)
+CURRENCY_TOKEN: str = r"(?:COP|USD|EUR|MXN|CLP|ARS|PEN|US\$|U\$S|COL\$|S/|\$|€)"
+AMOUNT_PATTERN_TEMPLATE: str = (
+    r"(?P<pre>" + CURRENCY_TOKEN + r")?\s?"
+    r"(?P<num>\d{{1,3}}(?:[{group}]\d{{3}})+(?:{decimal}\d{{1,2}})?|\d+(?:{decimal}\d{{1,2}})?)"
+    r"(?![\d%]|\s%)(?:\s?(?P<post>COP|USD|EUR|MXN|CLP|ARS|PEN|pesos|d[oó]lares|euros)\b)?"
+)
+TOTAL_LINE_PATTERN: Pattern = re.compile(
+    r"\b(total\s+a\s+pagar|neto\s+a\s+pagar|valor\s+a\s+pagar|valor\s+total|gran\s+total|total\s+factura|total|importe\s+total|monto\s+total|amount\s+due)\b",
+    re.IGNORECASE
+)
+# Etiquetas del valor final a pagar: tienen prioridad sobre un "total" a secas
+FINAL_TOTAL_PATTERN: Pattern = re.compile(
+    r"\b(total\s+a\s+pagar|neto\s+a\s+pagar|valor\s+a\s+pagar|valor\s+total|gran\s+total|total\s+factura|importe\s+total|monto\s+total|amount\s+due)\b",
+    re.IGNORECASE
+)
+# "Total" que cuenta unidades y no dinero ("Total items 3", "Total artículos: 5")
+TOTAL_COUNT_PATTERN: Pattern = re.compile(
+    r"\btotal\s+(?:de\s+)?(items?|[ií]tems?|art[ií]culos?|unidades|productos|cantidad|qty|items\s+vendidos)\b",
+    re.IGNORECASE
+)
+SUBTOTAL_PATTERN: Pattern = re.compile(r"\b(sub\s*-?\s*total|base\s+gravable)\b", re.IGNORECASE)
+TAX_LINE_PATTERN: Pattern = re.compile(r"\b(iva|impuesto|i\.v\.a\.?|impoconsumo|inc|tax|vat)\b", re.IGNORECASE)
+NUMERIC_DATE_PATTERN: Pattern = re.compile(r"\b(\d{1,4})[/\-.](\d{1,2})[/\-.](\d{2,4})\b")
+TEXT_DATE_PATTERN: Pattern = re.compile(
+    r"\b(\d{1,2})\s*(?:de\s+|-|/|\s)?([a-zA-Záéíóú]{3,10})\.?\s*(?:de\s+|del\s+|-|/|\s)?(\d{4})\b",
+    re.IGNORECASE
+)
+MONTH_FIRST_DATE_PATTERN: Pattern = re.compile(r"\b([a-zA-Z]{3,9})\.?\s+(\d{1,2}),?\s+(\d{4})\b")
+TAX_ID_PATTERNS: List[Tuple[str, Pattern]] = [
+    ('NIT', re.compile(r"\bN\.?\s?I\.?\s?T\.?\s*[:#.]?\s*((?:\d{1,3}\.){2,3}\d{3}|\d{6,10})(?:\s?-\s?(\d))?", re.IGNORECASE)),
+    ('RUT', re.compile(r"\b(\d{1,2}\.\d{3}\.\d{3}-[\dkK])\b")),
+    ('CUIT', re.compile(r"\b(\d{2}-\d{8}-\d)\b")),
+    ('RFC', re.compile(r"\b([A-ZÑ&]{3,4}\d{6}[A-Z0-9]{3})\b")),
+    ('RUC', re.compile(r"\bRUC\s*[:#.]?\s*(\d{11})\b", re.IGNORECASE)),
+]
+MERCHANT_SKIP_PATTERN: Pattern = re.compile(
+    r"\b(factura|nit|rut|rfc|fecha|hora|caja|cajero|cliente|direcci[oó]n|tel[eé]fono|tel|cel|régimen|regimen|resoluci[oó]n|"
+    r"ticket|recibo|comprobante|documento|pos|www|http|electr[oó]nica|venta|original|copia)\b",
+    re.IGNORECASE
+)
+LETTER_PATTERN: Pattern = re.compile(r"[A-Za-zÁÉÍÓÚÑáéíóúñ]")
+
+@lru_cache(maxsize=None)
+def amount_pattern(locale: str) -> Pattern:
+    """Patrón de montos para la configuración regional (se compila una vez por locale)."""
+    decimal_sep: str = LOCALES.get(locale, LOCALES[DEFAULT_LOCALE])[0]
+    group: str = r"\." if decimal_sep == ',' else ","
+    return re.compile(
+        AMOUNT_PATTERN_TEMPLATE.format(group=group + "'", decimal=re.escape(decimal_sep)),
+        re.IGNORECASE
+    )
+
+def parse_number(raw: str, locale: str) -> Optional[Decimal]:
+    """Convierte ``"45.000,50"`` (es_CO) o ``"45,000.50"`` (en_US) en Decimal."""
+    decimal_sep: str = LOCALES.get(locale, LOCALES[DEFAULT_LOCALE])[0]
+    cleaned: str = raw.replace("'", '')
+    group_sep: str = '.' if decimal_sep == ',' else ','
+    cleaned = cleaned.replace(group_sep, '').replace(decimal_sep, '.')
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        return None
+
+def normalize_currency(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    token = token.strip().lower()
+    if token == '$':
+        return None
+    return CURRENCY_ALIASES.get(token, token.upper())
+
+def find_amounts(line: str, locale: str) -> List[Tuple[Decimal, Optional[str], bool]]:
+    """Montos de una línea como ``(valor, moneda, tenía símbolo)``."""
+    amounts: List[Tuple[Decimal, Optional[str], bool]] = []
+    for match in amount_pattern(locale).finditer(line):
+        value: Optional[Decimal] = parse_number(match.group('num'), locale)
+        if value is None:
+            continue
+        pre: Optional[str] = match.group('pre')
+        post: Optional[str] = match.group('post')
+        amounts.append((value, normalize_currency(pre) or normalize_currency(post), bool(pre or post)))
+    return amounts
+
+def find_dates(text: str, locale: str) -> List[str]:
+    """Fechas válidas del texto en formato ISO, en orden de aparición."""
+    day_first: bool = locale != 'en_US'
+    found: List[Tuple[int, str]] = []
+
+    for match in NUMERIC_DATE_PATTERN.finditer(text):
+        a, b, c = match.groups()
+        if len(a) == 4:
+            year, month, day = int(a), int(b), int(c)
+        else:
+            year = int(c) + (2000 if len(c) == 2 else 0)
+            day, month = (int(a), int(b)) if day_first else (int(b), int(a))
+        found.append((match.start(), _iso_date(year, month, day)))
+
+    for match in TEXT_DATE_PATTERN.finditer(text):
+        day_raw, month_raw, year_raw = match.groups()
+        month: Optional[int] = MONTHS.get(month_raw.lower())
+        if month:
+            found.append((match.start(), _iso_date(int(year_raw), month, int(day_raw))))
+
+    for match in MONTH_FIRST_DATE_PATTERN.finditer(text):
+        month_raw, day_raw, year_raw = match.groups()
+        month = MONTHS.get(month_raw.lower())
+        if month:
+            found.append((match.start(), _iso_date(int(year_raw), month, int(day_raw))))
+
+    return [iso for _, iso in sorted(found) if iso]
+
+def _iso_date(year: int, month: int, day: int) -> str:
+    try:
+        parsed: date = date(year, month, day)
+    except ValueError:
+        return ''
+    return parsed.isoformat() if 1990 <= parsed.year <= 2100 else ''
+
+def find_tax_ids(text: str) -> List[Dict[str, str]]:
+    tax_ids: List[Dict[str, str]] = []
+    seen: set = set()
+    for kind, pattern in TAX_ID_PATTERNS:
+        for match in pattern.finditer(text):
+            value: str = match.group(1).replace('.', '')
+            if kind == 'NIT' and match.lastindex and match.lastindex >= 2 and match.group(2):
+                value = f"{value}-{match.group(2)}"
+            if (kind, value) not in seen:
+                seen.add((kind, value))
+                tax_ids.append({'type': kind, 'value': value})
+    return tax_ids
+
+def find_merchant(lines: List[str]) -> Optional[str]:
+    """
+    Nombre del comercio: la línea anterior al primer NIT/RUT si es texto, o la primera
+    línea del encabezado con suficientes letras que no sea una etiqueta.
+    """
+    for index, line in enumerate(lines[:15]):
+        if any(pattern.search(line) for _, pattern in TAX_ID_PATTERNS) and index > 0:
+            candidate: str = lines[index - 1].strip()
+            if _looks_like_name(candidate):
+                return candidate
+            break
+    for line in lines[:6]:
+        if _looks_like_name(line.strip()):
+            return line.strip()
+    return None
+
+def _looks_like_name(line: str) -> bool:
+    letters: int = len(LETTER_PATTERN.findall(line))
+    return letters >= 3 and letters >= len(line) * 0.5 and not MERCHANT_SKIP_PATTERN.search(line)
+
+def extract_financial_fields(text: Optional[str], locale: str = DEFAULT_LOCALE) -> Dict[str, Any]:
+    """
+    Extrae los campos financieros de un texto OCR de recibo o extracto.
+
+    Es una función pura (sin E/S), apta para ejecutarse en procesos de trabajo.
+
+    Args:
+        text: Texto extraído por OCR
+        locale: Configuración regional para interpretar montos y fechas
+
+    Returns:
+        Dict[str, Any]: ``total``, ``subtotal``, ``tax``, ``currency``, ``date``, ``dates``,
+        ``merchant``, ``tax_ids``, ``amounts`` y ``confidence`` (0 a 1)
+    """
+    result: Dict[str, Any] = {
+        'total': None, 'subtotal': None, 'tax': None, 'currency': None, 'date': None,
+        'dates': [], 'merchant': None, 'tax_ids': [], 'amounts': [], 'confidence': 0.0,
+    }
+    if not text or not text.strip():
+        return result
+
+    lines: List[str] = [line for line in text.splitlines() if line.strip()]
+    default_currency: str = LOCALES.get(locale, LOCALES[DEFAULT_LOCALE])[1]
+
+    total: Optional[Decimal] = None
+    total_rank: int = 0
+    subtotal: Optional[Decimal] = None
+    tax: Optional[Decimal] = None
+    currency: Optional[str] = None
+    all_amounts: List[Decimal] = []
+
+    for index, line in enumerate(lines):
+        amounts = find_amounts(line, locale)
+        # Algunos recibos ponen la etiqueta en una línea y el valor en la siguiente
+        if not amounts and index + 1 < len(lines) and (TOTAL_LINE_PATTERN.search(line) or TAX_LINE_PATTERN.search(line)):
+            amounts = find_amounts(lines[index + 1], locale)
+        if not amounts:
+            continue
+
+        labeled: bool = bool(SUBTOTAL_PATTERN.search(line) or TOTAL_LINE_PATTERN.search(line) or TAX_LINE_PATTERN.search(line))
+        labeled = labeled and not TOTAL_COUNT_PATTERN.search(line)
+        # Fuera de las líneas etiquetadas solo cuentan los valores con símbolo de moneda,
+        # para no confundir cantidades, teléfonos o NIT con montos
+        all_amounts.extend(value for value, _, had_symbol in amounts if had_symbol or labeled)
+        currency = currency or next((cur for _, cur, _ in amounts if cur), None)
+        if not labeled:
+            continue
+        line_value: Decimal = max(value for value, _, _ in amounts)
+
+        if SUBTOTAL_PATTERN.search(line):
+            subtotal = line_value
+        elif FINAL_TOTAL_PATTERN.search(line):
+            # Entre etiquetas del mismo rango, la última del recibo suele ser la definitiva
+            total, total_rank = line_value, 2
+        elif TAX_LINE_PATTERN.search(line):
+            # "TOTAL IVA" es el impuesto, no el total
+            if tax is None:
+                tax = line_value
+        elif TOTAL_LINE_PATTERN.search(line) and total_rank <= 1:
+            total, total_rank = line_value, 1
+
+    confidence: float = 0.0
+    if total is not None:
+        confidence += 0.5
+    elif all_amounts:
+        total = max(all_amounts)
+        confidence += 0.2
+
+    dates: List[str] = find_dates(text, locale)
+    tax_ids: List[Dict[str, str]] = find_tax_ids(text)
+    merchant: Optional[str] = find_merchant(lines)
+    confidence += 0.2 if dates else 0.0
+    confidence += 0.15 if tax_ids else 0.0
+    confidence += 0.15 if merchant else 0.0
+
+    result.update({
+        'total': float(total) if total is not None else None,
+        'subtotal': float(subtotal) if subtotal is not None else None,
+        'tax': float(tax) if tax is not None else None,
+        'currency': currency or (default_currency if all_amounts else None),
+        'date': dates[0] if dates else None,
+        'dates': dates[:5],
+        'merchant': merchant[:120] if merchant else None,
+        'tax_ids': tax_ids[:5],
+        'amounts': [float(value) for value in sorted(set(all_amounts), reverse=True)[:10]],
+        'confidence': round(min(confidence, 1.0), 2),
+    })
+    return result
+
+def _extract_item(item: Tuple[str, Optional[str], str]) -> Tuple[str, Dict[str, Any]]:
+    key, text, locale = item
+    return key, extract_financial_fields(text, locale)
+
+class FinancialExtractionService:
+    @staticmethod
+    def extract(text: Optional[str], locale: str = DEFAULT_LOCALE) -> Dict[str, Any]:
+        """Extrae montos, moneda, fechas, comercio e identificaciones tributarias de un texto OCR."""
+        return extract_financial_fields(text, locale)
+
+    @staticmethod
+    def process_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+        """
+        Pool de procesos para ``extract_many``, pensado para reutilizarse en toda una ejecución.
+
+        Los procesos se crean con ``spawn`` y no con ``fork``: el proceso padre suele tener
+        abiertos canales gRPC (lecturas de Firestore en streaming) que no sobreviven a un fork.
+        """
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    @staticmethod
+    def extract_many(items: Iterable[Tuple[str, Optional[str]]], locale: str = DEFAULT_LOCALE,
+                     workers: Optional[int] = None, chunksize: int = 64,
+                     executor: Optional[ProcessPoolExecutor] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Extrae campos de muchos textos en paralelo usando todos los núcleos.
+
+        Args:
+            items: Pares ``(clave, texto)``, p. ej. ``(media_id, ocr_text)``
+            locale: Configuración regional de los textos
+            workers: Número de procesos (por defecto, uno por núcleo); se ignora con ``executor``
+            chunksize: Textos enviados a cada proceso por tarea
+            executor: Pool de ``process_pool()`` a reutilizar; sin él se crea uno para esta llamada
+
+        Returns:
+            Iterator[Tuple[str, Dict[str, Any]]]: Pares ``(clave, campos)`` en el orden de entrada
+        """
+        if executor is not None:
+            yield from executor.map(_extract_item, ((key, text, locale) for key, text in items), chunksize=chunksize)
+            return
+        with FinancialExtractionService.process_pool(workers) as pool:
+            yield from pool.map(_extract_item, ((key, text, locale) for key, text in items), chunksize=chunksize)
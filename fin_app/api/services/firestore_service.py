@@ -1,65 +1,212 @@
 # file: /api/services/firestore_service.py
 
-import firebase_admin
+import datetime as dt
 
-from firebase_admin import firestore
+from contextlib import contextmanager
 
-from google.cloud.firestore_v1.client import Client
-from google.cloud.firestore_v1.document import DocumentReference, DocumentSnapshot
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from typing import Dict, Optional
+from api.services.document_backends import DocumentBackend, FirestoreBackend, create_backend
 
-from api.config import logger
+# Backend de documentos configurado en PERSISTENCE_BACKEND (Firestore o SQLite local)
+backend : DocumentBackend = create_backend()
 
-app = firebase_admin.initialize_app()
-db : Client = firestore.client()
-
-def get_firestore_client() -> Client:
-    """Obtener el cliente de Firestore."""
-    return db
+def get_firestore_client() -> Optional[Any]:
+    """Obtener el cliente de Firestore (None si la persistencia no usa Firestore)."""
+    return backend.client if isinstance(backend, FirestoreBackend) else None
 
 class FirestoreService:
     @staticmethod
-    def get_document(collection : str, doc_id : str) -> Optional[Dict]:
-        doc_ref : DocumentReference = db.collection(collection).document(doc_id)
-        doc : DocumentSnapshot = doc_ref.get()
-        
-        if not doc.exists:
-            return None
-        
-        return {"id": doc.id, **doc.to_dict()}
-    
+    def get_document(collection : str, doc_id : str, fields : Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """
+        Obtiene un documento, opcionalmente proyectado a ``fields`` (rutas con ``.``).
+
+        Con una proyección el resultado solo contiene los campos pedidos, por lo que
+        no debe usarse para reescribir el documento completo.
+        """
+        doc, _ = backend.get_document_version(collection, doc_id, fields)
+        return doc
+
+    @staticmethod
+    def get_document_version(collection : str, doc_id : str, fields : Optional[Iterable[str]] = None) -> Tuple[Optional[Dict], Optional[dt.datetime]]:
+        """
+        Obtiene un documento junto con su ``update_time``, para usarlo como precondición
+        de una escritura condicional (``update_document(..., last_update_time=...)``).
+        """
+        return backend.get_document_version(collection, doc_id, fields)
+
+    @staticmethod
+    def get_many(collection : str, doc_ids : Iterable[str], fields : Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """
+        Obtiene varios documentos de una colección en un solo RPC (``get_all``).
+
+        Args:
+            collection: Nombre de la colección
+            doc_ids: IDs de los documentos; los repetidos o vacíos se ignoran
+            fields: Proyección opcional de campos a devolver
+
+        Returns:
+            Dict[str, Dict]: Documentos encontrados indexados por ID (los inexistentes se omiten)
+        """
+        unique_ids : List[str] = list(dict.fromkeys(doc_id for doc_id in doc_ids if doc_id))
+        if not unique_ids:
+            return {}
+
+        return backend.get_many(collection, unique_ids, fields)
+
     @staticmethod
     def exists(collection : str, doc_id : str) -> bool:
-        doc_ref : DocumentReference = db.collection(collection).document(doc_id)
-        return doc_ref.get().exists
-    
+        return backend.exists(collection, doc_id)
+
     @staticmethod
     def create_document(collection : str, doc_id : str, data : Dict) -> Dict:
-        doc_ref : DocumentReference = db.collection(collection).document(doc_id)
-        doc_ref.set(data)
+        return FirestoreService.set_document(collection, doc_id, data)
+
+    @staticmethod
+    def create_if_absent(collection : str, doc_id : str, data : Dict) -> Optional[dt.datetime]:
+        """
+        Crea el documento solo si no existe (precondición ``exists=False``).
+
+        Returns:
+            Optional[dt.datetime]: ``update_time`` del documento creado o None si ya existía
+        """
+        return backend.create_if_absent(collection, doc_id, data)
+
+    @staticmethod
+    def set_document(collection : str, doc_id : str, data : Dict, merge : bool = False, writer : Optional[Any] = None) -> Dict:
+        """
+        Escribe un documento completo (o solo sus campos con ``merge=True``) sin leerlo antes.
 
+        Args:
+            collection: Nombre de la colección
+            doc_id: ID del documento
+            data: Campos a escribir
+            merge: Fusionar con el documento existente en lugar de reemplazarlo
+            writer: BulkWriter abierto con ``bulk_writer()``; si se indica, la escritura
+                se encola en él y se envía en lote en lugar de hacer un RPC inmediato
+        """
+        backend.set_document(collection, doc_id, data, merge=merge, writer=writer)
         return {"id": doc_id, **data}
-    
-    @staticmethod
-    def update_document(collection : str, doc_id : str, data : Dict) -> Optional[Dict]:
-        doc_ref : DocumentReference = db.collection(collection).document(doc_id)
-        doc : DocumentSnapshot = doc_ref.get()
-        
-        if not doc.exists:
-            return None
-        
-        doc_ref.update(data)
-        updated_doc : DocumentSnapshot = doc_ref.get()
-        return {"id": doc_id, **updated_doc.to_dict()}
-    
-    @staticmethod
-    def delete_document(collection: str, doc_id: str) -> bool:
-        doc_ref : DocumentReference = db.collection(collection).document(doc_id)
-        doc : DocumentSnapshot = doc_ref.get()
-
-        if not doc.exists:
-            return False
-        
-        doc_ref.delete()
-        return True
\ No newline at end of file
+
+    @staticmethod
+    def set_many(writes : Iterable[Tuple[str, str, Dict]], merge : bool = False) -> None:
+        """
+        Escribe varios documentos ``(colección, id, datos)`` de forma atómica en un solo commit.
+
+        Pensado para escrituras pequeñas que deben aplicarse juntas (máximo 500 por lote);
+        para volúmenes grandes usar ``bulk_writer()``.
+        """
+        backend.set_many(writes, merge=merge)
+
+    @staticmethod
+    def stream_documents(collection : str, filters : Optional[Iterable[Tuple[str, str, Any]]] = None, order_by : Optional[str] = None, fields : Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        """
+        Recorre los documentos de una colección que cumplen los filtros sin cargarlos todos en memoria.
+
+        Args:
+            collection: Nombre de la colección
+            filters: Tuplas ``(campo, operador, valor)`` combinadas con AND
+            order_by: Campo por el que ordenar de forma ascendente
+            fields: Proyección opcional de campos a devolver
+        """
+        return backend.stream_documents(collection, filters, order_by, fields)
+
+    @staticmethod
+    def count_documents(collection : str, filters : Optional[Iterable[Tuple[str, str, Any]]] = None) -> int:
+        """
+        Cuenta los documentos que cumplen los filtros con una agregación en el servidor
+        (se factura por bloques de índice leídos, sin transferir los documentos).
+        """
+        return backend.count_documents(collection, filters)
+
+    @staticmethod
+    def query_page(collection : str, filters : Optional[Iterable[Tuple[str, str, Any]]] = None, order_by : Iterable[Tuple[str, str]] = (), limit : int = 20, start_after : Optional[Dict[str, Any]] = None, fields : Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Obtiene una página de una consulta usando paginación por cursor (keyset).
+
+        El coste es proporcional a ``limit`` y no a la posición de la página, porque
+        Firestore continúa directamente desde los valores de ``start_after`` en el índice.
+
+        Args:
+            collection: Nombre de la colección
+            filters: Tuplas ``(campo, operador, valor)`` combinadas con AND
+            order_by: Tuplas ``(campo, 'ASCENDING' | 'DESCENDING')``; para un orden total
+                el último campo debería ser ``__name__``
+            limit: Número máximo de documentos a devolver
+            start_after: Valores de los campos de ``order_by`` del último documento de la
+                página anterior (``__name__`` admite el ID del documento)
+            fields: Proyección opcional de campos a devolver
+        """
+        return backend.query_page(collection, filters, order_by, limit, start_after, fields)
+
+    @staticmethod
+    def update_document(collection : str, doc_id : str, data : Dict, last_update_time : Optional[dt.datetime] = None, read_back : bool = True) -> Optional[Dict]:
+        """
+        Actualiza campos de un documento existente en un solo RPC condicional.
+
+        La precondición ``exists`` implícita del update hace que falle sin lectura previa
+        si el documento no existe. Con ``last_update_time`` la escritura solo se aplica si
+        el documento no cambió desde esa marca de tiempo.
+
+        Args:
+            collection: Nombre de la colección
+            doc_id: ID del documento
+            data: Campos a actualizar
+            last_update_time: Marca ``update_time`` esperada del documento
+            read_back: Releer el documento tras actualizarlo; si es False se devuelven
+                los campos escritos sin RPC adicional
+
+        Returns:
+            Optional[Dict]: Documento actualizado o None si no existe
+
+        Raises:
+            DocumentConflictError: Si el documento cambió desde ``last_update_time``
+        """
+        return backend.update_document(collection, doc_id, data, last_update_time, read_back)
+
+    @staticmethod
+    def update_document_version(collection : str, doc_id : str, data : Dict, last_update_time : Optional[dt.datetime] = None) -> Optional[dt.datetime]:
+        """
+        Igual que ``update_document(..., read_back=False)``, pero devuelve el ``update_time``
+        que dejó la escritura, para encadenar otra escritura condicional sin releer.
+
+        Returns:
+            Optional[dt.datetime]: Nueva versión del documento o None si no existe
+
+        Raises:
+            DocumentConflictError: Si el documento cambió desde ``last_update_time``
+        """
+        return backend.update_document_version(collection, doc_id, data, last_update_time)
+
+    @staticmethod
+    def increment(collection : str, doc_id : str, field : str, amount : int = 1, extra : Optional[Dict] = None) -> int:
+        """
+        Incrementa un contador de forma atómica (crea el documento si no existe) y devuelve su nuevo valor.
+
+        El incremento lo aplica el servidor, así que no se pierden sumas concurrentes; el
+        valor devuelto se lee después y puede incluir incrementos de otros procesos.
+        """
+        return backend.increment(collection, doc_id, field, amount, extra)
+
+    @staticmethod
+    def delete_document(collection: str, doc_id: str, writer : Optional[Any] = None) -> bool:
+        return backend.delete_document(collection, doc_id, writer)
+
+    @staticmethod
+    @contextmanager
+    def bulk_writer() -> Iterator[Any]:
+        """
+        Abre un BulkWriter para inserciones masivas y espera a que se envíe todo al salir.
+
+        Las escrituras se agrupan en lotes de 20 documentos y se envían en paralelo,
+        con reintentos automáticos. Un BulkWriter no es seguro entre hilos: cada hilo
+        debe abrir el suyo. Con el backend SQLite las escrituras se aplican en
+        transacciones de ``SQLITE_BATCH_SIZE`` operaciones.
+
+        Uso:
+            with FirestoreService.bulk_writer() as writer:
+                for media in medias:
+                    media.save(writer=writer)
+        """
+        with backend.bulk_writer() as writer:
+            yield writer
@@ -0,0 +1,168 @@
+# file: /api/services/lanes.py
+
+import threading
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from api.services.deadline import DeadlineExceededError, remaining
+from api.services.payload_parser import MEDIA_TYPES, TEXT, InboundMessage, parse_pubsub_data, parse_value, select_message
+from api.config import (
+    logger,
+    LANE_INTERACTIVE_CONCURRENCY,
+    LANE_INTERACTIVE_DEADLINE_SECONDS,
+    LANE_MEDIA_CONCURRENCY,
+    LANE_MEDIA_DEADLINE_SECONDS,
+    MEDIA_BATCH_MAX_WAITING,
+)
+
+INTERACTIVE = "interactive"
+MEDIA = "media"
+
+class Lane:
+    """
+    Carril de procesamiento con su propio límite de concurrencia y presupuesto de tiempo.
+
+    Los mensajes de texto y los archivos se atienden en carriles distintos para que una
+    ráfaga de PDFs o imágenes esperando OCR no deje sin hilos a las respuestas de texto.
+    Cuando un carril está lleno se rechaza el mensaje (Pub/Sub lo reintenta con backoff)
+    en lugar de encolarlo en un hilo bloqueado.
+
+    Una solicitud que solo espera (el líder de un grupo de archivos durante la ventana)
+    puede soltar su hilo con ``released()``; como mucho ``max_waiting`` lo hacen a la vez.
+    """
+
+    def __init__(self, name: str, concurrency: int, deadline_seconds: float, max_waiting: int = 0):
+        self.name = name
+        self.concurrency = concurrency
+        self.deadline_seconds = deadline_seconds
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.waiting_slots = threading.BoundedSemaphore(max_waiting) if max_waiting > 0 else None
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.in_flight += 1
+            self.accepted += 1
+        return True
+
+    @contextmanager
+    def released(self) -> Iterator[None]:
+        """
+        Suelta el hilo del carril mientras dura el bloque y lo recupera al salir, esperando
+        como mucho lo que queda del presupuesto de la solicitud.
+
+        Si ya hay ``max_waiting`` solicitudes esperando, el bloque se ejecuta sin soltar el hilo.
+
+        Raises:
+            DeadlineExceededError: Si el presupuesto se agota antes de recuperar el hilo
+        """
+        if self.waiting_slots is None or not self.waiting_slots.acquire(blocking=False):
+            yield
+            return
+        with self.lock:
+            self.in_flight -= 1
+            self.waiting += 1
+        self.slots.release()
+        try:
+            yield
+        finally:
+            left: Optional[float] = remaining()
+            acquired: bool = self.slots.acquire(timeout=max(0.0, left)) if left is not None else self.slots.acquire()
+            with self.lock:
+                self.waiting -= 1
+                self.in_flight += acquired
+            self.waiting_slots.release()
+            if not acquired:
+                _held.set(None)
+                raise DeadlineExceededError(f"Sin hilo libre en el carril {self.name} antes del límite")
+
+    def release(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "concurrency": self.concurrency,
+                "deadline_s": self.deadline_seconds,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+            }
+
+lanes: Dict[str, Lane] = {
+    INTERACTIVE: Lane(INTERACTIVE, LANE_INTERACTIVE_CONCURRENCY, LANE_INTERACTIVE_DEADLINE_SECONDS),
+    MEDIA: Lane(MEDIA, LANE_MEDIA_CONCURRENCY, LANE_MEDIA_DEADLINE_SECONDS, MEDIA_BATCH_MAX_WAITING),
+}
+
+# Carril cuyo hilo ocupa la solicitud en curso (None fuera de ``lane_scope`` o si lo perdió)
+_held: ContextVar[Optional[Lane]] = ContextVar("lane", default=None)
+
+@contextmanager
+def lane_scope(lane: Lane) -> Iterator[None]:
+    """Registra el carril ya adquirido como el de la solicitud en curso y lo libera al salir."""
+    token = _held.set(lane)
+    try:
+        yield
+    finally:
+        if _held.get() is lane:
+            lane.release()
+        _held.reset(token)
+
+@contextmanager
+def lane_released() -> Iterator[None]:
+    """``Lane.released()`` del carril de la solicitud en curso (sin carril no hace nada)."""
+    lane: Optional[Lane] = _held.get()
+    if lane is None:
+        yield
+        return
+    with lane.released():
+        yield
+
+def classify(message: Optional[InboundMessage]) -> str:
+    """
+    Carril de un mensaje: los archivos y las solicitudes "ocr" (que vuelven a analizar un
+    archivo) van a ``media``; el resto del texto a ``interactive``.
+    """
+    if message is None:
+        return INTERACTIVE
+    if message.type in MEDIA_TYPES:
+        return MEDIA
+    if message.type == TEXT and message.context_id and message.body.strip().lower() == "ocr":
+        return MEDIA
+    return INTERACTIVE
+
+def classify_message(message_data: Dict[str, Any]) -> str:
+    """Carril de un payload publicado por el webhook (``{message, value, ...}``)."""
+    messages = parse_value(message_data.get("value") or {})
+    return classify(select_message(messages, (message_data.get("message") or {}).get("id")))
+
+def lane_for_envelope(envelope: Dict[str, Any]) -> Lane:
+    """
+    Carril de un mensaje push de Pub/Sub: el atributo ``lane`` puesto al publicar o, para
+    mensajes publicados sin él, la clasificación del payload.
+    """
+    message: Dict[str, Any] = envelope.get("message") or {}
+    name: Optional[str] = (message.get("attributes") or {}).get("lane")
+    if name not in lanes:
+        try:
+            name = classify(parse_pubsub_data(message.get("data", ""))[1])
+        except Exception as e:
+            logger.warning(f"No se pudo clasificar el mensaje de Pub/Sub, se usa el carril interactivo: {str(e)}")
+            name = INTERACTIVE
+    return lanes[name]
+
+def lane_metrics() -> Dict[str, Dict[str, Any]]:
+    return {name: lane.metrics() for name, lane in lanes.items()}
@@ -0,0 +1,193 @@
+# file: /api/services/media_batch_service.py
+
+import time
+import uuid
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud.firestore_v1 import ArrayUnion
+
+from api.config import (
+    logger,
+    COLLECTION_MEDIA_BATCHES,
+    LANE_MEDIA_DEADLINE_SECONDS,
+    MEDIA_BATCH_MAX_ITEMS,
+    MEDIA_BATCH_MAX_WAIT_SECONDS,
+    MEDIA_BATCH_WINDOW_SECONDS,
+)
+from api.services.deadline import DeadlineExceededError, remaining
+from api.services.document_backends import DocumentConflictError
+from api.services.firestore_service import FirestoreService
+from api.services.lanes import lane_released
+
+# Intentos de unirse a (o cerrar) un grupo cuando otra escritura gana la carrera
+MAX_ATTEMPTS: int = 5
+# Tiempo del presupuesto de la solicitud que el líder reserva para analizar el grupo
+PROCESSING_RESERVE_SECONDS: float = 30.0
+
+class MediaBatchService:
+    """
+    Agrupa las ráfagas de archivos de una conversación en un solo trabajo.
+
+    Cada conversación (número de teléfono) tiene como mucho un grupo abierto en
+    ``COLLECTION_MEDIA_BATCHES``. El primer archivo lo crea y queda como líder; los que
+    llegan mientras está abierto se agregan al grupo y su mensaje de Pub/Sub se confirma
+    sin procesarlo. El líder espera a que pasen ``MEDIA_BATCH_WINDOW_SECONDS`` sin archivos
+    nuevos (o ``MEDIA_BATCH_MAX_WAIT_SECONDS`` desde el primero), cierra el grupo y analiza
+    todos los archivos en lote con una sola respuesta.
+
+    Las uniones y el cierre son escrituras condicionales sobre el ``update_time`` del
+    grupo, así que un archivo nunca entra en un grupo ya cerrado. Un grupo cerrado solo se
+    reemplaza cuando el líder respondió (``done``) o cuando vence; mientras tanto los
+    archivos nuevos se procesan solos. Si el líder se reentrega retoma su grupo; si muere
+    sin volver, sus archivos quedan sin procesar para ``tools.reprocess_media``.
+    """
+
+    @staticmethod
+    def enabled() -> bool:
+        return MEDIA_BATCH_WINDOW_SECONDS > 0 and MEDIA_BATCH_MAX_ITEMS > 1
+
+    @staticmethod
+    def stale(batch: Dict[str, Any], now: datetime) -> bool:
+        """El líder ya tendría que haber terminado (o murió) con el grupo abierto."""
+        opened_at: Optional[datetime] = batch.get('opened_at')
+        limit: timedelta = timedelta(seconds=MEDIA_BATCH_MAX_WAIT_SECONDS + LANE_MEDIA_DEADLINE_SECONDS)
+        return opened_at is None or now - opened_at > limit
+
+    @staticmethod
+    def join(phone_number: str, item: Dict[str, Any]) -> Optional[Tuple[str, bool]]:
+        """
+        Agrega un archivo al grupo abierto de la conversación o abre uno nuevo.
+
+        Args:
+            phone_number: Número de la conversación (ID del grupo)
+            item: Datos del archivo (``media_id``, ``media_type``, ``storage_path``, ``caption``)
+
+        Returns:
+            Optional[Tuple[str, bool]]: ``(batch_id, es_líder)``; None si el archivo debe
+                procesarse solo (grupo lleno, grupo cerrado aún en proceso o error al coordinar)
+        """
+        media_id: str = item['media_id']
+        for _ in range(MAX_ATTEMPTS):
+            now: datetime = datetime.now(timezone.utc)
+            batch_id: str = uuid.uuid4().hex
+            opened: Dict[str, Any] = {
+                'batch_id': batch_id,
+                'leader': media_id,
+                'items': [item],
+                'opened_at': now,
+                'last_arrival_at': now,
+                'closed': False,
+                'done': False,
+            }
+            try:
+                batch, version = FirestoreService.get_document_version(COLLECTION_MEDIA_BATCHES, phone_number)
+                if batch is None:
+                    if FirestoreService.create_if_absent(COLLECTION_MEDIA_BATCHES, phone_number, opened) is not None:
+                        return batch_id, True
+                    continue
+
+                media_ids: List[str] = [entry.get('media_id') for entry in batch.get('items') or []]
+                if media_id in media_ids:
+                    # Reentrega de Pub/Sub: el líder retoma su grupo si aún no respondió
+                    return batch['batch_id'], batch.get('leader') == media_id and not batch.get('done')
+
+                stale: bool = MediaBatchService.stale(batch, now)
+                if not batch.get('closed') and not stale:
+                    if len(media_ids) >= MEDIA_BATCH_MAX_ITEMS:
+                        return None
+                    FirestoreService.update_document(COLLECTION_MEDIA_BATCHES, phone_number, {
+                        'items': ArrayUnion([item]),
+                        'last_arrival_at': now,
+                    }, last_update_time=version, read_back=False)
+                    return batch['batch_id'], False
+
+                if not batch.get('done') and not stale:
+                    # El líder aún procesa el grupo cerrado: reemplazarlo perdería sus archivos
+                    # si el líder se reentrega, así que este archivo se procesa solo
+                    return None
+
+                FirestoreService.update_document(COLLECTION_MEDIA_BATCHES, phone_number, opened, last_update_time=version, read_back=False)
+                return batch_id, True
+            except DocumentConflictError:
+                continue
+            except Exception as e:
+                logger.error(f"No se pudo agrupar el archivo {media_id} de {phone_number}: {str(e)}")
+                return None
+
+        logger.warning(f"Demasiada contención al agrupar el archivo {media_id} de {phone_number}; se procesa solo")
+        return None
+
+    @staticmethod
+    def collect(phone_number: str, batch_id: str, item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Espera a que termine la ráfaga, cierra el grupo y devuelve sus archivos (solo el líder).
+
+        La espera se acorta para dejar ``PROCESSING_RESERVE_SECONDS`` del presupuesto de la
+        solicitud al análisis, y durante ella el líder suelta su hilo del carril de archivos
+        (``lane_released``) para no bloquear los archivos de otras conversaciones. Si el grupo
+        ya no existe o no se puede leer, devuelve solo ``item`` (el archivo del líder).
+
+        Raises:
+            DeadlineExceededError: Si tras la espera no se recupera un hilo del carril a
+                tiempo; el mensaje se reintenta y el líder retoma su grupo
+        """
+        for _ in range(MAX_ATTEMPTS * MEDIA_BATCH_MAX_ITEMS):
+            try:
+                batch, version = FirestoreService.get_document_version(COLLECTION_MEDIA_BATCHES, phone_number)
+                if batch is None or batch.get('batch_id') != batch_id:
+                    logger.warning(f"El grupo {batch_id} de {phone_number} fue reemplazado; se procesa solo el archivo del líder")
+                    return [item]
+
+                items: List[Dict[str, Any]] = batch.get('items') or [item]
+                if batch.get('closed'):
+                    return items
+
+                now: datetime = datetime.now(timezone.utc)
+                close_at: datetime = min(
+                    batch['opened_at'] + timedelta(seconds=MEDIA_BATCH_MAX_WAIT_SECONDS),
+                    batch['last_arrival_at'] + timedelta(seconds=MEDIA_BATCH_WINDOW_SECONDS),
+                )
+                left: Optional[float] = remaining()
+                if left is not None:
+                    close_at = min(close_at, now + timedelta(seconds=max(0.0, left - PROCESSING_RESERVE_SECONDS)))
+
+                if len(items) < MEDIA_BATCH_MAX_ITEMS and now < close_at:
+                    with lane_released():
+                        time.sleep((close_at - now).total_seconds())
+                    continue
+
+                FirestoreService.update_document(COLLECTION_MEDIA_BATCHES, phone_number, {
+                    'closed': True,
+                    'closed_at': now,
+                }, last_update_time=version, read_back=False)
+                logger.info(f"Grupo {batch_id} de {phone_number} cerrado con {len(items)} archivos")
+                return items
+            except DocumentConflictError:
+                # Llegó otro archivo mientras se cerraba: se vuelve a leer el grupo
+                continue
+            except DeadlineExceededError:
+                raise
+            except Exception as e:
+                logger.error(f"No se pudo cerrar el grupo {batch_id} de {phone_number}: {str(e)}")
+                return [item]
+
+        logger.error(f"No se pudo cerrar el grupo {batch_id} de {phone_number} tras {MAX_ATTEMPTS * MEDIA_BATCH_MAX_ITEMS} intentos")
+        return [item]
+
+    @staticmethod
+    def complete(phone_number: str, batch_id: str) -> bool:
+        """Marca el grupo como respondido, para que una reentrega del líder no lo repita."""
+        try:
+            batch, version = FirestoreService.get_document_version(COLLECTION_MEDIA_BATCHES, phone_number, fields=['batch_id'])
+            if batch is None or batch.get('batch_id') != batch_id:
+                return False
+            FirestoreService.update_document(COLLECTION_MEDIA_BATCHES, phone_number, {
+                'done': True,
+                'done_at': datetime.now(timezone.utc),
+            }, last_update_time=version, read_back=False)
+            return True
+        except Exception as e:
+            logger.error(f"No se pudo marcar como respondido el grupo {batch_id} de {phone_number}: {str(e)}")
+            return False
@@ -0,0 +1,251 @@
+# file: /api/services/media_cache.py
+
+import os
+import mmap
+import hashlib
+import threading
+
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from api.config import logger, MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES, MEDIA_CACHE_MAX_OBJECT_BYTES
+
+# Fracción del límite que un proceso escribe antes de volver a medir el directorio compartido
+RESCAN_FRACTION: int = 32
+
+def cache_key(bucket_name: str, object_path: str) -> str:
+    """Nombre base del archivo en caché para un objeto (hash de ``bucket/ruta``)."""
+    return hashlib.sha256(f"{bucket_name}/{object_path}".encode("utf-8")).hexdigest()[:40]
+
+class MediaCache:
+    """
+    Caché en disco local de objetos de GCS, acotada en bytes y con expulsión LRU.
+
+    Cada entrada es un archivo ``<hash de bucket/ruta>.<generación>``: si el objeto se
+    sobrescribe en GCS cambia la generación y la entrada vieja deja de coincidir. Los
+    objetos de ``whatsapp_media`` se escriben una sola vez (la ruta incluye el media_id),
+    así que una entrada presente se sirve sin ninguna llamada a GCS.
+
+    Las lecturas usan ``mmap``: los rangos se copian directamente de la caché de páginas
+    del sistema operativo sin leer el archivo completo. Las escrituras van a un archivo
+    temporal y se publican con ``os.replace``, por lo que varios procesos (los workers de
+    gunicorn) comparten el mismo directorio: un objeto que no está en el índice de este
+    proceso se busca en disco antes de darlo por ausente, y el límite se aplica sobre todo
+    el directorio, que se vuelve a medir cada vez que el proceso escribe
+    ``max_bytes / RESCAN_FRACTION`` bytes (expulsando por fecha de último uso). Un archivo
+    expulsado por otro proceso simplemente cuenta como fallo.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_object_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        # hash -> (generación, tamaño), del menos al más recientemente usado
+        self.entries: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.scan_lock = threading.Lock()
+        self.rescan_bytes = max(1, max_bytes // RESCAN_FRACTION)
+        self.written_since_scan = 0
+        self.enabled = max_bytes > 0
+        if self.enabled:
+            self._load()
+
+    def _load(self) -> None:
+        """Recupera las entradas existentes en el directorio, ordenadas por último acceso."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._rescan()
+            logger.info(f"Caché de medios con {len(self.entries)} archivos ({self.total_bytes} bytes)")
+        except OSError as e:
+            logger.error(f"No se pudo inicializar la caché de medios en {self.directory}: {str(e)}")
+            self.enabled = False
+
+    def _scan(self, prefix: str = "") -> List[Tuple[float, str, int, int]]:
+        """Entradas ``(mtime, hash, generación, tamaño)`` del directorio cuyo nombre empieza por ``prefix``."""
+        found: List[Tuple[float, str, int, int]] = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.startswith(prefix):
+                    continue
+                name, _, generation = entry.name.partition(".")
+                if not generation.isdigit() or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, name, int(generation), stat.st_size))
+        return sorted(found)
+
+    def _rescan(self) -> None:
+        """
+        Reconstruye el índice con lo que hay en el directorio compartido (incluidos los
+        archivos de otros procesos) y expulsa los menos usados hasta quedar bajo el límite.
+        """
+        if not self.scan_lock.acquire(blocking=False):
+            return
+        try:
+            entries: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+            for _, name, generation, size in self._scan():
+                previous = entries.pop(name, None)
+                if previous is not None:
+                    # Generación anterior del mismo objeto: ya no se puede servir
+                    self._remove(name, previous[0])
+                entries[name] = (generation, size)
+            with self.lock:
+                self.entries = entries
+                self.total_bytes = sum(size for _, size in entries.values())
+                self.written_since_scan = 0
+                self._evict()
+        finally:
+            self.scan_lock.release()
+
+    def _find(self, name: str) -> Optional[Tuple[int, int]]:
+        """Busca en disco un objeto guardado por otro proceso y lo agrega al índice."""
+        try:
+            found = self._scan(f"{name}.")
+        except OSError:
+            return None
+        if not found:
+            return None
+        _, _, generation, size = found[-1]
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                entry = (generation, size)
+                self.entries[name] = entry
+                self.total_bytes += size
+            return entry
+
+    def _remove(self, name: str, generation: int) -> None:
+        try:
+            os.remove(self._path(name, generation))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, name: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{name}.{generation}")
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self.entries:
+            name, (generation, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self._remove(name, generation)
+
+    def _forget(self, name: str) -> None:
+        generation, size = self.entries.pop(name)
+        self.total_bytes -= size
+
+    def lookup(self, bucket_name: str, object_path: str) -> Optional[Tuple[int, int]]:
+        """Generación y tamaño de la entrada en caché de un objeto, o None si no está."""
+        if not self.enabled:
+            return None
+        name: str = cache_key(bucket_name, object_path)
+        with self.lock:
+            entry = self.entries.get(name)
+        return entry if entry is not None else self._find(name)
+
+    def read(self, bucket_name: str, object_path: str, start: int = 0, end: Optional[int] = None,
+             generation: Optional[int] = None) -> Optional[bytes]:
+        """
+        Lee un objeto (o el rango ``[start, end)``) desde la caché.
+
+        Args:
+            generation: Si se indica, solo se acepta una entrada de esa generación
+
+        Returns:
+            Optional[bytes]: Contenido o None si no está en caché
+        """
+        if not self.enabled:
+            return None
+        name: str = cache_key(bucket_name, object_path)
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is None:
+            entry = self._find(name)
+        with self.lock:
+            if entry is None or (generation is not None and entry[0] != generation):
+                self.misses += 1
+                return None
+            if name in self.entries:
+                self.entries.move_to_end(name)
+            path: str = self._path(name, entry[0])
+
+        try:
+            with open(path, "rb") as file:
+                if entry[1] == 0:
+                    data: bytes = b""
+                else:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        data = mapped[start:end]
+            # Marca de último uso visible para otros procesos al reconstruir el índice
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            with self.lock:
+                if self.entries.get(name) == entry:
+                    self._forget(name)
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, bucket_name: str, object_path: str, data: bytes, generation: Optional[int]) -> bool:
+        """
+        Guarda un objeto en la caché.
+
+        Returns:
+            bool: True si se guardó (objetos sin generación o demasiado grandes se omiten)
+        """
+        if not self.enabled or generation is None or len(data) > self.max_object_bytes:
+            return False
+        name: str = cache_key(bucket_name, object_path)
+        generation = int(generation)
+        path: str = self._path(name, generation)
+        tmp_path: str = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"No se pudo guardar en la caché de medios gs://{bucket_name}/{object_path}: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+        with self.lock:
+            previous = self.entries.get(name)
+            if previous is not None:
+                self._forget(name)
+                if previous[0] != generation:
+                    self._remove(name, previous[0])
+            self.entries[name] = (generation, len(data))
+            self.total_bytes += len(data)
+            self.written_since_scan += len(data)
+            self._evict()
+            rescan: bool = self.written_since_scan >= self.rescan_bytes
+        if rescan:
+            try:
+                self._rescan()
+            except OSError as e:
+                logger.error(f"No se pudo medir la caché de medios en {self.directory}: {str(e)}")
+        return True
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+# Instancia compartida por el proceso
+media_cache: MediaCache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES, MEDIA_CACHE_MAX_OBJECT_BYTES)
@@ -0,0 +1,159 @@
+# file: /api/services/message_archive_service.py
+
+import gzip
+import json
+import uuid
+
+from datetime import date, datetime, timezone
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from api.config import (
+    logger,
+    COLLECTION_WHATSAPP_MESSAGES,
+    COLLECTION_WHATSAPP_RAW_MESSAGES,
+    RAW_ARCHIVE_PREFIX,
+    RAW_ARCHIVE_LINES_PER_BLOCK,
+)
+from api.services.firestore_service import FirestoreService
+from api.services.cloud_storage_service import StorageService, bucket_name
+
+class MessageArchiveService:
+    """
+    Archivo en frío de los payloads crudos de WhatsApp en el almacenamiento de objetos.
+
+    Los payloads pendientes se agrupan por día en objetos NDJSON comprimidos en
+    ``{RAW_ARCHIVE_PREFIX}/dt=YYYY-MM-DD/part-*.ndjson.gz``. Cada objeto es una
+    concatenación de miembros gzip de ``RAW_ARCHIVE_LINES_PER_BLOCK`` líneas (un gzip
+    multi-miembro sigue siendo un gzip válido), y cada mensaje guarda en
+    ``raw_archive`` el offset y la longitud de su bloque, de modo que recuperarlo
+    cuesta una sola lectura por rango de unos pocos KB.
+    """
+
+    @staticmethod
+    def _encode_blocks(lines: List[bytes]) -> Iterator[Tuple[bytes, int, int]]:
+        """Comprime las líneas en bloques, devolviendo ``(bloque, índice inicial, índice final)``."""
+        for start in range(0, len(lines), RAW_ARCHIVE_LINES_PER_BLOCK):
+            chunk: List[bytes] = lines[start:start + RAW_ARCHIVE_LINES_PER_BLOCK]
+            yield gzip.compress(b"".join(chunk), compresslevel=9), start, start + len(chunk)
+
+    @staticmethod
+    def archive_day(day: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Sube los payloads de un día a un nuevo objeto comprimido y actualiza los punteros.
+
+        Args:
+            day: Fecha de la partición en formato ``YYYY-MM-DD``
+            documents: Documentos de la colección de espera (con ``id`` y ``value``)
+
+        Returns:
+            Dict[str, Any]: Ruta del objeto, mensajes archivados y bytes escritos
+        """
+        object_path: str = (
+            f"{RAW_ARCHIVE_PREFIX}/dt={day}/"
+            f"part-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.ndjson.gz"
+        )
+        storage_path: str = StorageService.storage_uri(bucket_name, object_path)
+        lines: List[bytes] = [
+            json.dumps({"id": doc["id"], "value": doc.get("value")}, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+            for doc in documents
+        ]
+
+        pointers: List[Tuple[str, Dict[str, Any]]] = []
+        offset: int = 0
+
+        def blocks() -> Iterator[bytes]:
+            nonlocal offset
+            for block, start, end in MessageArchiveService._encode_blocks(lines):
+                pointer: Dict[str, Any] = {"path": storage_path, "offset": offset, "length": len(block)}
+                pointers.extend((documents[index]["id"], pointer) for index in range(start, end))
+                offset += len(block)
+                yield block
+
+        # Subida en streaming: los bloques se envían a medida que se comprimen
+        StorageService.put_stream(bucket_name, object_path, blocks(), content_type="application/gzip", if_absent=True)
+
+        # Solo tras confirmar la subida se enlazan los mensajes y se borra la copia de espera
+        with FirestoreService.bulk_writer() as writer:
+            for message_id, pointer in pointers:
+                FirestoreService.set_document(COLLECTION_WHATSAPP_MESSAGES, message_id, {"raw_archive": pointer}, merge=True, writer=writer)
+                FirestoreService.delete_document(COLLECTION_WHATSAPP_RAW_MESSAGES, message_id, writer=writer)
+
+        logger.info(f"Archivados {len(documents)} mensajes crudos en {storage_path} ({offset} bytes)")
+        return {"path": storage_path, "messages": len(documents), "bytes": offset}
+
+    @staticmethod
+    def archive_pending(before: Optional[date] = None, max_messages_per_object: int = 50000) -> List[Dict[str, Any]]:
+        """
+        Archiva todos los payloads en espera de días anteriores a ``before`` (por defecto hoy).
+
+        Los documentos se leen en streaming ordenados por fecha y se escriben en uno o
+        varios objetos por día, sin mantener más de ``max_messages_per_object`` en memoria.
+        """
+        cutoff: str = (before or datetime.now(timezone.utc).date()).isoformat()
+        pending: Iterator[Dict[str, Any]] = FirestoreService.stream_documents(
+            COLLECTION_WHATSAPP_RAW_MESSAGES, filters=[("date", "<", cutoff)], order_by="date"
+        )
+
+        results: List[Dict[str, Any]] = []
+        for day, documents in groupby(pending, key=lambda doc: doc.get("date")):
+            chunk: List[Dict[str, Any]] = []
+            for document in documents:
+                chunk.append(document)
+                if len(chunk) >= max_messages_per_object:
+                    results.append(MessageArchiveService.archive_day(day, chunk))
+                    chunk = []
+            if chunk:
+                results.append(MessageArchiveService.archive_day(day, chunk))
+        return results
+
+    @staticmethod
+    def load_raw(message_id: str, raw_archive: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
+        """
+        Rehidrata el payload crudo de un mensaje.
+
+        Busca primero en la colección de espera y, si ya fue archivado, lee solo el
+        bloque comprimido que lo contiene.
+
+        Args:
+            message_id: ID del mensaje de WhatsApp
+            raw_archive: Puntero ``{path, offset, length}`` si ya se conoce
+
+        Returns:
+            Optional[Dict]: ``value`` original del webhook o None si no se encuentra
+        """
+        try:
+            if raw_archive is None:
+                pending: Optional[Dict] = FirestoreService.get_document(COLLECTION_WHATSAPP_RAW_MESSAGES, message_id, fields=["value"])
+                if pending:
+                    return pending.get("value")
+
+                message: Optional[Dict] = FirestoreService.get_document(COLLECTION_WHATSAPP_MESSAGES, message_id, fields=["raw_archive", "value"])
+                if not message:
+                    return None
+                if message.get("value"):
+                    # Documento antiguo con el payload completo
+                    return message["value"]
+                raw_archive = message.get("raw_archive")
+                if not raw_archive:
+                    return None
+
+            path: str = raw_archive["path"]
+            archive_bucket, object_path = StorageService.parse_storage_path(path)
+            offset: int = int(raw_archive["offset"])
+            length: int = int(raw_archive["length"])
+
+            block: Optional[bytes] = StorageService.read_range(archive_bucket, object_path, offset, offset + length)
+            if block is None:
+                return None
+
+            for line in gzip.decompress(block).splitlines():
+                record: Dict[str, Any] = json.loads(line)
+                if record.get("id") == message_id:
+                    return record.get("value")
+
+            logger.warning(f"El mensaje {message_id} no está en el bloque archivado {path}@{offset}")
+            return None
+        except Exception as e:
+            logger.error(f"Error al rehidratar el mensaje crudo {message_id}: {str(e)}")
+            return None
@@ -0,0 +1,123 @@
+# file: /api/services/payload_parser.py
+
+import json
+import base64
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+TEXT = "text"
+# Tipos de mensaje que referencian un archivo multimedia
+MEDIA_TYPES = ("image", "document", "video", "audio", "sticker")
+# Tipos que el chatbot atiende; el resto se responde como no soportado
+SUPPORTED_TYPES = ("text", "image", "document", "video", "audio")
+
+class InboundMessage:
+    """
+    Mensaje entrante de WhatsApp extraído del payload de Meta.
+
+    ``body`` es el texto del mensaje o el caption del archivo; los campos de medio solo
+    se llenan para los tipos de ``MEDIA_TYPES``. ``value`` conserva el objeto ``value``
+    original del webhook (sin copiarlo) para publicarlo o archivarlo.
+    """
+
+    __slots__ = ('id', 'sender', 'type', 'timestamp', 'body', 'media_id', 'mime_type', 'sha256',
+                 'media', 'context_id', 'phone_number_id', 'value')
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any], value: Dict[str, Any], phone_number_id: Optional[str]) -> 'InboundMessage':
+        """Extraer los campos de un elemento de ``value.messages`` en una sola pasada."""
+        get = raw.get
+        message: InboundMessage = cls.__new__(cls)
+        message_type: str = get('type') or ''
+        content: Any = get(message_type)
+        if not isinstance(content, dict):
+            content = None
+
+        message.id = get('id')
+        message.sender = get('from')
+        message.type = message_type
+        raw_timestamp: Any = get('timestamp')
+        message.timestamp = (
+            datetime.fromtimestamp(int(raw_timestamp), tz=timezone.utc)
+            if raw_timestamp and str(raw_timestamp).isdigit() else None
+        )
+
+        if content is None:
+            message.body = ''
+        elif message_type == TEXT:
+            message.body = content.get('body') or ''
+        else:
+            message.body = content.get('caption') or ''
+
+        if content is not None and message_type in MEDIA_TYPES:
+            message.media_id = content.get('id')
+            message.mime_type = content.get('mime_type') or ''
+            message.sha256 = content.get('sha256') or ''
+            message.media = content
+        else:
+            message.media_id = None
+            message.mime_type = ''
+            message.sha256 = ''
+            message.media = None
+
+        context: Any = get('context')
+        message.context_id = context.get('id') if isinstance(context, dict) else None
+        message.phone_number_id = phone_number_id
+        message.value = value
+        return message
+
+    @property
+    def supported(self) -> bool:
+        return self.type in SUPPORTED_TYPES
+
+def parse_value(value: Dict[str, Any]) -> List[InboundMessage]:
+    """Mensajes de un objeto ``value`` de Meta (los cambios de estado se ignoran)."""
+    phone_number_id: Optional[str] = (value.get('metadata') or {}).get('phone_number_id')
+    return [InboundMessage.from_raw(raw, value, phone_number_id) for raw in value.get('messages') or ()]
+
+def parse_webhook(body: Union[bytes, str, Dict[str, Any]]) -> List[InboundMessage]:
+    """
+    Decodifica el cuerpo de un webhook de Meta y devuelve todos sus mensajes, de todas
+    las entradas y cambios, en orden.
+
+    Raises:
+        ValueError: Si el cuerpo no es JSON válido
+    """
+    data: Any = json.loads(body) if not isinstance(body, dict) else body
+    if not isinstance(data, dict):
+        raise ValueError("El cuerpo del webhook no es un objeto JSON")
+    messages: List[InboundMessage] = []
+    for entry in data.get('entry') or ():
+        for change in entry.get('changes') or ():
+            messages.extend(parse_value(change.get('value') or {}))
+    return messages
+
+def select_message(messages: List[InboundMessage], message_id: Optional[str]) -> Optional[InboundMessage]:
+    """El mensaje con ``message_id`` (o el primero si no se indica o no está)."""
+    if message_id:
+        for message in messages:
+            if message.id == message_id:
+                return message
+    return messages[0] if messages else None
+
+def parse_pubsub_data(data: Union[str, bytes]) -> Tuple[Dict[str, Any], Optional[InboundMessage]]:
+    """
+    Decodifica el ``data`` (base64) de un mensaje de Pub/Sub publicado por el webhook.
+
+    Returns:
+        Tuple[Dict, Optional[InboundMessage]]: El payload publicado y el mensaje al que se
+        refiere (``payload.message.id``), o None si el payload no trae mensajes
+
+    Raises:
+        ValueError: Si ``data`` no es base64 de un objeto JSON
+    """
+    payload: Any = json.loads(base64.b64decode(data))
+    if not isinstance(payload, dict):
+        raise ValueError("El payload de Pub/Sub no es un objeto JSON")
+    message: Optional[InboundMessage] = select_message(
+        parse_value(payload.get('value') or {}), (payload.get('message') or {}).get('id')
+    )
+    if message is not None and not message.phone_number_id:
+        message.phone_number_id = payload.get('phone_business_id')
+    return payload, message
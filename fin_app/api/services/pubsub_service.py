@@ -1,29 +1,63 @@
 # file: /api/services/pubsub_service.py
 
 import json
+import threading
+
+from typing import Dict, Optional
+from api.config import logger, GOOGLE_CLOUD_PROJECT, PUBSUB_TOPIC, PUBSUB_MEDIA_TOPIC
+from api.services.dependency_guard import guard
+from api.services.deadline import remaining_timeout
+from api.services.lanes import MEDIA, classify_message
 
-from typing import Dict
-from api.config import logger, GOOGLE_CLOUD_PROJECT, PUBSUB_TOPIC
 from google.cloud import pubsub_v1
 from google.cloud.pubsub_v1.publisher.futures import Future
 
-publisher : pubsub_v1.PublisherClient = pubsub_v1.PublisherClient()
-TOPIC_PATH : str = publisher.topic_path(GOOGLE_CLOUD_PROJECT, PUBSUB_TOPIC)
+# Timeout máximo (segundos) para confirmar una publicación
+PUBLISH_TIMEOUT: float = 10.0
+
+TOPIC_PATH : str = pubsub_v1.PublisherClient.topic_path(GOOGLE_CLOUD_PROJECT, PUBSUB_TOPIC)
+MEDIA_TOPIC_PATH : str = pubsub_v1.PublisherClient.topic_path(GOOGLE_CLOUD_PROJECT, PUBSUB_MEDIA_TOPIC)
+
+# El cliente se crea en la primera publicación: importar el módulo no exige credenciales
+# (herramientas y despliegues locales que nunca publican)
+_publisher : Optional[pubsub_v1.PublisherClient] = None
+_publisher_lock : threading.Lock = threading.Lock()
+
+def get_publisher() -> pubsub_v1.PublisherClient:
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = pubsub_v1.PublisherClient()
+    return _publisher
+
+def stop_publisher() -> None:
+    """Envía las publicaciones pendientes y detiene el cliente, si llegó a crearse."""
+    if _publisher is not None:
+        _publisher.stop()
 
 class PubSubService:
     @staticmethod
-    def publish_message(message_data : Dict) -> str:
+    def publish_message(message_data : Dict, lane : Optional[str] = None) -> str:
+        """
+        Publica el mensaje en el tema de su carril (``classify_message`` si no se indica).
+
+        El carril viaja además en el atributo ``lane``, para separar los carriles con
+        suscripciones filtradas cuando comparten tema.
+        """
         if not isinstance(message_data, dict):
             logger.error("El mensaje debe ser un diccionario.")
             raise ValueError("El mensaje debe ser un diccionario.")
         
+        lane = lane or classify_message(message_data)
         codified_data : str = json.dumps(message_data).encode('utf-8')
         logger.info("")
         logger.info(f"Message data: {message_data}")
         logger.info("")
         
-        future : Future = publisher.publish(TOPIC_PATH, data=codified_data)
-        result : str = future.result()
-        logger.info(f"Mensaje publicado en PubSub: {result}")
+        with guard("pubsub").attempt():
+            future : Future = get_publisher().publish(MEDIA_TOPIC_PATH if lane == MEDIA else TOPIC_PATH, data=codified_data, lane=lane)
+            result : str = future.result(timeout=remaining_timeout(PUBLISH_TIMEOUT))
+        logger.info(f"Mensaje publicado en PubSub ({lane}): {result}")
         return result
     
\ No newline at end of file
@@ -0,0 +1,236 @@
+# file: /api/services/search_index_service.py
+
+import re
+import zlib
+import unicodedata
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from google.cloud.firestore_v1 import ArrayUnion
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from api.config import (
+    logger,
+    COLLECTION_SEARCH_INDEX,
+    COLLECTION_WHATSAPP_MEDIA,
+    COLLECTION_WHATSAPP_MESSAGES,
+    SEARCH_INDEX_SHARDS,
+)
+from api.services.firestore_service import FirestoreService
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Palabras vacías del español (ya sin tildes) que no aportan a la búsqueda
+STOPWORDS: Set[str] = {
+    "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los", "no", "o", "para",
+    "por", "que", "se", "si", "su", "sus", "un", "una", "uno", "y", "a", "e", "u", "mi", "tu",
+    "me", "te", "le", "les", "nos", "ya", "pero", "mas", "como", "este", "esta", "esto",
+}
+
+MIN_TOKEN_LENGTH: int = 2
+MAX_TOKEN_LENGTH: int = 40
+SNIPPET_RADIUS: int = 60
+# Periodo de cada generación de fragmentos (``strftime``): acota el tamaño de cada documento
+BUCKET_FORMAT: str = "%Y%m"
+
+# Tipos de documento indexados y colección/campos de donde se leen
+SOURCES: Dict[str, Tuple[str, str, str, str]] = {
+    # tipo: (colección, campo de texto, campo de tipo, campo de fecha)
+    "media": (COLLECTION_WHATSAPP_MEDIA, "ocr_text", "media_type", "created_at"),
+    "msg": (COLLECTION_WHATSAPP_MESSAGES, "text", "message_type", "timestamp"),
+}
+
+def _fold_char(char: str) -> str:
+    decomposed: str = unicodedata.normalize("NFKD", char)
+    base: str = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return base[:1] if base else " "
+
+def fold(text: str) -> str:
+    """
+    Pasa a minúsculas y elimina tildes y diéresis (``"Factura Nº 12 — Café"`` -> ``"factura no 12 — cafe"``).
+
+    Cada carácter se convierte en exactamente un carácter, así las posiciones del
+    texto plegado coinciden con las del original (útil para extraer fragmentos).
+    """
+    return "".join(_fold_char(char) for char in text.lower())
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Tokens plegados y sin palabras vacías, en orden de aparición y sin repetir."""
+    if not text:
+        return []
+    tokens: Dict[str, None] = {}
+    for token in TOKEN_PATTERN.findall(fold(text)):
+        if MIN_TOKEN_LENGTH <= len(token) <= MAX_TOKEN_LENGTH and token not in STOPWORDS:
+            tokens[token] = None
+    return list(tokens)
+
+def shard_of(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8")) % SEARCH_INDEX_SHARDS
+
+def bucket_of(moment: datetime) -> str:
+    return moment.strftime(BUCKET_FORMAT)
+
+def shard_doc_id(user_id: str, bucket: str, shard: int) -> str:
+    return f"{user_id}__{bucket}__{shard:02d}"
+
+def posting_path(term: str) -> str:
+    return FieldPath("postings", term).to_api_repr()
+
+def snippet(text: str, terms: Iterable[str]) -> str:
+    """Fragmento del texto original alrededor de la primera aparición de algún término."""
+    folded: str = fold(text)
+    positions: List[int] = [pos for pos in (folded.find(term) for term in terms) if pos >= 0]
+    if not positions:
+        return text[:2 * SNIPPET_RADIUS]
+    center: int = min(positions)
+    start: int = max(0, center - SNIPPET_RADIUS)
+    end: int = min(len(text), center + SNIPPET_RADIUS)
+    fragment: str = " ".join(text[start:end].split())
+    return ("..." if start > 0 else "") + fragment + ("..." if end < len(text) else "")
+
+class SearchIndexService:
+    """
+    Índice invertido incremental por usuario sobre el OCR y los captions.
+
+    Cada usuario tiene, por cada mes (``BUCKET_FORMAT``), ``SEARCH_INDEX_SHARDS``
+    documentos ``{user_id}__{AAAAMM}__NN`` con un mapa ``postings: {término: [ref, ...]}``;
+    el fragmento de un término se elige por hash, así que una consulta lee solo los
+    fragmentos de sus términos (de todos los meses), y además con una máscara de campos
+    que trae únicamente esas listas. Las referencias tienen la forma ``media:<media_id>``
+    o ``msg:<message_id>``.
+
+    Los meses mantienen cada documento lejos del límite de 1 MiB aunque el usuario
+    acumule miles de documentos, y ``postings`` está exento de índices en
+    ``firestore.indexes.json`` (si no, cada elemento de cada lista sería una entrada de
+    índice y pronto se superaría el límite de 40.000 por documento).
+
+    Las altas usan ``ArrayUnion`` en una escritura por lote, sin leer el índice antes,
+    por lo que son seguras ante actualizaciones concurrentes.
+    """
+
+    @staticmethod
+    def index_document(user_id: Optional[str], kind: str, doc_id: Optional[str], text: Optional[str]) -> int:
+        """
+        Añade un documento al índice del usuario.
+
+        Args:
+            user_id: ID del usuario dueño del documento (sin usuario no se indexa)
+            kind: ``media`` (texto OCR) o ``msg`` (caption de un mensaje)
+            doc_id: ID del medio o del mensaje
+            text: Texto a indexar
+
+        Returns:
+            int: Número de términos indexados
+        """
+        terms: List[str] = tokenize(text)
+        if not (user_id and doc_id and terms):
+            return 0
+
+        ref: str = f"{kind}:{doc_id}"
+        bucket: str = bucket_of(datetime.now(timezone.utc))
+        shards: Dict[int, Dict[str, Any]] = {}
+        for term in terms:
+            shards.setdefault(shard_of(term), {})[term] = ArrayUnion([ref])
+
+        try:
+            FirestoreService.set_many(
+                [
+                    (COLLECTION_SEARCH_INDEX, shard_doc_id(user_id, bucket, shard), {"user_id": user_id, "bucket": bucket, "shard": shard, "postings": postings})
+                    for shard, postings in shards.items()
+                ],
+                merge=True
+            )
+            logger.info(f"Indexados {len(terms)} términos de {ref} para el usuario {user_id}")
+            return len(terms)
+        except Exception as e:
+            logger.error(f"Error al indexar {ref} para el usuario {user_id}: {str(e)}")
+            return 0
+
+    @staticmethod
+    def lookup(user_id: str, terms: List[str]) -> List[str]:
+        """Referencias que contienen todos los términos, de la más reciente a la más antigua."""
+        if not terms:
+            return []
+
+        # Los fragmentos de los términos en todos los meses, del más antiguo al más reciente
+        # (los documentos anteriores a los meses no tienen ``bucket`` y van primero)
+        shards: List[int] = sorted({shard_of(term) for term in terms})
+        documents: List[Dict] = sorted(
+            FirestoreService.stream_documents(
+                COLLECTION_SEARCH_INDEX, [("user_id", "==", user_id), ("shard", "in", shards)],
+                fields=["bucket", *(posting_path(term) for term in terms)]
+            ),
+            key=lambda document: document.get("bucket") or ""
+        )
+
+        postings_by_term: List[List[str]] = []
+        for term in terms:
+            postings: List[str] = list(dict.fromkeys(
+                ref for document in documents for ref in (document.get("postings") or {}).get(term) or []
+            ))
+            if not postings:
+                return []
+            postings_by_term.append(postings)
+
+        # Intersección partiendo de la lista más corta; el orden de inserción es cronológico
+        postings_by_term.sort(key=len)
+        common: Set[str] = set(postings_by_term[0])
+        for postings in postings_by_term[1:]:
+            common.intersection_update(postings)
+        ordered: List[str] = [ref for ref in postings_by_term[-1] if ref in common]
+        ordered.reverse()
+        return ordered
+
+    @staticmethod
+    def search(user_id: str, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Busca documentos del usuario que contengan todas las palabras de ``query``.
+
+        Cuesta dos RPC: una consulta a los fragmentos del índice (proyectados a los términos
+        buscados) y otra lectura para los candidatos y construir los fragmentos de texto.
+        Los candidatos cuyo texto ya no contiene los términos (p. ej. tras reprocesar
+        el OCR) se descartan.
+
+        Returns:
+            List[Dict[str, Any]]: Resultados con ``ref``, ``kind``, ``id``, ``type``, ``date`` y ``snippet``
+        """
+        terms: List[str] = tokenize(query)
+        candidates: List[str] = SearchIndexService.lookup(user_id, terms)[:limit * 2]
+        if not candidates:
+            return []
+
+        ids_by_kind: Dict[str, List[str]] = {}
+        for ref in candidates:
+            kind, _, doc_id = ref.partition(":")
+            if kind in SOURCES:
+                ids_by_kind.setdefault(kind, []).append(doc_id)
+
+        documents: Dict[str, Dict] = {}
+        for kind, doc_ids in ids_by_kind.items():
+            collection, text_field, type_field, date_field = SOURCES[kind]
+            fetched: Dict[str, Dict] = FirestoreService.get_many(collection, doc_ids, fields=[text_field, type_field, date_field, "user_id"])
+            documents.update({f"{kind}:{doc_id}": doc for doc_id, doc in fetched.items()})
+
+        results: List[Dict[str, Any]] = []
+        for ref in candidates:
+            doc: Optional[Dict] = documents.get(ref)
+            if not doc or doc.get("user_id") != user_id:
+                continue
+            kind, _, doc_id = ref.partition(":")
+            _, text_field, type_field, date_field = SOURCES[kind]
+            text: str = doc.get(text_field) or ""
+            if not set(terms).issubset(tokenize(text)):
+                continue
+            date: Any = doc.get(date_field)
+            results.append({
+                "ref": ref,
+                "kind": kind,
+                "id": doc_id,
+                "type": doc.get(type_field),
+                "date": date.isoformat() if isinstance(date, datetime) else date,
+                "snippet": snippet(text, terms)
+            })
+            if len(results) >= limit:
+                break
+        return results
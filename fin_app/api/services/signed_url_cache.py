@@ -0,0 +1,51 @@
+# file: /api/services/signed_url_cache.py
+
+import time
+import threading
+
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+class SignedUrlCache:
+    """
+    Caché LRU de URLs firmadas que todavía son válidas.
+
+    Una URL se reutiliza mientras le quede al menos ``min_remaining`` segundos de
+    vigencia, así quien la recibe siempre tiene margen para usarla; después se firma
+    una nueva. Con firma local cada URL cuesta una firma RSA (sin red), y la caché
+    evita repetirla para los objetos que se piden una y otra vez.
+    """
+
+    def __init__(self, max_entries: int, ttl: int, min_remaining: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_remaining = ttl // 2 if min_remaining is None else min_remaining
+        self.entries: "OrderedDict[Hashable, Tuple[str, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, sign: Callable[[int], str]) -> str:
+        """
+        Devuelve la URL en caché para ``key`` o la genera con ``sign(ttl)``.
+
+        Args:
+            key: Identificador del objeto y de las opciones de la URL
+            sign: Función que firma una URL válida durante los segundos indicados
+        """
+        now: float = time.time()
+        with self.lock:
+            entry: Optional[Tuple[str, float]] = self.entries.get(key)
+            if entry and entry[1] - now >= self.min_remaining:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        url: str = sign(self.ttl)
+        with self.lock:
+            self.entries[key] = (url, now + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return url
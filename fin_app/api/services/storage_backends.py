@@ -0,0 +1,565 @@
+# file: /api/services/storage_backends.py
+
+import os
+import hmac
+import mmap
+import time
+import hashlib
+import mimetypes
+import threading
+
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from urllib.parse import quote, urlencode
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+from google.cloud import storage
+from google.cloud.storage.blob import Blob
+from api.config import (
+    logger,
+    GOOGLE_CLOUD_PROJECT,
+    MEDIA_SIGNING_KEY_FILE,
+    STORAGE_BACKEND,
+    LOCAL_STORAGE_DIR,
+    LOCAL_STORAGE_SHARD_DEPTH,
+    LOCAL_STORAGE_FSYNC,
+    LOCAL_STORAGE_BASE_URL,
+    LOCAL_STORAGE_SIGNING_KEY,
+)
+from api.services.media_cache import media_cache
+from api.services.dependency_guard import guard
+from api.services.deadline import DeadlineExceededError, expired, remaining_timeout
+
+# Tamaño de los bloques leídos al transmitir un objeto
+DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+DOWNLOAD_TIMEOUT: float = 60.0
+UPLOAD_TIMEOUT: float = 60.0
+
+class ObjectExistsError(Exception):
+    """El objeto ya existe y la escritura pedía crearlo solo si no existía."""
+
+class MediaStream:
+    """
+    Lectura en streaming de un objeto (o de un rango) del almacenamiento.
+
+    Se consume con ``iter_chunks()`` o como archivo con ``read()``, y expone los
+    metadatos de la respuesta para caché: ``generation``, ``etag``, ``content_type``,
+    ``size`` (tamaño total del objeto) y ``start``/``end`` (rango servido, ``end`` exclusivo).
+    Si el stream cubre el objeto completo y cabe en la caché local, al terminar de
+    leerlo se guarda allí.
+    """
+
+    def __init__(self, bucket_name: str, object_path: str, generation: Optional[int], etag: Optional[str],
+                 content_type: Optional[str], size: Optional[int], start: int, end: Optional[int],
+                 chunks: Iterator[bytes], response: Any = None, cacheable: bool = False):
+        self.bucket_name = bucket_name
+        self.object_path = object_path
+        self.generation = generation
+        self.etag = etag
+        self.content_type = content_type
+        self.size = size
+        self.start = start
+        self.end = end
+        self._chunks = chunks
+        self._response = response
+        self._buffer = b""
+        self._cached_chunks: Optional[List[bytes]] = [] if cacheable else None
+        self.bytes_read = 0
+
+    def _next_chunk(self) -> bytes:
+        if expired():
+            self.close()
+            raise DeadlineExceededError(f"Presupuesto agotado leyendo {self.bucket_name}/{self.object_path}")
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            self.bytes_read += len(chunk)
+            if self._cached_chunks is not None:
+                self._cached_chunks.append(chunk)
+            return chunk
+        self._finish()
+        return b""
+
+    def _finish(self) -> None:
+        if self._cached_chunks is not None and self.bytes_read == self.size:
+            media_cache.put(self.bucket_name, self.object_path, b"".join(self._cached_chunks), self.generation)
+        self._cached_chunks = None
+        self.close()
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """Itera sobre el contenido en bloques tal como llegan."""
+        if self._buffer:
+            buffered, self._buffer = self._buffer, b""
+            yield buffered
+        while True:
+            chunk: bytes = self._next_chunk()
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        """Lee hasta ``size`` bytes (todo lo que queda si ``size`` es negativo)."""
+        parts: List[bytes] = [self._buffer]
+        available: int = len(self._buffer)
+        while size < 0 or available < size:
+            chunk: bytes = self._next_chunk()
+            if not chunk:
+                break
+            parts.append(chunk)
+            available += len(chunk)
+        data: bytes = b"".join(parts)
+        if size < 0:
+            self._buffer = b""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def close(self) -> None:
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+
+    def __enter__(self) -> 'MediaStream':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def _parse_content_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """``bytes 0-99/1234`` -> (0, 100, 1234)."""
+    if not value or not value.startswith("bytes "):
+        return None, None, None
+    span, _, total = value[6:].partition("/")
+    first, _, last = span.partition("-")
+    try:
+        return int(first), int(last) + 1, int(total) if total != "*" else None
+    except ValueError:
+        return None, None, None
+
+class StorageBackend(ABC):
+    """
+    Operaciones de almacenamiento de objetos que usa ``StorageService``.
+
+    ``scheme`` es el prefijo de las rutas guardadas (``gs://bucket/objeto``) y ``remote``
+    indica si vale la pena copiar los objetos leídos a la caché local en disco.
+    """
+
+    name: str = ""
+    scheme: str = ""
+    remote: bool = True
+
+    @abstractmethod
+    def ensure_bucket(self, bucket_name: str) -> None:
+        ...
+
+    @abstractmethod
+    def put_stream(self, bucket_name: str, object_path: str, chunks: Iterable[bytes],
+                   content_type: Optional[str] = None, if_absent: bool = False) -> Optional[int]:
+        """
+        Escribe un objeto a partir de bloques de bytes.
+
+        Returns:
+            Optional[int]: Generación del objeto escrito
+
+        Raises:
+            ObjectExistsError: Si ``if_absent`` y el objeto ya existe
+        """
+
+    @abstractmethod
+    def open_stream(self, bucket_name: str, object_path: str, start: int = 0, end: Optional[int] = None,
+                    if_generation_match: Optional[int] = None, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                    timeout: float = DOWNLOAD_TIMEOUT) -> Optional[MediaStream]:
+        """Abre un objeto o un rango (ver ``StorageService.open_stream``); None si no existe."""
+
+    @abstractmethod
+    def exists(self, bucket_name: str, object_path: str) -> bool:
+        ...
+
+    @abstractmethod
+    def copy(self, source_bucket_name: str, source_path: str, destination_bucket_name: str, destination_path: str) -> bool:
+        """Copia un objeto sin sobrescribir el destino; True si el destino existe al terminar."""
+
+    @abstractmethod
+    def delete(self, bucket_name: str, object_path: str) -> bool:
+        """Elimina un objeto; False si no existía."""
+
+    @abstractmethod
+    def sign_url(self, bucket_name: str, object_path: str, ttl: int, response_disposition: Optional[str] = None) -> str:
+        """URL de descarga válida durante ``ttl`` segundos."""
+
+class GCSBackend(StorageBackend):
+    """Google Cloud Storage, con lecturas en streaming por el transporte autenticado del cliente."""
+
+    name = "gcs"
+    scheme = "gs"
+    remote = True
+
+    def __init__(self, project: str):
+        self.project = project
+        self._client: Optional[storage.Client] = None
+        self._signing_credentials: Optional[service_account.Credentials] = None
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def client(self) -> storage.Client:
+        """Cliente de GCS, creado en el primer uso: importar los servicios no exige credenciales."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    client: storage.Client = storage.Client(project=self.project)
+                    self._signing_credentials = self._load_signing_credentials(client)
+                    self._client = client
+        return self._client
+
+    @property
+    def signing_credentials(self) -> Optional[service_account.Credentials]:
+        return self._signing_credentials if self.client is not None else None
+
+    def _load_signing_credentials(self, client: storage.Client) -> Optional[service_account.Credentials]:
+        """
+        Credenciales con clave privada para firmar URLs localmente.
+
+        Se usa ``MEDIA_SIGNING_KEY_FILE`` o, si el cliente ya usa una cuenta de servicio con
+        clave, sus mismas credenciales. Sin clave (p. ej. credenciales de Cloud Run) se
+        devuelve None y las URLs se firman con la API de IAM.
+        """
+        try:
+            if MEDIA_SIGNING_KEY_FILE:
+                return service_account.Credentials.from_service_account_file(MEDIA_SIGNING_KEY_FILE)
+            credentials = getattr(client, "_credentials", None)
+            if isinstance(credentials, service_account.Credentials):
+                return credentials
+        except Exception as e:
+            logger.error(f"No se pudieron cargar las credenciales para firmar URLs: {str(e)}")
+        logger.warning("Sin clave de cuenta de servicio: las URLs firmadas usarán la API de IAM")
+        return None
+
+    def ensure_bucket(self, bucket_name: str) -> None:
+        bucket = self.client.bucket(bucket_name)
+        if not bucket.exists():
+            logger.warning(f"El bucket {bucket_name} no existe. Creando...")
+            self.client.create_bucket(bucket_name)
+            logger.info(f"Bucket {bucket_name} creado exitosamente.")
+        else:
+            logger.info(f"Usando bucket existente: {bucket_name}")
+
+    def put_stream(self, bucket_name: str, object_path: str, chunks: Iterable[bytes],
+                   content_type: Optional[str] = None, if_absent: bool = False) -> Optional[int]:
+        blob: Blob = self.client.bucket(bucket_name).blob(object_path)
+        blob.content_type = content_type
+        options: Dict[str, Any] = {"if_generation_match": 0} if if_absent else {}
+        try:
+            with guard("storage").attempt():
+                if isinstance(chunks, (bytes, bytearray)):
+                    blob.upload_from_string(chunks, content_type=content_type,
+                                            timeout=remaining_timeout(UPLOAD_TIMEOUT), **options)
+                else:
+                    # Subida reanudable: los bloques se envían a medida que llegan
+                    with blob.open("wb", content_type=content_type, **options) as stream:
+                        for chunk in chunks:
+                            stream.write(chunk)
+        except PreconditionFailed:
+            raise ObjectExistsError(f"gs://{bucket_name}/{object_path}")
+        return blob.generation
+
+    def open_stream(self, bucket_name: str, object_path: str, start: int = 0, end: Optional[int] = None,
+                    if_generation_match: Optional[int] = None, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                    timeout: float = DOWNLOAD_TIMEOUT) -> Optional[MediaStream]:
+        gs_path: str = f"gs://{bucket_name}/{object_path}"
+        url: str = (f"{self.client._connection.API_BASE_URL}/download/storage/v1/b/{quote(bucket_name, safe='')}"
+                    f"/o/{quote(object_path, safe='')}?alt=media")
+        if if_generation_match is not None:
+            url += f"&ifGenerationMatch={int(if_generation_match)}"
+
+        headers: Dict[str, str] = {}
+        if start < 0:
+            headers["Range"] = f"bytes={start}"
+        elif start > 0 or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+
+        # El transporte autenticado del cliente permite leer la respuesta por partes
+        with guard("storage").attempt():
+            response = self.client._http.request("GET", url, headers=headers, stream=True, timeout=remaining_timeout(timeout))
+            if response.status_code >= 500 or response.status_code == 429:
+                response.close()
+                response.raise_for_status()
+        if response.status_code == 404:
+            response.close()
+            logger.error(f"El archivo no existe en GCS: {gs_path}")
+            return None
+        if response.status_code == 412:
+            response.close()
+            logger.warning(f"La generación de {gs_path} no coincide con {if_generation_match}")
+            return None
+        if response.status_code == 416:
+            response.close()
+            logger.error(f"Rango inválido ({start}, {end}) para {gs_path}")
+            return None
+        response.raise_for_status()
+
+        generation_header: Optional[str] = response.headers.get("x-goog-generation")
+        length: Optional[int] = int(response.headers["Content-Length"]) if "Content-Length" in response.headers else None
+        if response.status_code == 206:
+            range_start, range_end, size = _parse_content_range(response.headers.get("Content-Range"))
+        else:
+            range_start, range_end, size = 0, length, length
+
+        return MediaStream(
+            bucket_name, object_path,
+            generation=int(generation_header) if generation_header else None,
+            etag=response.headers.get("ETag"),
+            content_type=response.headers.get("Content-Type"),
+            size=size,
+            start=range_start or 0,
+            end=range_end,
+            chunks=response.iter_content(chunk_size=chunk_size),
+            response=response,
+            cacheable=response.status_code == 200 and size is not None and size <= media_cache.max_object_bytes
+        )
+
+    def exists(self, bucket_name: str, object_path: str) -> bool:
+        with guard("storage").attempt():
+            return self.client.bucket(bucket_name).blob(object_path).exists(timeout=remaining_timeout(DOWNLOAD_TIMEOUT))
+
+    def copy(self, source_bucket_name: str, source_path: str, destination_bucket_name: str, destination_path: str) -> bool:
+        # ``rewrite`` copia dentro de GCS y puede requerir varias llamadas para objetos grandes
+        source: Blob = self.client.bucket(source_bucket_name).blob(source_path)
+        destination: Blob = self.client.bucket(destination_bucket_name).blob(destination_path)
+        token: Optional[str] = None
+        while True:
+            with guard("storage").attempt():
+                try:
+                    token, _, _ = destination.rewrite(source, token=token, if_generation_match=0)
+                except PreconditionFailed:
+                    # El destino ya existe (no es un fallo de GCS)
+                    return True
+            if token is None:
+                return True
+
+    def delete(self, bucket_name: str, object_path: str) -> bool:
+        try:
+            self.client.bucket(bucket_name).blob(object_path).delete()
+            return True
+        except NotFound:
+            return False
+
+    def sign_url(self, bucket_name: str, object_path: str, ttl: int, response_disposition: Optional[str] = None) -> str:
+        blob: Blob = self.client.bucket(bucket_name).blob(object_path)
+        options: Dict[str, Any] = {
+            "version": "v4",
+            "expiration": timedelta(seconds=ttl),
+            "method": "GET",
+            "response_disposition": response_disposition
+        }
+        if self.signing_credentials is not None:
+            # Firma RSA local, sin llamadas de red
+            return blob.generate_signed_url(credentials=self.signing_credentials, **options)
+        credentials = self.client._credentials
+        if not credentials.valid:
+            credentials.refresh(Request())
+        return blob.generate_signed_url(
+            service_account_email=credentials.service_account_email, access_token=credentials.token, **options
+        )
+
+class MappedRange:
+    """Bloques de ``[start, end)`` de un archivo abierto, leídos con ``mmap`` (sin copiar el archivo completo)."""
+
+    def __init__(self, file: Any, start: int, end: int, chunk_size: int):
+        self.file = file
+        self.start = start
+        self.end = end
+        self.chunk_size = chunk_size
+        self.mapped: Optional[mmap.mmap] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if end > start else None
+
+    def __iter__(self) -> Iterator[bytes]:
+        for offset in range(self.start, self.end, self.chunk_size):
+            if self.mapped is None:
+                return
+            yield self.mapped[offset:min(offset + self.chunk_size, self.end)]
+
+    def close(self) -> None:
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+        self.file.close()
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Almacenamiento en el sistema de archivos local (on-prem o pruebas sin GCS).
+
+    Cada bucket es un directorio y cada objeto un archivo en
+    ``{bucket}/{h1}/{h2}/{ruta codificada}``, con ``h1``/``h2`` tomados del hash de la ruta
+    para que ningún directorio acumule millones de entradas. Las escrituras van a un
+    archivo temporal en el mismo directorio y se publican con ``os.replace`` (o
+    ``os.link`` si solo se crea cuando no existe), así un lector nunca ve un archivo a
+    medias. La generación es el ``st_mtime_ns`` del archivo, que cambia con cada escritura.
+
+    Las lecturas usan ``mmap`` y las URLs firmadas apuntan a ``/media`` de esta API, que
+    entrega el archivo con ``send_file`` (``sendfile`` del sistema con gunicorn).
+    """
+
+    name = "local"
+    scheme = "local"
+    remote = False
+
+    def __init__(self, root: str, shard_depth: int = 2, fsync: bool = True, base_url: str = "", signing_key: str = ""):
+        self.root = os.path.abspath(root)
+        self.shard_depth = max(0, min(shard_depth, 8))
+        self.fsync = fsync
+        self.base_url = base_url.rstrip("/")
+        self.signing_key = signing_key.encode("utf-8")
+        os.makedirs(self.root, exist_ok=True)
+
+    def local_path(self, bucket_name: str, object_path: str) -> str:
+        """Ruta del archivo de un objeto (exista o no)."""
+        digest: str = hashlib.sha1(object_path.encode("utf-8")).hexdigest()
+        shards: List[str] = [digest[2 * level:2 * level + 2] for level in range(self.shard_depth)]
+        file_name: str = quote(object_path, safe="")
+        if len(file_name) > 200:
+            # Límite de longitud de nombre de archivo: se conserva el final (con la extensión)
+            file_name = f"{digest}-{file_name[-150:]}"
+        return os.path.join(self.root, quote(bucket_name, safe=""), *shards, file_name)
+
+    def _fsync_directory(self, directory: str) -> None:
+        fd: int = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def ensure_bucket(self, bucket_name: str) -> None:
+        os.makedirs(os.path.join(self.root, quote(bucket_name, safe="")), exist_ok=True)
+        logger.info(f"Usando el directorio {self.root} para el bucket {bucket_name}")
+
+    def put_stream(self, bucket_name: str, object_path: str, chunks: Iterable[bytes],
+                   content_type: Optional[str] = None, if_absent: bool = False) -> Optional[int]:
+        path: str = self.local_path(bucket_name, object_path)
+        directory: str = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        if if_absent and os.path.exists(path):
+            raise ObjectExistsError(path)
+
+        tmp_path: str = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                if isinstance(chunks, (bytes, bytearray)):
+                    file.write(chunks)
+                else:
+                    for chunk in chunks:
+                        file.write(chunk)
+                if self.fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            if if_absent:
+                try:
+                    os.link(tmp_path, path)
+                except FileExistsError:
+                    raise ObjectExistsError(path)
+            else:
+                os.replace(tmp_path, path)
+            if self.fsync:
+                self._fsync_directory(directory)
+        finally:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+        return os.stat(path).st_mtime_ns
+
+    def open_stream(self, bucket_name: str, object_path: str, start: int = 0, end: Optional[int] = None,
+                    if_generation_match: Optional[int] = None, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                    timeout: float = DOWNLOAD_TIMEOUT) -> Optional[MediaStream]:
+        path: str = self.local_path(bucket_name, object_path)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            logger.error(f"El archivo no existe en {self.root}: {bucket_name}/{object_path}")
+            return None
+
+        stat: os.stat_result = os.fstat(file.fileno())
+        size: int = stat.st_size
+        if if_generation_match is not None and stat.st_mtime_ns != int(if_generation_match):
+            file.close()
+            logger.warning(f"La generación de {bucket_name}/{object_path} no coincide con {if_generation_match}")
+            return None
+        range_start: int = max(size + start, 0) if start < 0 else start
+        range_end: int = size if end is None else min(end, size)
+        if range_start >= size and size > 0 or range_end < range_start:
+            file.close()
+            logger.error(f"Rango inválido ({start}, {end}) para {bucket_name}/{object_path}")
+            return None
+
+        chunks: MappedRange = MappedRange(file, range_start, range_end, chunk_size)
+        return MediaStream(
+            bucket_name, object_path,
+            generation=stat.st_mtime_ns,
+            etag=f'"{stat.st_mtime_ns:x}-{size:x}"',
+            content_type=mimetypes.guess_type(object_path)[0] or "application/octet-stream",
+            size=size,
+            start=range_start,
+            end=range_end,
+            chunks=iter(chunks),
+            response=chunks
+        )
+
+    def exists(self, bucket_name: str, object_path: str) -> bool:
+        return os.path.isfile(self.local_path(bucket_name, object_path))
+
+    def copy(self, source_bucket_name: str, source_path: str, destination_bucket_name: str, destination_path: str) -> bool:
+        stream: Optional[MediaStream] = self.open_stream(source_bucket_name, source_path)
+        if stream is None:
+            return False
+        try:
+            with stream:
+                self.put_stream(destination_bucket_name, destination_path, stream.iter_chunks(), if_absent=True)
+        except ObjectExistsError:
+            pass
+        return True
+
+    def delete(self, bucket_name: str, object_path: str) -> bool:
+        try:
+            os.remove(self.local_path(bucket_name, object_path))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _signature(self, bucket_name: str, object_path: str, expires: int, response_disposition: Optional[str]) -> str:
+        message: bytes = f"{bucket_name}/{object_path}\n{expires}\n{response_disposition or ''}".encode("utf-8")
+        return hmac.new(self.signing_key, message, hashlib.sha256).hexdigest()
+
+    def sign_url(self, bucket_name: str, object_path: str, ttl: int, response_disposition: Optional[str] = None) -> str:
+        if not self.signing_key:
+            logger.error("LOCAL_STORAGE_SIGNING_KEY no configurado: no se generan URLs firmadas")
+            return ""
+        expires: int = int(time.time()) + ttl
+        query: Dict[str, Any] = {"expires": expires}
+        if response_disposition:
+            query["disposition"] = response_disposition
+        query["signature"] = self._signature(bucket_name, object_path, expires, response_disposition)
+        return f"{self.base_url}/media/{quote(bucket_name, safe='')}/{quote(object_path)}?{urlencode(query)}"
+
+    def verify_url(self, bucket_name: str, object_path: str, expires: Optional[str],
+                   response_disposition: Optional[str], signature: Optional[str]) -> bool:
+        """Si los parámetros de una URL de ``sign_url`` son válidos y no ha vencido."""
+        if not (self.signing_key and expires and expires.isdigit() and signature):
+            return False
+        if int(expires) < time.time():
+            return False
+        expected: str = self._signature(bucket_name, object_path, int(expires), response_disposition)
+        return hmac.compare_digest(expected, signature)
+
+def create_backend(name: str = STORAGE_BACKEND) -> StorageBackend:
+    """
+    Backend configurado en ``STORAGE_BACKEND`` (``gcs`` o ``local``).
+
+    Raises:
+        ValueError: Si el nombre no corresponde a ningún backend
+    """
+    if name == "local":
+        return LocalStorageBackend(LOCAL_STORAGE_DIR, LOCAL_STORAGE_SHARD_DEPTH, LOCAL_STORAGE_FSYNC,
+                                   LOCAL_STORAGE_BASE_URL, LOCAL_STORAGE_SIGNING_KEY)
+    if name == "gcs":
+        return GCSBackend(GOOGLE_CLOUD_PROJECT)
+    raise ValueError(f"Backend de almacenamiento desconocido '{name}' (opciones: gcs, local)")
@@ -0,0 +1,159 @@
+# file: /api/services/task_graph.py
+
+import time
+import contextvars
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from api.config import logger, TASK_GRAPH_WORKERS
+from api.services.deadline import DeadlineExceededError, expired, remaining
+
+# Pool compartido por todas las ejecuciones de grafos del proceso
+executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=TASK_GRAPH_WORKERS, thread_name_prefix="stage")
+
+OK = "ok"
+FAILED = "failed"
+TIMEOUT = "timeout"
+SKIPPED = "skipped"
+
+class Stage:
+    def __init__(self, name: str, func: Callable[..., Any], requires: Iterable[str] = (),
+                 uses: Iterable[str] = (), timeout: Optional[float] = None, default: Any = None):
+        """
+        Etapa de un grafo de tareas.
+
+        Args:
+            name: Nombre único de la etapa
+            func: Función a ejecutar; recibe como argumentos con nombre los resultados de
+                ``requires`` y ``uses``
+            requires: Etapas obligatorias: si alguna falla, esta etapa se omite
+            uses: Etapas opcionales: si fallan, se recibe su valor ``default``
+            timeout: Segundos máximos desde que la etapa empieza (None sin límite)
+            default: Valor de la etapa cuando falla, vence o se omite
+        """
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.uses = tuple(uses)
+        self.timeout = timeout
+        self.default = default
+
+class GraphResult:
+    """Resultados, estado (ok, failed, timeout, skipped), duración y excepción (si falló) de cada etapa."""
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.status: Dict[str, str] = {}
+        self.durations: Dict[str, float] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.elapsed: float = 0.0
+
+    def ok(self, name: str) -> bool:
+        return self.status.get(name) == OK
+
+    @property
+    def partial(self) -> bool:
+        """Alguna etapa no terminó bien."""
+        return any(status != OK for status in self.status.values())
+
+    def summary(self) -> str:
+        stages: str = ", ".join(
+            f"{name}={self.status[name]}:{self.durations.get(name, 0.0) * 1000:.0f}ms" for name in self.status
+        )
+        return f"{self.elapsed * 1000:.0f}ms [{stages}]"
+
+class TaskGraph:
+    """
+    Ejecuta un grafo acíclico de etapas en el pool compartido.
+
+    Cada etapa arranca en cuanto terminan sus dependencias, así que las etapas
+    independientes corren a la vez y la latencia total es la del camino crítico y no la
+    suma de todas. Las etapas heredan el contexto (y con él el presupuesto de tiempo de la
+    solicitud, que también recorta su ``timeout``); si el presupuesto ya se agotó al
+    llegar su turno, se omiten. Cuando una etapa vence su ``timeout`` se da por fallida y el grafo
+    continúa con su valor por defecto; el hilo no se puede interrumpir y sigue hasta que
+    la llamada termine, por lo que las funciones deben usar además sus propios timeouts.
+    """
+
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Etapa duplicada: {stage.name}")
+            self.stages[stage.name] = stage
+        for stage in self.stages.values():
+            for dependency in stage.requires + stage.uses:
+                if dependency not in self.stages:
+                    raise ValueError(f"La etapa {stage.name} depende de una etapa desconocida: {dependency}")
+
+    def run(self) -> GraphResult:
+        result: GraphResult = GraphResult()
+        started_at: float = time.monotonic()
+        waiting: Dict[str, Stage] = dict(self.stages)
+        running: Dict[Future, str] = {}
+        deadlines: Dict[str, float] = {}
+        starts: Dict[str, float] = {}
+
+        def finish(name: str, status: str, value: Any = None, error: Optional[BaseException] = None) -> None:
+            stage: Stage = self.stages[name]
+            result.status[name] = status
+            result.values[name] = value if status == OK else stage.default
+            result.durations[name] = time.monotonic() - starts[name] if name in starts else 0.0
+            if error is not None:
+                result.errors[name] = error
+
+        while waiting or running:
+            # Lanzar (u omitir) las etapas cuyas dependencias ya terminaron
+            for name, stage in list(waiting.items()):
+                dependencies: tuple = stage.requires + stage.uses
+                if any(dependency not in result.status for dependency in dependencies):
+                    continue
+                del waiting[name]
+                failed: List[str] = [dependency for dependency in stage.requires if not result.ok(dependency)]
+                if failed:
+                    finish(name, SKIPPED)
+                    continue
+                if expired():
+                    finish(name, SKIPPED, error=DeadlineExceededError(f"Sin tiempo para la etapa {name}"))
+                    continue
+                kwargs: Dict[str, Any] = {dependency: result.values[dependency] for dependency in dependencies}
+                starts[name] = time.monotonic()
+                limits: List[float] = [limit for limit in (stage.timeout, remaining()) if limit is not None]
+                if limits:
+                    deadlines[name] = starts[name] + min(limits)
+                context: contextvars.Context = contextvars.copy_context()
+                running[executor.submit(context.run, stage.func, **kwargs)] = name
+
+            if not running:
+                if waiting:
+                    # Solo queda lo que depende de sí mismo (ciclo): no puede avanzar
+                    for name in list(waiting):
+                        finish(name, SKIPPED)
+                    waiting.clear()
+                break
+
+            now: float = time.monotonic()
+            pending_deadlines: List[float] = [deadlines[name] for name in running.values() if name in deadlines]
+            wait_for: Optional[float] = max(0.0, min(pending_deadlines) - now) if pending_deadlines else None
+            done: Set[Future]
+            done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name: str = running.pop(future)
+                try:
+                    finish(name, OK, future.result())
+                except Exception as e:
+                    logger.error(f"La etapa {name} falló: {str(e)}")
+                    finish(name, FAILED, error=e)
+
+            now = time.monotonic()
+            for future, name in list(running.items()):
+                if name in deadlines and now >= deadlines[name]:
+                    logger.warning(f"La etapa {name} superó su tiempo límite ({now - starts[name]:.1f}s)")
+                    future.cancel()
+                    del running[future]
+                    finish(name, TIMEOUT, error=TimeoutError(f"La etapa {name} superó su tiempo límite"))
+
+        result.elapsed = time.monotonic() - started_at
+        return result
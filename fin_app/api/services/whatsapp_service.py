@@ -1,9 +1,204 @@
 # file: /api/services/whatsapp_service.py
 
+import time
 import requests
+import threading
 
-from typing import Dict, Optional
-from api.config import logger, WHATSAPP_ACCESS_TOKEN
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from api.config import (
+    logger,
+    WHATSAPP_ACCESS_TOKEN,
+    MEDIA_HEDGE_PERCENTILE,
+    MEDIA_HEDGE_DEFAULT_DELAY_SECONDS,
+    MEDIA_DOWNLOAD_MAX_RESUMES,
+)
+from api.services.dependency_guard import DependencyUnavailableError, guard
+from api.services.deadline import DeadlineExceededError, remaining_timeout
+
+# Timeouts máximos (segundos) de las llamadas a la API de Graph y a la CDN de medios
+SEND_TIMEOUT: float = 10.0
+MEDIA_URL_TIMEOUT: float = 10.0
+MEDIA_DOWNLOAD_TIMEOUT: float = 60.0
+# Tamaño de los bloques leídos de la CDN
+MEDIA_CHUNK_SIZE: int = 256 * 1024
+
+# Errores que indican una transferencia cortada a medias (se reanuda con Range)
+INTERRUPTED_ERRORS: Tuple[type, ...] = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+def raise_for_server_error(response: requests.Response) -> None:
+    """Solo los 5xx y 429 cuentan como fallo de la dependencia (los 4xx son errores nuestros)."""
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+
+class LatencyTracker:
+    """
+    Percentil de las latencias recientes, usado como espera antes de lanzar el hedge.
+
+    Mientras no haya ``min_samples`` muestras se usa ``default``.
+    """
+
+    def __init__(self, percentile: float, default: float, window: int = 200, min_samples: int = 20):
+        self.percentile = percentile
+        self.default = default
+        self.min_samples = min_samples
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self.lock:
+            self.samples.append(seconds)
+
+    def delay(self) -> float:
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return self.default
+            ordered: List[float] = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+class MediaTransferError(Exception):
+    """La descarga desde la CDN no se pudo completar (respuesta inesperada o demasiadas reanudaciones)."""
+
+# Tiempo hasta la respuesta (cabeceras) de la CDN de medios
+cdn_latency: LatencyTracker = LatencyTracker(MEDIA_HEDGE_PERCENTILE, MEDIA_HEDGE_DEFAULT_DELAY_SECONDS)
+# Hilos para las peticiones a la CDN (la original y el hedge corren a la vez)
+hedge_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="cdn")
+
+_stats_lock: threading.Lock = threading.Lock()
+_download_stats: Dict[str, int] = {
+    "downloads": 0, "failures": 0, "hedged": 0, "hedge_wins": 0,
+    "resumes": 0, "resumed_bytes": 0, "restarts": 0,
+}
+
+def _count(**increments: int) -> None:
+    with _stats_lock:
+        for name, value in increments.items():
+            _download_stats[name] += value
+
+def media_download_metrics() -> Dict[str, Any]:
+    """Contadores de las descargas de medios (hedges lanzados y ganados, reanudaciones)."""
+    with _stats_lock:
+        stats: Dict[str, Any] = dict(_download_stats)
+    stats["hedge_delay_ms"] = round(cdn_latency.delay() * 1000, 1)
+    return stats
+
+def _parse_content_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """``bytes 100-199/1234`` -> (100, 1234)."""
+    if not value or not value.startswith("bytes "):
+        return None, None
+    span, _, total = value[6:].partition("/")
+    try:
+        return int(span.partition("-")[0]), int(total) if total != "*" else None
+    except ValueError:
+        return None, None
+
+def _content_length(response: requests.Response) -> Optional[int]:
+    """Tamaño del cuerpo si se conoce (con compresión no coincide con los bytes leídos)."""
+    length: str = response.headers.get("Content-Length", "")
+    if "Content-Encoding" in response.headers or not length.isdigit():
+        return None
+    return int(length)
+
+def _open_media(url: str, headers: Dict[str, str], timeout: float) -> requests.Response:
+    """Hace la petición a la CDN y devuelve la respuesta en cuanto llegan las cabeceras."""
+    started: float = time.monotonic()
+    with guard("whatsapp").attempt():
+        response: requests.Response = requests.get(url, headers=headers, stream=True, timeout=timeout)
+        raise_for_server_error(response)
+    cdn_latency.record(time.monotonic() - started)
+    return response
+
+def _close_response(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+def _hedged_open(url: str, headers: Dict[str, str], timeout: float) -> requests.Response:
+    """
+    Abre la descarga con hedging: si la primera petición no responde dentro del percentil
+    configurado de las latencias recientes, lanza una segunda igual y se queda con la que
+    responda primero; la otra se cierra al terminar.
+    """
+    first: Future = hedge_executor.submit(_open_media, url, headers, timeout)
+    done, _ = wait([first], timeout=cdn_latency.delay())
+    if done:
+        return first.result()
+
+    hedge: Future = hedge_executor.submit(_open_media, url, headers, timeout)
+    _count(hedged=1)
+    pending = {first, hedge}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            for other in pending | (done - {future}):
+                other.add_done_callback(_close_response)
+            if future is hedge:
+                _count(hedge_wins=1)
+            return future.result()
+    if error is not None:
+        raise error
+    raise requests.exceptions.Timeout(f"La CDN no respondió en {timeout:.1f}s")
+
+def _read_media(url: str, headers: Dict[str, str], response: requests.Response, media_id: str) -> bytes:
+    """
+    Lee el cuerpo de la descarga; si la conexión se corta, la reanuda desde el último
+    byte recibido con ``Range`` (e ``If-Range`` para no mezclar versiones distintas).
+    """
+    body: bytearray = bytearray()
+    validator: Optional[str] = response.headers.get("ETag") or response.headers.get("Last-Modified")
+    total: Optional[int] = _content_length(response)
+    resumes: int = 0
+
+    while True:
+        try:
+            for chunk in response.iter_content(MEDIA_CHUNK_SIZE):
+                body += chunk
+            if total is None or len(body) >= total:
+                return bytes(body)
+            error: BaseException = requests.exceptions.ChunkedEncodingError(f"Respuesta incompleta: {len(body)} de {total} bytes")
+        except INTERRUPTED_ERRORS as e:
+            error = e
+        finally:
+            response.close()
+
+        resumes += 1
+        if resumes > MEDIA_DOWNLOAD_MAX_RESUMES:
+            raise MediaTransferError(f"Descarga interrumpida {resumes - 1} veces: {str(error)}")
+        logger.warning(f"Descarga de {media_id} cortada en {len(body)} bytes ({str(error)}); se reanuda")
+
+        range_headers: Dict[str, str] = {**headers, "Range": f"bytes={len(body)}-"}
+        if validator:
+            range_headers["If-Range"] = validator
+        response = _open_media(url, range_headers, remaining_timeout(MEDIA_DOWNLOAD_TIMEOUT))
+        if response.status_code == 206:
+            start, range_total = _parse_content_range(response.headers.get("Content-Range"))
+            if start != len(body):
+                response.close()
+                raise MediaTransferError(f"Rango inesperado de la CDN: {response.headers.get('Content-Range')}")
+            total = range_total if range_total is not None else total
+            _count(resumes=1, resumed_bytes=len(body))
+        elif response.status_code == 200:
+            # El archivo cambió o la CDN ignora Range: se empieza de nuevo
+            body.clear()
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+            total = _content_length(response)
+            _count(restarts=1)
+        elif response.status_code == 416 and total is not None and len(body) >= total:
+            response.close()
+            return bytes(body)
+        else:
+            response.close()
+            raise MediaTransferError(f"La CDN respondió {response.status_code} al reanudar la descarga")
 
 class WhatsAppService:
     @staticmethod
@@ -24,9 +219,17 @@ class WhatsAppService:
         }
         
         try:
-            response : requests.Response = requests.post(f"https://graph.facebook.com/v22.0/{phone_bussines_id}/messages", headers=headers, json=data)
+            with guard("whatsapp").attempt():
+                response : requests.Response = requests.post(
+                    f"https://graph.facebook.com/v22.0/{phone_bussines_id}/messages",
+                    headers=headers, json=data, timeout=remaining_timeout(SEND_TIMEOUT, strict=False)
+                )
+                raise_for_server_error(response)
             response.raise_for_status()
             return True
+        except (DependencyUnavailableError, DeadlineExceededError) as e:
+            logger.warning(f"No se envió el mensaje: {str(e)}")
+            return False
         except Exception as e:
             logger.error(f"Error enviando mensaje: {str(e)}")
             return False
@@ -35,6 +238,9 @@ class WhatsAppService:
     def download_whatsapp_media(media_id : str) -> Optional[bytes]:
         """
         Descarga un archivo multimedia de WhatsApp usando la API de Graph.
+
+        La descarga desde la CDN usa hedging contra la cola de latencia y se reanuda con
+        ``Range`` si la conexión se corta (ver ``media_download_metrics``).
         
         Args:
             media_id: ID del archivo multimedia.
@@ -46,7 +252,9 @@ class WhatsAppService:
             headers : Dict[str, str] = {"Authorization": f"Bearer {WHATSAPP_ACCESS_TOKEN}"}
             url : str = f"https://graph.facebook.com/v17.0/{media_id}"
 
-            response: requests.Response = requests.get(url, headers=headers)
+            with guard("whatsapp").attempt():
+                response: requests.Response = requests.get(url, headers=headers, timeout=remaining_timeout(MEDIA_URL_TIMEOUT))
+                raise_for_server_error(response)
             if response.status_code != 200:
                 logger.error(f"Error al obtener la URL del archivo multimedia: {response.text}")
                 return None
@@ -57,12 +265,21 @@ class WhatsAppService:
                 logger.error("No se pudo obtener la URL de descarga del archivo multimedia")
                 return None
             
-            download_response : requests.Response = requests.get(media_url, headers=headers)
+            download_response : requests.Response = _hedged_open(media_url, headers, remaining_timeout(MEDIA_DOWNLOAD_TIMEOUT))
             if download_response.status_code != 200:
                 logger.error(f"Error al descargar el archivo multimedia: {download_response.text}")
+                download_response.close()
+                _count(downloads=1, failures=1)
                 return None
-            
-            return download_response.content
+
+            content : bytes = _read_media(media_url, headers, download_response, media_id)
+            _count(downloads=1)
+            return content
+        except (DependencyUnavailableError, DeadlineExceededError) as e:
+            logger.warning(f"No se descargó el archivo multimedia {media_id}: {str(e)}")
+            _count(downloads=1, failures=1)
+            return None
         except Exception as e:
             logger.error(f"Error durante la descarga del archivo multimedia: {str(e)}")
+            _count(downloads=1, failures=1)
             return None
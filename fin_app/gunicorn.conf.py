@@ -0,0 +1,70 @@
+# file: /gunicorn.conf.py
+"""
+Configuración de gunicorn para producción (los valores vienen de ``api.config``):
+
+    gunicorn -c gunicorn.conf.py api.main:app
+
+La aplicación no se precarga en el proceso maestro (``preload_app``): al cargarla se
+inicializan los backends (p. ej. el bucket de GCS) y sus clientes gRPC no sobreviven a un
+fork. En su lugar el maestro importa las bibliotecas pesadas, que los workers heredan ya
+inicializadas por copy-on-write, y cada worker crea sus propios clientes (Firestore y
+Pub/Sub en su primer uso).
+"""
+
+import gc
+import importlib
+
+from api.config import (
+    logger,
+    HOST,
+    PORT,
+    SERVER_WORKERS,
+    SERVER_THREADS,
+    SERVER_WORKER_CLASS,
+    SERVER_TIMEOUT,
+    SERVER_GRACEFUL_TIMEOUT,
+    SERVER_KEEPALIVE,
+    SERVER_MAX_REQUESTS,
+)
+
+bind = f"{HOST}:{PORT}"
+workers = SERVER_WORKERS
+worker_class = SERVER_WORKER_CLASS
+threads = SERVER_THREADS
+timeout = SERVER_TIMEOUT
+graceful_timeout = SERVER_GRACEFUL_TIMEOUT
+keepalive = SERVER_KEEPALIVE
+max_requests = SERVER_MAX_REQUESTS
+max_requests_jitter = SERVER_MAX_REQUESTS // 10
+preload_app = False
+
+# Bibliotecas sin estado de red que se importan una vez en el maestro
+PRELOAD_MODULES = [
+    "flask",
+    "requests",
+    "grpc",
+    "google.auth",
+    "firebase_admin",
+    "google.cloud.firestore",
+    "google.cloud.storage",
+    "google.cloud.pubsub_v1",
+    "google.cloud.vision",
+]
+
+for module in PRELOAD_MODULES:
+    try:
+        importlib.import_module(module)
+    except ImportError as e:
+        logger.warning(f"No se pudo precargar {module}: {str(e)}")
+
+# Los objetos ya creados no los vuelve a recorrer el recolector, así sus páginas de
+# memoria siguen compartidas con los workers en lugar de copiarse al primer ciclo de GC
+gc.freeze()
+
+def post_fork(server, worker):
+    logger.info(f"Worker {worker.pid} iniciado")
+
+def worker_exit(server, worker):
+    """Tras drenar las solicitudes en curso (hasta ``graceful_timeout``)."""
+    from api.main import shutdown
+    shutdown()
@@ -0,0 +1,6 @@
+# file: /tools/__init__.py
+"""
+Herramientas de línea de comandos para operar y probar el despliegue.
+
+Se ejecutan desde el directorio ``fin_app`` con ``python -m tools.<herramienta>``.
+"""
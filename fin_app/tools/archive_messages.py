@@ -0,0 +1,48 @@
+# file: /tools/archive_messages.py
+"""
+Archiva en GCS los payloads crudos de WhatsApp pendientes y permite rehidratarlos.
+
+Pensado para ejecutarse periódicamente (cron / Cloud Scheduler), por ejemplo una vez al día:
+    python -m tools.archive_messages
+    python -m tools.archive_messages --before 2025-04-01
+    python -m tools.archive_messages --load wamid.HBgM...
+"""
+
+import argparse
+import json
+
+from datetime import date
+from typing import List, Optional
+
+from api.services import MessageArchiveService
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Archivo en frío de los mensajes crudos de WhatsApp.")
+    parser.add_argument("--before", type=date.fromisoformat,
+                        help="Archivar los días anteriores a esta fecha (YYYY-MM-DD); por defecto hoy en UTC")
+    parser.add_argument("--max-per-object", type=int, default=50000,
+                        help="Máximo de mensajes por objeto comprimido")
+    parser.add_argument("--load", metavar="MESSAGE_ID", help="Rehidratar e imprimir el payload crudo de un mensaje")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+
+    if args.load:
+        value = MessageArchiveService.load_raw(args.load)
+        if value is None:
+            print(f"No se encontró el payload crudo de {args.load}")
+            return 1
+        print(json.dumps(value, indent=2, ensure_ascii=False))
+        return 0
+
+    results = MessageArchiveService.archive_pending(before=args.before, max_messages_per_object=args.max_per_object)
+    print(json.dumps({
+        "objects": results,
+        "messages": sum(result["messages"] for result in results),
+        "bytes": sum(result["bytes"] for result in results),
+    }, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,110 @@
+# file: /tools/bench_models.py
+"""
+Micro-benchmark de memoria y velocidad de los modelos (``User``, ``WhatsAppDevice``,
+``WhatsAppMessage``, ``WhatsAppMedia``).
+
+Compara, con documentos de ejemplo:
+- ``dict``: el documento de Firestore tal cual (lo que se tendría cacheando dicts)
+- ``legacy``: el mismo modelo respaldado por ``__dict__`` (la representación anterior)
+- ``slots``: el modelo actual con ``__slots__``
+
+Mide los bytes por objeto (tracemalloc, sin contar los valores, que se comparten) y las
+conversiones por segundo de ``from_dict`` y ``to_dict``. No accede a Firestore.
+
+Ejemplos:
+    python -m tools.bench_models
+    python -m tools.bench_models --objects 50000 --rounds 5
+"""
+
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from api.models import User, WhatsAppDevice, WhatsAppMessage, WhatsAppMedia
+
+NOW: datetime = datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc)
+
+SAMPLES: Dict[type, Dict[str, Any]] = {
+    User: {"id": "0b6f3c1e-9a7d-4f0e-8d4c-2a1b3c4d5e6f", "name": "Ana Pérez", "email": "ana@example.com", "pin": "482913", "createdAt": NOW},
+    WhatsAppDevice: {"phoneNumber": "573001234567", "userId": "0b6f3c1e-9a7d-4f0e-8d4c-2a1b3c4d5e6f", "lastActive": NOW,
+                     "flowState": "AUTHENTICATED", "context": {"email": "ana@example.com", "name": "Ana Pérez"}},
+    WhatsAppMessage: {"id": "wamid.HBgMNTczMDAxMjM0NTY3FQIAEhgUM0E", "user_id": "0b6f3c1e-9a7d-4f0e-8d4c-2a1b3c4d5e6f",
+                      "phone_number": "573001234567", "message_type": "image", "timestamp": NOW,
+                      "media_id": "1234567890123456", "context_id": None, "text": "Factura de marzo"},
+    WhatsAppMedia: {"id": "1234567890123456", "user_id": "0b6f3c1e-9a7d-4f0e-8d4c-2a1b3c4d5e6f", "phone_number": "573001234567",
+                    "media_type": "image", "storage_path": "gs://fin_storage/whatsapp_media/3f2a/image/2025/03/01/image_1234567890123456.jpg",
+                    "content_type": "image/jpeg", "file_name": "image_1234567890123456.jpg", "ocr_text": "TOTAL $12.000",
+                    "description": "Imagen procesada con OCR", "transcription": "", "created_at": NOW, "processed": True,
+                    "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08", "metadata": {}},
+}
+
+def legacy_class(model: type) -> type:
+    """Copia del modelo sin ``__slots__``: mismos métodos, atributos en ``__dict__``."""
+    namespace: Dict[str, Any] = {
+        name: value for name, value in vars(model).items()
+        if name not in ("__slots__", "__dict__", "__weakref__") and name not in getattr(model, "__slots__", ())
+    }
+    return type(f"Legacy{model.__name__}", (), namespace)
+
+def bytes_per_object(build: Callable[[], Any], count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before: int = tracemalloc.get_traced_memory()[0]
+    objects: List[Any] = [build() for _ in range(count)]
+    after: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    list_overhead: int = 8 * count + 56
+    del objects
+    return (after - before - list_overhead) / count
+
+def ops_per_second(operation: Callable[[], Any], count: int, rounds: int) -> float:
+    best: float = float("inf")
+    for _ in range(rounds):
+        started: float = time.perf_counter()
+        for _ in range(count):
+            operation()
+        best = min(best, time.perf_counter() - started)
+    return count / best
+
+def bench_model(model: type, count: int, rounds: int) -> Dict[str, Dict[str, float]]:
+    sample: Dict[str, Any] = SAMPLES[model]
+    legacy: type = legacy_class(model)
+    slotted_object = model.from_dict(sample)
+    legacy_object = legacy.from_dict(sample)
+
+    results: Dict[str, Dict[str, float]] = {
+        "dict": {
+            "bytes_per_object": bytes_per_object(lambda: dict(sample), count),
+            "from_dict_per_s": ops_per_second(lambda: dict(sample), count, rounds),
+        },
+    }
+    for name, cls, instance in (("legacy", legacy, legacy_object), ("slots", model, slotted_object)):
+        results[name] = {
+            "bytes_per_object": bytes_per_object(lambda: cls.from_dict(sample), count),
+            "from_dict_per_s": ops_per_second(lambda: cls.from_dict(sample), count, rounds),
+            "to_dict_per_s": ops_per_second(instance.to_dict, count, rounds),
+        }
+    for row in results.values():
+        for key, value in row.items():
+            row[key] = round(value, 1) if key == "bytes_per_object" else round(value)
+    return results
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compara memoria y velocidad de los modelos con y sin __slots__.")
+    parser.add_argument("--objects", type=int, default=20000, help="Objetos por medición")
+    parser.add_argument("--rounds", type=int, default=3, help="Repeticiones de cada medición de velocidad (se toma la mejor)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+    report: Dict[str, Any] = {model.__name__: bench_model(model, args.objects, args.rounds) for model in SAMPLES}
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
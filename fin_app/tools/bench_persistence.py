@@ -0,0 +1,161 @@
+# file: /tools/bench_persistence.py
+"""
+Benchmark de los backends de persistencia (``sqlite`` y ``firestore``).
+
+Por cada backend escribe ``--documents`` documentos con la forma de un mensaje de
+WhatsApp en una colección temporal y mide con ``--workers`` hilos la latencia y el
+throughput de:
+- ``set``: escritura individual de cada documento
+- ``bulk``: la misma escritura con ``bulk_writer()`` (un escritor por hilo)
+- ``get``: lectura por ID
+- ``update``: actualización condicional con la versión leída antes (lectura + escritura)
+- ``query``: recorrido de las páginas de un usuario por ``timestamp`` descendente
+
+Al terminar borra los documentos. El backend ``sqlite`` usa ``--path`` (por defecto un
+archivo temporal) y no necesita credenciales; ``firestore`` usa las del proyecto.
+
+Ejemplos:
+    python -m tools.bench_persistence --backends sqlite
+    python -m tools.bench_persistence --backends sqlite firestore --documents 500 --workers 16
+    python -m tools.bench_persistence --backends sqlite --synchronous FULL --path /mnt/nvme/bench.sqlite3
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import datetime as dt
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from api.config import SQLITE_BATCH_SIZE, SQLITE_BUSY_TIMEOUT_MS
+from api.services.document_backends import DocumentBackend, FirestoreBackend, SQLiteBackend
+from tools.histogram import LatencyHistogram
+
+USERS: int = 20
+
+def run_phase(operation: Callable[[Any], int], items: List[Any], workers: int) -> Dict[str, Any]:
+    """Ejecuta ``operation`` sobre cada elemento y resume latencias, operaciones/s y documentos/s."""
+    histogram: LatencyHistogram = LatencyHistogram()
+    errors: List[str] = []
+
+    def timed(item: Any) -> int:
+        started: float = time.perf_counter()
+        try:
+            documents: int = operation(item)
+        except Exception as e:
+            errors.append(str(e))
+            return 0
+        histogram.record(int((time.perf_counter() - started) * 1_000_000))
+        return documents
+
+    started: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        documents: int = sum(executor.map(timed, items))
+    elapsed: float = time.perf_counter() - started
+    return {
+        **histogram.summary(),
+        "ops_per_s": round(len(items) / elapsed, 1),
+        "docs_per_s": round(documents / elapsed, 1),
+        "errors": len(errors),
+        **({"first_error": errors[0]} if errors else {}),
+    }
+
+def message(index: int, started: dt.datetime) -> Dict[str, Any]:
+    return {
+        "user_id": f"user_{index % USERS}",
+        "phone_number": f"57300{index % USERS:07d}",
+        "message_type": "text",
+        "timestamp": started + dt.timedelta(seconds=index),
+        "message_text": f"Compra de prueba número {index} por 25.000 pesos",
+        "metadata": {"source": "bench", "index": index},
+    }
+
+def bench_backend(backend: DocumentBackend, args: argparse.Namespace) -> Dict[str, Any]:
+    collection: str = f"bench_persistence_{uuid.uuid4().hex[:8]}"
+    started: dt.datetime = dt.datetime.now(dt.timezone.utc)
+    doc_ids: List[str] = [f"doc_{index:07d}" for index in range(args.documents)]
+    slices: List[List[int]] = [list(range(start, args.documents, args.workers)) for start in range(args.workers)]
+
+    def set_one(index: int) -> int:
+        backend.set_document(collection, doc_ids[index], message(index, started))
+        return 1
+
+    def bulk(indexes: List[int]) -> int:
+        with backend.bulk_writer() as writer:
+            for index in indexes:
+                backend.set_document(collection, doc_ids[index], message(index, started), writer=writer)
+        return len(indexes)
+
+    def get(index: int) -> int:
+        if backend.get_document_version(collection, doc_ids[index])[0] is None:
+            raise RuntimeError(f"No existe {doc_ids[index]}")
+        return 1
+
+    def update(index: int) -> int:
+        _, version = backend.get_document_version(collection, doc_ids[index], fields=["user_id"])
+        backend.update_document(collection, doc_ids[index], {"metadata.updated": True}, last_update_time=version, read_back=False)
+        return 1
+
+    def query(user: int) -> int:
+        order_by = [("timestamp", "DESCENDING"), ("__name__", "DESCENDING")]
+        start_after: Optional[Dict[str, Any]] = None
+        documents: int = 0
+        while True:
+            page: List[Dict] = backend.query_page(collection, [("user_id", "==", f"user_{user}")], order_by, args.page_size, start_after)
+            documents += len(page)
+            if len(page) < args.page_size:
+                return documents
+            start_after = {"timestamp": page[-1]["timestamp"], "__name__": page[-1]["id"]}
+
+    results: Dict[str, Any] = {}
+    indexes: List[int] = list(range(args.documents))
+    try:
+        results["set"] = run_phase(set_one, indexes, args.workers)
+        results["bulk"] = run_phase(bulk, slices, args.workers)
+        results["get"] = run_phase(get, indexes, args.workers)
+        results["update"] = run_phase(update, indexes, args.workers)
+        results["query"] = run_phase(query, list(range(USERS)), args.workers)
+    finally:
+        with backend.bulk_writer() as writer:
+            for doc_id in doc_ids:
+                backend.delete_document(collection, doc_id, writer=writer)
+    return results
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compara la latencia y el throughput de los backends de persistencia.")
+    parser.add_argument("--backends", nargs="+", choices=["sqlite", "firestore"], default=["sqlite"], help="Backends a medir")
+    parser.add_argument("--documents", type=int, default=2000, help="Documentos por fase")
+    parser.add_argument("--workers", type=int, default=8, help="Hilos concurrentes")
+    parser.add_argument("--page-size", type=int, default=20, help="Documentos por página en la fase de consulta")
+    parser.add_argument("--path", default=None, help="Archivo SQLite (por defecto uno temporal)")
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"], help="PRAGMA synchronous de SQLite")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+    report: Dict[str, Any] = {
+        "documents": args.documents,
+        "workers": args.workers,
+    }
+    for name in args.backends:
+        if name == "sqlite":
+            directory: Optional[str] = None if args.path else tempfile.mkdtemp(prefix="fin_app_bench_persistence_")
+            path: str = args.path or os.path.join(directory, "bench.sqlite3")
+            backend: DocumentBackend = SQLiteBackend(path, SQLITE_BATCH_SIZE, args.synchronous, SQLITE_BUSY_TIMEOUT_MS)
+            try:
+                report[name] = bench_backend(backend, args)
+            finally:
+                if directory:
+                    shutil.rmtree(directory, ignore_errors=True)
+        else:
+            report[name] = bench_backend(FirestoreBackend(), args)
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
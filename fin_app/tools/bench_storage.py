@@ -0,0 +1,139 @@
+# file: /tools/bench_storage.py
+"""
+Benchmark de los backends de almacenamiento (``gcs`` y ``local``).
+
+Por cada backend escribe ``--objects`` objetos de ``--size`` bytes bajo un prefijo
+temporal, y mide con ``--workers`` hilos la latencia y el throughput de:
+- ``put``: ``put_stream`` en bloques de ``--chunk-size`` bytes
+- ``get``: lectura completa con ``open_stream``
+- ``tail``: lectura de los últimos 2 KB (como el trailer de un PDF)
+- ``exists``
+
+Al terminar borra los objetos. El backend ``local`` usa ``--dir`` (por defecto un
+directorio temporal) y no necesita credenciales; ``gcs`` usa ``CLOUD_STORAGE_BUCKET``.
+
+Ejemplos:
+    python -m tools.bench_storage --backends local
+    python -m tools.bench_storage --backends local gcs --objects 200 --size 262144 --workers 16
+    python -m tools.bench_storage --backends local --no-fsync --dir /mnt/nvme/bench
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from api.config import CLOUD_STORAGE_BUCKET, GOOGLE_CLOUD_PROJECT, LOCAL_STORAGE_SHARD_DEPTH
+from api.services.storage_backends import GCSBackend, LocalStorageBackend, MediaStream, StorageBackend
+from tools.histogram import LatencyHistogram
+
+TAIL_BYTES: int = 2048
+
+def chunked(data: bytes, chunk_size: int) -> Iterator[bytes]:
+    view: memoryview = memoryview(data)
+    for offset in range(0, len(data), chunk_size):
+        yield bytes(view[offset:offset + chunk_size])
+
+def read_all(stream: Optional[MediaStream]) -> int:
+    if stream is None:
+        raise RuntimeError("Objeto no encontrado")
+    with stream:
+        return sum(len(chunk) for chunk in stream.iter_chunks())
+
+def run_phase(operation: Callable[[str], int], paths: List[str], workers: int) -> Dict[str, Any]:
+    """Ejecuta ``operation`` sobre cada ruta y resume latencias, objetos/s y MB/s."""
+    histogram: LatencyHistogram = LatencyHistogram()
+    errors: List[str] = []
+
+    def timed(path: str) -> int:
+        started: float = time.perf_counter()
+        try:
+            transferred: int = operation(path)
+        except Exception as e:
+            errors.append(str(e))
+            return 0
+        histogram.record(int((time.perf_counter() - started) * 1_000_000))
+        return transferred
+
+    started: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        transferred: int = sum(executor.map(timed, paths))
+    elapsed: float = time.perf_counter() - started
+    return {
+        **histogram.summary(),
+        "objects_per_s": round(len(paths) / elapsed, 1),
+        "mb_per_s": round(transferred / elapsed / 1_000_000, 2),
+        "errors": len(errors),
+        **({"first_error": errors[0]} if errors else {}),
+    }
+
+def bench_backend(backend: StorageBackend, bucket_name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    payload: bytes = os.urandom(args.size)
+    prefix: str = f"bench_storage/{uuid.uuid4().hex[:8]}"
+    paths: List[str] = [f"{prefix}/{index:06d}.bin" for index in range(args.objects)]
+
+    def put(path: str) -> int:
+        backend.put_stream(bucket_name, path, chunked(payload, args.chunk_size), content_type="application/octet-stream")
+        return args.size
+
+    def get(path: str) -> int:
+        return read_all(backend.open_stream(bucket_name, path, chunk_size=args.chunk_size))
+
+    def tail(path: str) -> int:
+        return read_all(backend.open_stream(bucket_name, path, start=-TAIL_BYTES))
+
+    def exists(path: str) -> int:
+        if not backend.exists(bucket_name, path):
+            raise RuntimeError(f"No existe {path}")
+        return 0
+
+    results: Dict[str, Any] = {}
+    try:
+        for name, operation in (("put", put), ("get", get), ("tail", tail), ("exists", exists)):
+            results[name] = run_phase(operation, paths, args.workers)
+    finally:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            list(executor.map(lambda path: backend.delete(bucket_name, path), paths))
+    return results
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compara la latencia y el throughput de los backends de almacenamiento.")
+    parser.add_argument("--backends", nargs="+", choices=["local", "gcs"], default=["local"], help="Backends a medir")
+    parser.add_argument("--objects", type=int, default=500, help="Objetos por fase")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="Bytes por objeto")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024, help="Bytes por bloque al escribir y leer")
+    parser.add_argument("--workers", type=int, default=8, help="Hilos concurrentes")
+    parser.add_argument("--dir", default=None, help="Directorio del backend local (por defecto uno temporal)")
+    parser.add_argument("--no-fsync", action="store_true", help="Backend local sin fsync al escribir")
+    parser.add_argument("--bucket", default=CLOUD_STORAGE_BUCKET, help="Bucket a usar")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+    report: Dict[str, Any] = {
+        "objects": args.objects,
+        "size": args.size,
+        "workers": args.workers,
+    }
+    for name in args.backends:
+        if name == "local":
+            directory: str = args.dir or tempfile.mkdtemp(prefix="fin_app_bench_storage_")
+            backend: StorageBackend = LocalStorageBackend(directory, LOCAL_STORAGE_SHARD_DEPTH, fsync=not args.no_fsync)
+            try:
+                report[name] = bench_backend(backend, args.bucket, args)
+            finally:
+                if not args.dir:
+                    shutil.rmtree(directory, ignore_errors=True)
+        else:
+            report[name] = bench_backend(GCSBackend(GOOGLE_CLOUD_PROJECT), args.bucket, args)
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,98 @@
+# file: /tools/extract_transactions.py
+"""
+Extracción masiva de transacciones desde el texto OCR ya almacenado en ``whatsapp_media``.
+
+Recorre los medios procesados en streaming, extrae los campos financieros en paralelo
+(un proceso por núcleo, en un pool que dura toda la ejecución) y guarda los registros
+con un BulkWriter.
+
+Ejemplos:
+    python -m tools.extract_transactions --dry-run
+    python -m tools.extract_transactions --only-missing --workers 8
+"""
+
+import argparse
+import json
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from api.config import logger, COLLECTION_WHATSAPP_MEDIA, COLLECTION_TRANSACTIONS, DEFAULT_LOCALE
+from api.services import FirestoreService, FinancialExtractionService
+from api.models import Transaction
+
+def iter_chunks(documents: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for document in documents:
+        if document.get('ocr_text'):
+            chunk.append(document)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def process_chunk(chunk: List[Dict[str, Any]], args: argparse.Namespace, pool: ProcessPoolExecutor,
+                  stats: Dict[str, Any], started: float) -> None:
+    """Extrae las transacciones de un lote de medios con el pool compartido y las guarda."""
+    stats["scanned"] += len(chunk)
+    if args.only_missing:
+        existing: Dict[str, Dict] = FirestoreService.get_many(COLLECTION_TRANSACTIONS, [doc["id"] for doc in chunk], fields=[])
+        stats["skipped_existing"] += len(existing)
+        chunk = [doc for doc in chunk if doc["id"] not in existing]
+
+    by_id: Dict[str, Dict[str, Any]] = {doc["id"]: doc for doc in chunk}
+    results: Iterator[Tuple[str, Dict[str, Any]]] = FinancialExtractionService.extract_many(
+        ((doc["id"], doc["ocr_text"]) for doc in chunk), locale=args.locale, executor=pool
+    )
+
+    transactions: List[Transaction] = []
+    for media_id, fields in results:
+        doc: Dict[str, Any] = by_id[media_id]
+        transaction: Transaction = Transaction.from_extraction(media_id, doc.get("user_id"), doc.get("phone_number"), fields)
+        if transaction.has_data():
+            transactions.append(transaction)
+            stats["with_total"] += transaction.total is not None
+
+    stats["extracted"] += len(transactions)
+    if not args.dry_run and transactions:
+        with FirestoreService.bulk_writer() as writer:
+            for transaction in transactions:
+                transaction.save(writer=writer)
+
+    elapsed: float = time.perf_counter() - started
+    logger.info(f"Procesados {stats['scanned']} medios ({stats['scanned'] / elapsed:.1f}/s), {stats['extracted']} transacciones")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Extrae transacciones del texto OCR almacenado.")
+    parser.add_argument("--locale", default=DEFAULT_LOCALE, help="Configuración regional de los recibos")
+    parser.add_argument("--workers", type=int, help="Procesos de extracción (por defecto, uno por núcleo)")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Documentos leídos y escritos por lote")
+    parser.add_argument("--only-missing", action="store_true", help="Omitir medios que ya tienen transacción")
+    parser.add_argument("--dry-run", action="store_true", help="Extraer sin guardar y mostrar estadísticas")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+    stats: Dict[str, Any] = {"scanned": 0, "extracted": 0, "with_total": 0, "skipped_existing": 0}
+    started: float = time.perf_counter()
+
+    documents: Iterator[Dict[str, Any]] = FirestoreService.stream_documents(
+        COLLECTION_WHATSAPP_MEDIA,
+        filters=[("processed", "==", True)],
+        fields=["user_id", "phone_number", "ocr_text"]
+    )
+
+    # Un solo pool para toda la ejecución (los procesos se crean una vez, con spawn)
+    with FinancialExtractionService.process_pool(args.workers) as pool:
+        for chunk in iter_chunks(documents, args.chunk_size):
+            process_chunk(chunk, args, pool, stats, started)
+
+    stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+    stats["dry_run"] = args.dry_run
+    print(json.dumps(stats, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+# file: /tools/histogram.py
+
+import math
+import threading
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+class LatencyHistogram:
+    """
+    Histograma log-lineal de latencias en microsegundos (estilo HdrHistogram).
+
+    Cada potencia de dos se divide en ``2 ** (sub_bucket_bits - 1)`` sub-buckets, por
+    lo que el error relativo de cualquier percentil es menor a
+    ``2 ** -(sub_bucket_bits - 1)`` y la memoria usada no depende del número de
+    muestras registradas.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 7, max_value_us: int = 3_600_000_000):
+        self.sub_bucket_bits: int = sub_bucket_bits
+        self.sub_bucket_count: int = 1 << sub_bucket_bits
+        self.max_value_us: int = max_value_us
+        bucket_count: int = max(1, max_value_us.bit_length() - sub_bucket_bits + 1)
+        self.counts: List[int] = [0] * (bucket_count * self.sub_bucket_count)
+        self.total_count: int = 0
+        self.min_us: Optional[int] = None
+        self.max_us: int = 0
+        self._sum_us: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def _index(self, value_us: int) -> int:
+        if value_us < self.sub_bucket_count:
+            return value_us
+        shift: int = value_us.bit_length() - self.sub_bucket_bits
+        return (shift << self.sub_bucket_bits) + (value_us >> shift)
+
+    def _value_at(self, index: int) -> int:
+        if index < self.sub_bucket_count:
+            return index
+        shift: int = index >> self.sub_bucket_bits
+        sub_bucket: int = index & (self.sub_bucket_count - 1)
+        # Punto medio del rango cubierto por el sub-bucket
+        return (sub_bucket << shift) + ((1 << shift) >> 1)
+
+    def record(self, value_us: int, expected_interval_us: Optional[int] = None) -> None:
+        """
+        Registra una latencia.
+
+        Args:
+            value_us: Latencia observada en microsegundos
+            expected_interval_us: Intervalo esperado entre envíos. Si se indica y la
+                latencia lo supera, se registran las muestras que el generador dejó
+                de enviar mientras esperaba (corrección de coordinated omission).
+        """
+        value_us = min(max(0, int(value_us)), self.max_value_us)
+        with self._lock:
+            self._record(value_us)
+            if expected_interval_us and expected_interval_us > 0:
+                missing: int = value_us - expected_interval_us
+                while missing >= expected_interval_us:
+                    self._record(missing)
+                    missing -= expected_interval_us
+
+    def _record(self, value_us: int) -> None:
+        self.counts[self._index(value_us)] += 1
+        self.total_count += 1
+        self._sum_us += value_us
+        self.max_us = max(self.max_us, value_us)
+        self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        """Acumula en este histograma las muestras de otro con la misma precisión."""
+        if other.sub_bucket_bits != self.sub_bucket_bits or len(other.counts) != len(self.counts):
+            raise ValueError("Los histogramas deben tener la misma configuración")
+        with self._lock:
+            for index, count in enumerate(other.counts):
+                if count:
+                    self.counts[index] += count
+            self.total_count += other.total_count
+            self._sum_us += other._sum_us
+            self.max_us = max(self.max_us, other.max_us)
+            if other.min_us is not None:
+                self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+
+    def mean(self) -> float:
+        return self._sum_us / self.total_count if self.total_count else 0.0
+
+    def percentile(self, percentile: float) -> int:
+        """Devuelve el valor (en microsegundos) del percentil indicado (0-100)."""
+        if not self.total_count:
+            return 0
+        target: int = max(1, math.ceil(self.total_count * percentile / 100.0))
+        seen: int = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._value_at(index), self.max_us)
+        return self.max_us
+
+    def iter_distribution(self) -> Iterator[Tuple[int, int, float]]:
+        """Itera ``(valor_us, cuenta, percentil_acumulado)`` de los buckets no vacíos."""
+        seen: int = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                yield self._value_at(index), count, 100.0 * seen / self.total_count
+
+    def summary(self, percentiles: Tuple[float, ...] = (50, 90, 99, 99.9)) -> Dict[str, float]:
+        """Resumen en milisegundos apto para imprimir o serializar en JSON."""
+        result: Dict[str, float] = {
+            "count": self.total_count,
+            "min_ms": (self.min_us or 0) / 1000.0,
+            "mean_ms": round(self.mean() / 1000.0, 3),
+        }
+        for percentile in percentiles:
+            result[f"p{percentile:g}_ms"] = self.percentile(percentile) / 1000.0
+        result["max_ms"] = self.max_us / 1000.0
+        return result
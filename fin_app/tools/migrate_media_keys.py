@@ -0,0 +1,102 @@
+# file: /tools/migrate_media_keys.py
+"""
+Migra los objetos de ``whatsapp_media`` al esquema de claves configurado (``MEDIA_KEY_LAYOUT``).
+
+Por cada registro: copia el objeto en el backend de almacenamiento configurado
+(``STORAGE_BACKEND``: en GCS con ``rewrite``, sin pasar los bytes por esta máquina; en el
+backend local, una copia del archivo), actualiza ``storage_path`` con el esquema del
+backend y, con ``--delete-source``, elimina el original.
+Los lectores que aún tengan la ruta anterior la resuelven con ``alternate_media_path``.
+
+Ejemplos:
+    python -m tools.migrate_media_keys --dry-run
+    python -m tools.migrate_media_keys --workers 16
+    python -m tools.migrate_media_keys --workers 16 --delete-source
+"""
+
+import json
+import time
+import argparse
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from api.config import logger, COLLECTION_WHATSAPP_MEDIA, MEDIA_KEY_LAYOUT
+from api.services import FirestoreService, StorageService
+from api.services.cloud_storage_service import alternate_media_path, is_hashed_media_path
+
+def target_path(object_path: str, layout: str) -> Optional[str]:
+    """Ruta del objeto en el esquema ``layout`` o None si ya está en él (o no es un medio)."""
+    if is_hashed_media_path(object_path) == (layout == "hashed"):
+        return None
+    return alternate_media_path(object_path)
+
+def migrate(document: Dict[str, Any], layout: str, delete_source: bool, dry_run: bool) -> str:
+    """Migra un registro y devuelve el resultado (``migrated``, ``skipped``, ``invalid`` o ``failed``)."""
+    bucket_name, object_path = StorageService.parse_storage_path(document.get("storage_path"))
+    if not (bucket_name and object_path):
+        return "invalid"
+    new_path: Optional[str] = target_path(object_path, layout)
+    if not new_path:
+        return "skipped"
+    if dry_run:
+        return "migrated"
+
+    if not StorageService.copy_object(bucket_name, object_path, new_path):
+        return "failed"
+    updated = FirestoreService.update_document(
+        COLLECTION_WHATSAPP_MEDIA, document["id"], {"storage_path": StorageService.storage_uri(bucket_name, new_path)}, read_back=False
+    )
+    if updated is None:
+        logger.error(f"No se pudo actualizar storage_path de {document['id']}")
+        return "failed"
+    if delete_source:
+        StorageService.delete_object(bucket_name, object_path)
+    return "migrated"
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Migra los archivos multimedia al esquema de claves configurado.")
+    parser.add_argument("--layout", choices=["hashed", "dated"], default=MEDIA_KEY_LAYOUT, help="Esquema de destino")
+    parser.add_argument("--workers", type=int, default=8, help="Copias en paralelo")
+    parser.add_argument("--page-size", type=int, default=500, help="Registros leídos por página")
+    parser.add_argument("--delete-source", action="store_true", help="Eliminar el objeto original tras actualizar el registro")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar lo que se migraría")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+    stats: Counter = Counter()
+    started: float = time.monotonic()
+    cursor: Optional[str] = None
+
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="migrate") as executor:
+        while True:
+            page: List[Dict[str, Any]] = FirestoreService.query_page(
+                COLLECTION_WHATSAPP_MEDIA,
+                order_by=[("__name__", "ASCENDING")],
+                limit=args.page_size,
+                start_after={"__name__": cursor} if cursor else None,
+                fields=["storage_path"]
+            )
+            if not page:
+                break
+            cursor = page[-1]["id"]
+
+            stats.update(executor.map(lambda doc: migrate(doc, args.layout, args.delete_source, args.dry_run), page))
+            elapsed: float = time.monotonic() - started
+            logger.info(f"{sum(stats.values())} registros revisados ({sum(stats.values()) / elapsed:.1f}/s): {dict(stats)}")
+
+            if len(page) < args.page_size:
+                break
+
+    print(json.dumps({
+        "layout": args.layout,
+        "dry_run": args.dry_run,
+        "elapsed_s": round(time.monotonic() - started, 2),
+        **dict(stats)
+    }, indent=2))
+    return 0 if not stats["failed"] else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
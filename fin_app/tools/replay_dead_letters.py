@@ -0,0 +1,118 @@
+# file: /tools/replay_dead_letters.py
+"""
+Reencola en Pub/Sub los mensajes de la colección de mensajes muertos.
+
+Los mensajes se publican por lotes de ``--batch-size`` con una pausa entre lotes, para no
+repetir de golpe la carga que los hizo fallar; cada mensaje reencolado queda marcado como
+``replayed`` con el ID del nuevo mensaje. Si el payload no se guardó (era muy grande) se
+reconstruye desde el mensaje crudo de WhatsApp.
+
+Ejemplos:
+    python -m tools.replay_dead_letters --dry-run
+    python -m tools.replay_dead_letters --lane media --batch-size 20 --pause 30
+    python -m tools.replay_dead_letters --ids 1234567890 1234567891
+"""
+
+import json
+import time
+import argparse
+
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from api.config import logger, COLLECTION_PUBSUB_DEAD_LETTERS
+from api.services import FirestoreService, PubSubService, DeadLetterService, MessageArchiveService
+from api.services.dead_letter_service import PENDING
+
+def rebuild_payload(document: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Payload a publicar: el guardado o, si no hay, el reconstruido desde el mensaje crudo."""
+    if document.get("payload"):
+        return document["payload"]
+    message_id: Optional[str] = document.get("whatsapp_message_id")
+    value: Optional[Dict[str, Any]] = MessageArchiveService.load_raw(message_id) if message_id else None
+    if not value:
+        return None
+    message: Dict[str, Any] = (value.get("messages") or [{}])[0]
+    return {
+        "message": {"id": message.get("id"), "from": message.get("from"), "type": message.get("type")},
+        "value": value,
+        "phone_business_id": (value.get("metadata") or {}).get("phone_number_id", ""),
+    }
+
+def pending_batches(lane: Optional[str], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    filters: List[Tuple[str, str, Any]] = [("status", "==", PENDING)]
+    if lane:
+        filters.append(("lane", "==", lane))
+    cursor: Optional[str] = None
+    while True:
+        page: List[Dict[str, Any]] = FirestoreService.query_page(
+            COLLECTION_PUBSUB_DEAD_LETTERS,
+            filters=filters,
+            order_by=[("__name__", "ASCENDING")],
+            limit=batch_size,
+            start_after={"__name__": cursor} if cursor else None,
+        )
+        if not page:
+            return
+        cursor = page[-1]["id"]
+        yield page
+        if len(page) < batch_size:
+            return
+
+def replay(document: Dict[str, Any], dry_run: bool) -> str:
+    """Reencola un mensaje muerto y devuelve el resultado (``replayed``, ``missing``, ``skipped`` o ``failed``)."""
+    if document.get("status") != PENDING:
+        return "skipped"
+    payload: Optional[Dict[str, Any]] = rebuild_payload(document)
+    if not payload:
+        logger.error(f"Sin payload para reencolar el mensaje muerto {document['id']}")
+        return "missing"
+    if dry_run:
+        return "replayed"
+    try:
+        new_id: str = PubSubService.publish_message(payload, lane=document.get("lane"))
+    except Exception as e:
+        logger.error(f"No se pudo reencolar {document['id']}: {str(e)}")
+        return "failed"
+    DeadLetterService.mark_replayed(document["id"], new_id)
+    return "replayed"
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reencola en Pub/Sub los mensajes muertos por lotes.")
+    parser.add_argument("--ids", nargs="+", help="Reencolar solo estos mensajes (IDs de Pub/Sub)")
+    parser.add_argument("--lane", choices=["interactive", "media"], help="Solo los mensajes de este carril")
+    parser.add_argument("--batch-size", type=int, default=50, help="Mensajes por lote")
+    parser.add_argument("--max-batches", type=int, default=None, help="Detenerse tras este número de lotes")
+    parser.add_argument("--pause", type=float, default=10.0, help="Segundos de espera entre lotes")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar lo que se reencolaría")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+    stats: Counter = Counter()
+    started: float = time.monotonic()
+
+    if args.ids:
+        documents: Dict[str, Dict] = FirestoreService.get_many(COLLECTION_PUBSUB_DEAD_LETTERS, args.ids)
+        stats["not_found"] = len(set(args.ids) - set(documents))
+        batches: Iterator[List[Dict[str, Any]]] = iter([list(documents.values())])
+    else:
+        batches = pending_batches(args.lane, args.batch_size)
+
+    for number, batch in enumerate(batches, start=1):
+        if number > 1 and not args.dry_run:
+            time.sleep(args.pause)
+        stats.update(replay(document, args.dry_run) for document in batch)
+        logger.info(f"Lote {number}: {len(batch)} mensajes; acumulado {dict(stats)}")
+        if args.max_batches and number >= args.max_batches:
+            break
+
+    print(json.dumps({
+        "dry_run": args.dry_run,
+        "elapsed_s": round(time.monotonic() - started, 2),
+        **dict(stats)
+    }, indent=2))
+    return 0 if not (stats["failed"] or stats["missing"]) else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
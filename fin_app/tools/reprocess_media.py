@@ -0,0 +1,303 @@
+# file: /tools/reprocess_media.py
+"""
+Reprocesa (OCR, transcripción, extracción de transacciones) los registros de ``whatsapp_media``
+que cumplen un filtro, reutilizando ``process_media`` en un pool de hilos acotado.
+
+- Las llamadas a Vision (imágenes y documentos) pasan por un limitador de tasa compartido.
+- El avance se guarda en un archivo de checkpoint tras cada página completada, de modo que
+  ``--resume`` continúa donde se quedó (como mucho se repite una página, y reprocesar es idempotente).
+- ``--dry-run`` solo recorre y cuenta lo que se reprocesaría.
+
+Ejemplos:
+    python -m tools.reprocess_media --select unprocessed --dry-run
+    python -m tools.reprocess_media --select empty-ocr --workers 8 --vision-qps 10
+    python -m tools.reprocess_media --select all --media-type image --since 2025-03-01 --resume
+"""
+
+import os
+import json
+import time
+import argparse
+import hashlib
+import threading
+
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from api.config import logger, COLLECTION_WHATSAPP_MEDIA
+from api.services import FirestoreService
+from api.routes.pubsub_chatbot import process_media
+
+# Tipos de medio cuyo procesamiento llama a Cloud Vision
+VISION_MEDIA_TYPES = ('image', 'document')
+
+MEDIA_FIELDS: List[str] = ['media_type', 'storage_path', 'created_at']
+
+# Selecciones disponibles: solo filtros de igualdad, que junto con el orden por
+# __name__ se resuelven con los índices de campo único (sin índices compuestos)
+SELECTIONS: Dict[str, List[Tuple[str, str, Any]]] = {
+    'unprocessed': [('processed', '==', False)],
+    'empty-ocr': [('ocr_text', '==', None)],
+    'all': [],
+}
+
+class RateLimiter:
+    """Cubeta de tokens compartida entre hilos: como máximo ``rate`` llamadas por segundo."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now: float = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait: float = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Checkpoint:
+    """Archivo JSON con el último ID completado y las estadísticas acumuladas."""
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+
+    def load(self) -> Tuple[Optional[str], Counter]:
+        if not os.path.exists(self.path):
+            return None, Counter()
+        with open(self.path, 'r', encoding='utf-8') as file:
+            data: Dict[str, Any] = json.load(file)
+        if data.get('fingerprint') != self.fingerprint:
+            raise SystemExit(f"El checkpoint {self.path} corresponde a otro filtro; usa otro --checkpoint o elimínalo")
+        return data.get('cursor'), Counter(data.get('stats') or {})
+
+    def save(self, cursor: Optional[str], stats: Counter) -> None:
+        # Escritura atómica: un corte a mitad no deja un checkpoint corrupto
+        tmp_path: str = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                'fingerprint': self.fingerprint,
+                'cursor': cursor,
+                'stats': dict(stats),
+                'updated_at': datetime.now(timezone.utc).isoformat()
+            }, file)
+        os.replace(tmp_path, self.path)
+
+class Progress:
+    """
+    Lleva las estadísticas y la marca de agua del checkpoint.
+
+    Los documentos terminan fuera de orden, así que el cursor solo avanza hasta la
+    última página cuyas tareas (y las de todas las anteriores) ya terminaron.
+    """
+
+    def __init__(self, checkpoint: Optional[Checkpoint], cursor: Optional[str], stats: Counter,
+                 remaining: int, report_every: float):
+        self.checkpoint = checkpoint
+        self.cursor = cursor
+        self.stats = stats
+        self.remaining = remaining
+        self.report_every = report_every
+        self.pages: Deque[List[Any]] = deque()
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.completed_at_start = stats['completed']
+        self.skipped_at_start = stats['skipped']
+        self.last_report = self.started
+
+    def open_page(self, cursor: str, pending: int, skipped: int) -> None:
+        with self.lock:
+            self.stats['skipped'] += skipped
+            self.pages.append([cursor, pending])
+            self._advance()
+
+    def finish(self, page_cursor: str, outcome: str, media_type: str) -> None:
+        with self.lock:
+            self.stats['completed'] += 1
+            self.stats[outcome] += 1
+            self.stats[f'type:{media_type}'] += 1
+            for page in self.pages:
+                if page[0] == page_cursor:
+                    page[1] -= 1
+                    break
+            self._advance()
+            if time.monotonic() - self.last_report >= self.report_every:
+                self.last_report = time.monotonic()
+                logger.info(self.describe())
+
+    def _advance(self) -> None:
+        advanced: bool = False
+        while self.pages and self.pages[0][1] == 0:
+            self.cursor = self.pages.popleft()[0]
+            advanced = True
+        if advanced and self.checkpoint:
+            self.checkpoint.save(self.cursor, self.stats)
+
+    def rate(self) -> float:
+        elapsed: float = time.monotonic() - self.started
+        return (self.stats['completed'] - self.completed_at_start) / elapsed if elapsed > 0 else 0.0
+
+    def describe(self) -> str:
+        rate: float = self.rate()
+        done: int = self.stats['completed'] - self.completed_at_start + self.stats['skipped'] - self.skipped_at_start
+        remaining: int = max(0, self.remaining - done)
+        eta: str = f"{remaining / rate / 60:.1f} min" if rate > 0 else "desconocido"
+        return (f"{self.stats['completed']} medios, {remaining} pendientes, {rate:.2f}/s, ETA {eta} "
+                f"(ocr={self.stats['ocr']}, vacíos={self.stats['empty']}, errores={self.stats['failed']})")
+
+def parse_datetime(raw: str) -> datetime:
+    value: datetime = datetime.fromisoformat(raw)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def in_range(document: Dict[str, Any], since: Optional[datetime], until: Optional[datetime]) -> bool:
+    """Filtro por fecha del lado del cliente (evita índices compuestos por cada selección)."""
+    if not (since or until):
+        return True
+    created_at: Any = document.get('created_at')
+    if not isinstance(created_at, datetime):
+        return False
+    if not created_at.tzinfo:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return (not since or created_at >= since) and (not until or created_at < until)
+
+def reprocess(document: Dict[str, Any], limiter: RateLimiter) -> str:
+    """Ejecuta ``process_media`` sobre un registro y clasifica el resultado."""
+    media_type: str = document.get('media_type') or ''
+    if media_type in VISION_MEDIA_TYPES:
+        limiter.acquire()
+
+    result: Dict[str, Any] = process_media({
+        'media_id': document['id'],
+        'media_type': media_type,
+        'storage_path': document.get('storage_path') or ''
+    })
+    if not result.get('success'):
+        return 'failed'
+    if result.get('ocr_text') or result.get('transcription'):
+        return 'ocr'
+    return 'empty'
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reprocesa archivos multimedia con process_media.")
+    parser.add_argument("--select", choices=sorted(SELECTIONS), default="unprocessed",
+                        help="unprocessed: processed=False; empty-ocr: sin texto OCR; all: todos")
+    parser.add_argument("--media-type", choices=['image', 'document', 'audio', 'video'], help="Restringir a un tipo de medio")
+    parser.add_argument("--since", type=parse_datetime, help="Solo medios creados desde esta fecha (ISO 8601)")
+    parser.add_argument("--until", type=parse_datetime, help="Solo medios creados antes de esta fecha (ISO 8601)")
+    parser.add_argument("--workers", type=int, default=4, help="Hilos de procesamiento")
+    parser.add_argument("--vision-qps", type=float, default=5.0, help="Máximo de llamadas por segundo a Vision (0 = sin límite)")
+    parser.add_argument("--page-size", type=int, default=200, help="Documentos leídos por página")
+    parser.add_argument("--limit", type=int, help="Máximo de medios a reprocesar en esta ejecución")
+    parser.add_argument("--checkpoint", default=".reprocess_media.checkpoint.json", help="Archivo de checkpoint")
+    parser.add_argument("--resume", action="store_true", help="Continuar desde el checkpoint")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Segundos entre reportes de progreso")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar lo que se reprocesaría")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+
+    filters: List[Tuple[str, str, Any]] = list(SELECTIONS[args.select])
+    if args.media_type:
+        filters.append(('media_type', '==', args.media_type))
+    fingerprint: str = hashlib.sha1(
+        "|".join(map(str, (args.select, args.media_type, args.since, args.until))).encode('utf-8')
+    ).hexdigest()[:12]
+
+    checkpoint: Optional[Checkpoint] = None if args.dry_run else Checkpoint(args.checkpoint, fingerprint)
+    cursor: Optional[str] = None
+    stats: Counter = Counter()
+    if args.resume and checkpoint:
+        cursor, stats = checkpoint.load()
+        logger.info(f"Reanudando después de {cursor} ({stats['completed']} medios ya procesados)")
+
+    # Conteo en el servidor para el ETA (cota superior si se filtra por fecha). Con
+    # 'unprocessed' y 'empty-ocr' lo ya reprocesado sale del filtro; con 'all' se descuenta
+    remaining: int = FirestoreService.count_documents(COLLECTION_WHATSAPP_MEDIA, filters)
+    if args.select == 'all':
+        remaining = max(0, remaining - stats['completed'] - stats['skipped'])
+    logger.info(f"{remaining} medios pendientes con el filtro {args.select} {args.media_type or ''}")
+
+    progress: Progress = Progress(checkpoint, cursor, stats, remaining, args.report_every)
+    limiter: RateLimiter = RateLimiter(args.vision_qps)
+    executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="reprocess")
+    # Acota las tareas en cola para no leer páginas mucho más rápido de lo que se procesan
+    slots: threading.BoundedSemaphore = threading.BoundedSemaphore(args.workers * 2)
+    submitted: int = 0
+
+    def on_done(future: Future, page_cursor: str, media_type: str) -> None:
+        slots.release()
+        if future.cancelled():
+            return
+        try:
+            outcome: str = future.result()
+        except Exception as e:
+            logger.error(f"Error al reprocesar en la página {page_cursor}: {str(e)}")
+            outcome = 'failed'
+        progress.finish(page_cursor, outcome, media_type)
+
+    try:
+        while args.limit is None or submitted < args.limit:
+            page: List[Dict[str, Any]] = FirestoreService.query_page(
+                COLLECTION_WHATSAPP_MEDIA,
+                filters=filters,
+                order_by=[('__name__', 'ASCENDING')],
+                limit=args.page_size,
+                start_after={'__name__': cursor} if cursor else None,
+                fields=MEDIA_FIELDS
+            )
+            if not page:
+                break
+            more: bool = len(page) == args.page_size
+
+            selected: List[Dict[str, Any]] = [doc for doc in page if in_range(doc, args.since, args.until)]
+            if args.limit is not None and len(selected) > args.limit - submitted:
+                # Cortar la página en el último documento tomado para que el checkpoint no lo salte
+                selected = selected[:args.limit - submitted]
+                page = page[:page.index(selected[-1]) + 1]
+            cursor = page[-1]['id']
+
+            if args.dry_run:
+                stats['completed'] += len(selected)
+                stats['skipped'] += len(page) - len(selected)
+                stats.update(f"type:{doc.get('media_type')}" for doc in selected)
+            else:
+                progress.open_page(cursor, len(selected), len(page) - len(selected))
+                for doc in selected:
+                    slots.acquire()
+                    media_type: str = doc.get('media_type') or ''
+                    future: Future = executor.submit(reprocess, doc, limiter)
+                    future.add_done_callback(lambda f, c=cursor, t=media_type: on_done(f, c, t))
+            submitted += len(selected)
+
+            if not more:
+                break
+        executor.shutdown(wait=True)
+    except KeyboardInterrupt:
+        logger.warning("Interrumpido: esperando las tareas en curso; el checkpoint queda en la última página completa")
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    summary: Dict[str, Any] = {
+        "dry_run": args.dry_run,
+        "checkpoint": None if args.dry_run else progress.cursor,
+        "elapsed_s": round(time.monotonic() - progress.started, 2),
+        "per_second": round(progress.rate(), 2),
+        **dict(stats)
+    }
+    print(json.dumps(summary, indent=2))
+    return 0 if not stats['failed'] else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,386 @@
+# file: /tools/webhook_replay.py
+"""
+Generador de carga y reproductor de webhooks de WhatsApp y envíos push de Pub/Sub.
+
+Toma cuerpos JSON capturados (webhooks de Meta o cargas de Pub/Sub), reescribe
+teléfonos e IDs de mensaje para que cada petición sea única y los envía contra una
+instancia en ejecución, ya sea en lazo abierto (tasa objetivo, con perfiles por
+fases) o en lazo cerrado (concurrencia fija).
+
+Las latencias se miden desde el instante en que la petición *debía* enviarse, no
+desde que realmente salió, de modo que las colas dentro del generador cuentan como
+latencia (corrección de coordinated omission).
+
+Ejemplos:
+    python -m tools.webhook_replay captures/ --url http://localhost:3000 --profile 20x30s,50x30s,100x30s
+    python -m tools.webhook_replay captures/ --target pubsub --concurrency 16 --duration 60
+"""
+
+import argparse
+import base64
+import copy
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+from tools.histogram import LatencyHistogram
+
+WEBHOOK_PATH: str = "/chatbot/whatsapp/"
+PUBSUB_PATH: str = "/chatbot/pubsub/"
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(phone|message_id|timestamp|seq)\s*\}\}")
+
+@dataclass
+class Phase:
+    """Fase de un perfil de carga: ``rate`` peticiones/s durante ``duration`` segundos."""
+    rate: float
+    duration: float
+
+@dataclass
+class PhaseResult:
+    phase: Phase
+    histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    sent: int = 0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, status: str, latency_us: int, expected_interval_us: Optional[int] = None) -> None:
+        self.histogram.record(latency_us, expected_interval_us)
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+def parse_profile(spec: str) -> List[Phase]:
+    """
+    Interpreta un perfil de carga como ``20x30s,200x5s,20x30s``.
+
+    Cada fase es ``<tasa>x<duración>``; la duración acepta los sufijos ``s``, ``m`` y ``ms``.
+    """
+    phases: List[Phase] = []
+    for chunk in spec.split(","):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        match = re.fullmatch(r"([\d.]+)x([\d.]+)(ms|s|m)?", chunk)
+        if not match:
+            raise ValueError(f"Fase de perfil inválida: {chunk!r}")
+        rate: float = float(match.group(1))
+        duration: float = float(match.group(2))
+        unit: str = match.group(3) or "s"
+        duration = duration / 1000.0 if unit == "ms" else duration * 60 if unit == "m" else duration
+        phases.append(Phase(rate=rate, duration=duration))
+    if not phases:
+        raise ValueError("El perfil de carga está vacío")
+    return phases
+
+def load_captures(paths: List[str]) -> List[str]:
+    """
+    Carga cuerpos capturados desde archivos ``.json``, ``.ndjson``/``.jsonl`` o directorios.
+
+    Returns:
+        List[str]: Cuerpos en texto, aún sin reemplazar los marcadores ``{{...}}``
+    """
+    bodies: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            children: List[str] = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.endswith((".json", ".ndjson", ".jsonl"))
+            )
+            bodies.extend(load_captures(children))
+            continue
+        with open(path, "r", encoding="utf-8") as file:
+            if path.endswith((".ndjson", ".jsonl")):
+                bodies.extend(line for line in (raw.strip() for raw in file) if line)
+            else:
+                bodies.append(file.read())
+    return bodies
+
+class PayloadFactory:
+    """
+    Produce cuerpos únicos a partir de las capturas.
+
+    Reemplaza los marcadores ``{{phone}}``, ``{{message_id}}``, ``{{timestamp}}`` y
+    ``{{seq}}`` y, salvo que se desactive, reescribe también los campos ``from``,
+    ``id``, ``timestamp`` y ``wa_id`` de cada mensaje para no colisionar con
+    documentos ya existentes en Firestore.
+    """
+
+    def __init__(self, bodies: List[str], target: str, phones: List[str], rewrite: bool = True):
+        if not bodies:
+            raise ValueError("No se encontraron cuerpos capturados")
+        self.bodies: List[str] = bodies
+        self.target: str = target
+        self.phones: List[str] = phones
+        self.rewrite: bool = rewrite
+        self._seq: Iterator[int] = itertools.count()
+        self._lock: threading.Lock = threading.Lock()
+
+    def next_payload(self) -> bytes:
+        with self._lock:
+            seq: int = next(self._seq)
+        template: str = self.bodies[seq % len(self.bodies)]
+        phone: str = self.phones[seq % len(self.phones)] if self.phones else ""
+        message_id: str = f"wamid.LOADTEST.{uuid.uuid4().hex}"
+        timestamp: str = str(int(time.time()))
+        values: Dict[str, str] = {
+            "phone": phone,
+            "message_id": message_id,
+            "timestamp": timestamp,
+            "seq": str(seq),
+        }
+        text: str = PLACEHOLDER_PATTERN.sub(lambda match: values[match.group(1)], template)
+        data: Dict[str, Any] = json.loads(text)
+
+        if self.target == "pubsub":
+            data = self._as_pubsub_data(data)
+            if self.rewrite:
+                self._rewrite_value(data.get("value", {}), phone, message_id, timestamp)
+                message: Dict[str, Any] = data.get("message") or {}
+                if phone:
+                    message["from"] = phone
+                message["id"] = message_id
+            return json.dumps(self._envelope(data, seq)).encode("utf-8")
+
+        if self.rewrite:
+            for entry in data.get("entry", []):
+                for change in entry.get("changes", []):
+                    self._rewrite_value(change.get("value", {}), phone, message_id, timestamp)
+        return json.dumps(data).encode("utf-8")
+
+    @staticmethod
+    def _rewrite_value(value: Dict[str, Any], phone: str, message_id: str, timestamp: str) -> None:
+        for index, message in enumerate(value.get("messages", [])):
+            message["id"] = message_id if index == 0 else f"{message_id}.{index}"
+            message["timestamp"] = timestamp
+            if phone:
+                message["from"] = phone
+        if phone:
+            for contact in value.get("contacts", []):
+                contact["wa_id"] = phone
+
+    @staticmethod
+    def _as_pubsub_data(data: Dict[str, Any]) -> Dict[str, Any]:
+        """Normaliza una captura a la carga que publica ``handle_authenticated``."""
+        message: Any = data.get("message")
+        if isinstance(message, dict) and "data" in message:
+            # Es un sobre push completo: decodificar la carga original
+            return json.loads(base64.b64decode(message["data"]).decode("utf-8"))
+        if "entry" in data:
+            # Es un webhook de Meta: construir la carga igual que webhook()
+            value: Dict[str, Any] = copy.deepcopy(data["entry"][0]["changes"][0].get("value", {}))
+            first: Dict[str, Any] = (value.get("messages") or [{}])[0]
+            message_type: str = first.get("type", "")
+            content: Dict[str, Any] = first.get(message_type, {}) if isinstance(first.get(message_type), dict) else {}
+            return {
+                "message": {
+                    "id": first.get("id"),
+                    "from": first.get("from"),
+                    "type": message_type,
+                    "caption": content.get("body") or content.get("caption", ""),
+                    "media_id": content.get("id", ""),
+                },
+                "value": value,
+                "phone_business_id": value.get("metadata", {}).get("phone_number_id"),
+            }
+        return data
+
+    @staticmethod
+    def _envelope(data: Dict[str, Any], seq: int) -> Dict[str, Any]:
+        return {
+            "message": {
+                "data": base64.b64encode(json.dumps(data).encode("utf-8")).decode("ascii"),
+                "messageId": f"loadtest-{seq}",
+                "publishTime": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                "attributes": {"source": "webhook_replay"},
+            },
+            "subscription": "projects/loadtest/subscriptions/webhook-replay",
+            "deliveryAttempt": 1,
+        }
+
+class Replayer:
+    def __init__(self, url: str, factory: PayloadFactory, timeout: float, workers: int):
+        self.url: str = url
+        self.factory: PayloadFactory = factory
+        self.timeout: float = timeout
+        self.workers: int = workers
+        self._local: threading.local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session: Optional[requests.Session] = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def _send(self) -> str:
+        body: bytes = self.factory.next_payload()
+        try:
+            response: requests.Response = self._session().post(
+                self.url, data=body, headers={"Content-Type": "application/json"}, timeout=self.timeout
+            )
+            return str(response.status_code)
+        except requests.Timeout:
+            return "timeout"
+        except requests.RequestException as e:
+            return type(e).__name__
+
+    def _fire(self, result: PhaseResult, intended_at: float) -> None:
+        status: str = self._send()
+        result.add(status, int((time.perf_counter() - intended_at) * 1_000_000))
+
+    def run_open_loop(self, phases: List[Phase], poisson: bool) -> List[PhaseResult]:
+        """
+        Lazo abierto: las llegadas se programan de antemano y no esperan a las respuestas.
+
+        Si el servidor se satura, las peticiones se acumulan en el pool y su espera
+        se contabiliza porque la latencia se mide desde el instante programado.
+        """
+        results: List[PhaseResult] = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="replay") as executor:
+            for phase in phases:
+                result: PhaseResult = PhaseResult(phase=phase)
+                results.append(result)
+                result.started_at = time.perf_counter()
+                end: float = result.started_at + phase.duration
+                intended: float = result.started_at
+                futures = []
+                while phase.rate > 0:
+                    gap: float = random.expovariate(phase.rate) if poisson else 1.0 / phase.rate
+                    intended += gap
+                    if intended >= end:
+                        break
+                    delay: float = intended - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    futures.append(executor.submit(self._fire, result, intended))
+                    result.sent += 1
+                if phase.rate <= 0:
+                    time.sleep(phase.duration)
+                for future in futures:
+                    future.result()
+                result.finished_at = time.perf_counter()
+        return results
+
+    def run_closed_loop(self, concurrency: int, duration: float, expected_interval_ms: Optional[float]) -> PhaseResult:
+        """
+        Lazo cerrado: ``concurrency`` clientes envían en cuanto reciben respuesta.
+
+        Con ``expected_interval_ms`` se aplica la corrección de coordinated omission
+        de HdrHistogram a cada muestra.
+        """
+        result: PhaseResult = PhaseResult(phase=Phase(rate=0, duration=duration))
+        expected_us: Optional[int] = int(expected_interval_ms * 1000) if expected_interval_ms else None
+        result.started_at = time.perf_counter()
+        end: float = result.started_at + duration
+        sent_lock: threading.Lock = threading.Lock()
+
+        def client() -> None:
+            while time.perf_counter() < end:
+                started: float = time.perf_counter()
+                status: str = self._send()
+                result.add(status, int((time.perf_counter() - started) * 1_000_000), expected_us)
+                with sent_lock:
+                    result.sent += 1
+
+        threads: List[threading.Thread] = [
+            threading.Thread(target=client, name=f"replay-{index}", daemon=True) for index in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result.finished_at = time.perf_counter()
+        return result
+
+def build_phones(spec: Optional[str]) -> List[str]:
+    """Convierte ``573000000000:100`` en 100 teléfonos consecutivos; vacío conserva los capturados."""
+    if not spec:
+        return []
+    base, _, count = spec.partition(":")
+    return [str(int(base) + offset) for offset in range(int(count or 1))]
+
+def report(results: List[PhaseResult], histogram_out: Optional[str]) -> Dict[str, Any]:
+    total: LatencyHistogram = LatencyHistogram()
+    phases: List[Dict[str, Any]] = []
+    for index, result in enumerate(results):
+        total.merge(result.histogram)
+        elapsed: float = max(result.finished_at - result.started_at, 1e-9)
+        ok: int = sum(count for status, count in result.statuses.items() if status.startswith("2"))
+        phases.append({
+            "phase": index,
+            "target_rate": result.phase.rate or None,
+            "duration_s": round(elapsed, 3),
+            "sent": result.sent,
+            "achieved_rate": round(result.sent / elapsed, 2),
+            "success_rate": round(ok / result.sent, 4) if result.sent else 0.0,
+            "statuses": result.statuses,
+            "latency": result.histogram.summary(),
+        })
+    summary: Dict[str, Any] = {"phases": phases, "overall": total.summary((50, 90, 99, 99.9, 99.99))}
+
+    if histogram_out:
+        with open(histogram_out, "w", encoding="utf-8") as file:
+            file.write("value_ms\tcount\tpercentile\n")
+            for value_us, count, percentile in total.iter_distribution():
+                file.write(f"{value_us / 1000.0:.3f}\t{count}\t{percentile:.4f}\n")
+    return summary
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reproduce webhooks capturados contra una instancia en ejecución.")
+    parser.add_argument("captures", nargs="+", help="Archivos .json/.ndjson o directorios con cuerpos capturados")
+    parser.add_argument("--url", default="http://localhost:3000", help="URL base de la instancia")
+    parser.add_argument("--target", choices=["webhook", "pubsub"], default="webhook",
+                        help="webhook -> /chatbot/whatsapp/, pubsub -> /chatbot/pubsub/ (sobre push)")
+    parser.add_argument("--phones", help="Rango de teléfonos '<base>:<cantidad>' para distribuir la carga")
+    parser.add_argument("--no-rewrite", action="store_true", help="No reescribir IDs/teléfonos, solo marcadores {{...}}")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rate", type=float, help="Lazo abierto a tasa constante (peticiones/s)")
+    mode.add_argument("--profile", help="Lazo abierto por fases, p. ej. '20x30s,200x10s,20x30s'")
+    mode.add_argument("--concurrency", type=int, help="Lazo cerrado con N clientes concurrentes")
+    parser.add_argument("--duration", type=float, default=30.0, help="Duración en segundos para --rate/--concurrency")
+    parser.add_argument("--poisson", action="store_true", help="Llegadas con distribución de Poisson en lazo abierto")
+    parser.add_argument("--expected-interval-ms", type=float,
+                        help="Intervalo esperado para corregir coordinated omission en lazo cerrado")
+    parser.add_argument("--workers", type=int, default=256, help="Máximo de peticiones en vuelo en lazo abierto")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout por petición en segundos")
+    parser.add_argument("--histogram-out", help="Ruta para volcar la distribución completa de latencias")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+    path: str = PUBSUB_PATH if args.target == "pubsub" else WEBHOOK_PATH
+    url: str = args.url.rstrip("/") + path
+    factory: PayloadFactory = PayloadFactory(
+        load_captures(args.captures), args.target, build_phones(args.phones), rewrite=not args.no_rewrite
+    )
+    replayer: Replayer = Replayer(url, factory, timeout=args.timeout, workers=args.workers)
+
+    results: List[PhaseResult]
+    if args.concurrency:
+        results = [replayer.run_closed_loop(args.concurrency, args.duration, args.expected_interval_ms)]
+    else:
+        phases: List[Phase] = parse_profile(args.profile) if args.profile else [Phase(args.rate or 10.0, args.duration)]
+        results = replayer.run_open_loop(phases, poisson=args.poisson)
+
+    print(json.dumps(report(results, args.histogram_out), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())